@@ -0,0 +1,13 @@
+# /home/siisi/atmp/benchmarks/__init__.py
+"""
+HTTP benchmarks for the praevia_app hot paths (incident list/detail, the
+dossier API, dashboards, document download).
+
+Run through the management command:
+
+    python manage.py benchmark --sizes 1000,10000 --requests 50 --output before.json
+    python manage.py benchmark --sizes 1000,10000 --requests 50 --output after.json
+    python manage.py benchmark --compare before.json after.json
+
+See praevia_app/management/commands/benchmark.py for every option.
+"""
@@ -0,0 +1,99 @@
+# /home/siisi/atmp/benchmarks/concurrency.py
+
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+from django.db import close_old_connections, connection
+
+from benchmarks.report import percentile
+from praevia_app.models import Audit, AuditDecision, AuditStatus, Contentieux, DossierATMP, DossierStatus
+from praevia_app.services import AuditFinalizationService
+
+
+FINALIZE_TITLE = 'Benchmark finalize'
+
+
+def _pending_audit(user):
+    dossier = DossierATMP.objects.create(
+        title=FINALIZE_TITLE, description='-', date_of_incident=date.today(), location='Benchmark',
+        status=DossierStatus.ANALYSE_EN_COURS, created_by=user, safety_manager=user,
+    )
+    return Audit.objects.create(dossier_atmp=dossier, auditor=user, status=AuditStatus.IN_PROGRESS)
+
+
+def _submit(audit, user, key, barrier, results):
+    """One client: waits for the others, then finalizes `audit`."""
+    close_old_connections()
+    try:
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            status_code, _, replayed = AuditFinalizationService.finalize(
+                audit.pk, AuditDecision.CONTEST, 'Benchmark', user, idempotency_key=key,
+            )
+            outcome = f"{status_code}{' replayed' if replayed else ''}"
+        except Exception as e:
+            outcome = type(e).__name__
+        results.append((outcome, time.perf_counter() - started))
+    finally:
+        connection.close()
+
+
+def run_finalize(user, submissions, rounds, idempotency_key):
+    """
+    `rounds` times: a fresh pending audit is finalized (decision CONTEST)
+    by `submissions` threads released together, each with its own database
+    connection, as a double-clicking user or a retrying client would.
+    With `idempotency_key` every thread sends the same key.
+
+    Each round must end with exactly one contentieux and one non-replayed
+    200; the other submissions get the replayed response (with a key) or
+    "already completed" (400). Anything else is counted as an anomaly.
+    """
+    outcomes, latencies, anomalies, audits = Counter(), [], 0, []
+    try:
+        for _ in range(rounds):
+            audit = _pending_audit(user)
+            audits.append(audit)
+            key = f"benchmark-{audit.pk}" if idempotency_key else None
+            barrier = threading.Barrier(submissions)
+            results = []
+            threads = [
+                threading.Thread(target=_submit, args=(audit, user, key, barrier, results))
+                for _ in range(submissions)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            round_outcomes = Counter(outcome for outcome, _ in results)
+            outcomes.update(round_outcomes)
+            latencies.extend(latency * 1000 for _, latency in results)
+            created = Contentieux.objects.filter(dossier_atmp_id=audit.dossier_atmp_id).count()
+            unexpected = set(round_outcomes) - {'200', '200 replayed', '400'}
+            if created != 1 or round_outcomes['200'] != 1 or unexpected:
+                anomalies += 1
+    finally:
+        DossierATMP.objects.filter(pk__in=[audit.dossier_atmp_id for audit in audits]).delete()
+
+    latencies.sort()
+    return {
+        'scenario': 'audit-finalize',
+        'database': connection.vendor,
+        'submissions': submissions,
+        'rounds': rounds,
+        'idempotency_key': idempotency_key,
+        'outcomes': dict(outcomes),
+        'anomalies': anomalies,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'max': round(latencies[-1], 3),
+        },
+    }
@@ -0,0 +1,140 @@
+# /home/siisi/atmp/benchmarks/plans.py
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Count
+
+from benchmarks.report import percentile
+from praevia_app.models import (
+    OPEN_CONTENTIEUX_STATUSES, OPEN_DOSSIER_STATUSES,
+    Audit, Contentieux, Document, DossierATMP,
+)
+
+
+# Models whose Meta.indexes are dropped for the "without indexes" runs
+INDEXED_MODELS = (DossierATMP, Contentieux, Audit, Document)
+
+RECENT = ('-created_at', '-id')
+PAGE = 20
+
+
+class PlanQuery:
+    """
+    One ORM query of a list or dashboard, as the views build it. `build`
+    returns the queryset from the ids of plan_fixtures().
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+
+def _group_by(model, field):
+    return model.objects.values(field).annotate(count=Count('id')).order_by()
+
+
+PLAN_QUERIES = [
+    # Role-scoped lists (employee, safety manager, everyone else), first page
+    PlanQuery('dossiers-recent', lambda ids: DossierATMP.objects.order_by(*RECENT)[:PAGE]),
+    PlanQuery('dossiers-by-creator', lambda ids: DossierATMP.objects.filter(created_by_id=ids['creator']).order_by(*RECENT)[:PAGE]),
+    PlanQuery('dossiers-by-manager', lambda ids: DossierATMP.objects.filter(safety_manager_id=ids['manager']).order_by(*RECENT)[:PAGE]),
+    PlanQuery('dossiers-open', lambda ids: DossierATMP.objects.filter(status__in=OPEN_DOSSIER_STATUSES).order_by(*RECENT)[:PAGE]),
+    PlanQuery('contentieux-open', lambda ids: Contentieux.objects.filter(status__in=OPEN_CONTENTIEUX_STATUSES).order_by(*RECENT)[:PAGE]),
+    PlanQuery('audits-by-auditor', lambda ids: Audit.objects.filter(auditor_id=ids['manager']).order_by(*RECENT)[:PAGE]),
+    PlanQuery('documents-by-uploader', lambda ids: Document.objects.filter(uploaded_by_id=ids['uploader']).order_by(*RECENT)[:PAGE]),
+    # GROUP BYs of rebuild_dashboard_snapshot
+    PlanQuery('dossiers-by-status', lambda ids: _group_by(DossierATMP, 'status')),
+    PlanQuery('dossiers-by-location', lambda ids: _group_by(DossierATMP, 'location')),
+    PlanQuery('contentieux-by-status', lambda ids: _group_by(Contentieux, 'status')),
+    PlanQuery('audits-by-decision', lambda ids: _group_by(Audit, 'decision')),
+]
+
+
+def select_plan_queries(names=None):
+    if not names:
+        return PLAN_QUERIES
+    unknown = set(names) - {query.name for query in PLAN_QUERIES}
+    if unknown:
+        raise ValueError(f"Unknown plan query(ies): {', '.join(sorted(unknown))}")
+    return [query for query in PLAN_QUERIES if query.name in names]
+
+
+def plan_fixtures():
+    """The creator, safety manager and uploader the scoped queries filter on."""
+    dossier = DossierATMP.objects.exclude(safety_manager=None).order_by(*RECENT).first()
+    document = Document.objects.order_by(*RECENT).first()
+    if dossier is None:
+        raise ValueError("There are no dossiers to benchmark: pass --sizes or run seed_bulk first.")
+    return {
+        'creator': dossier.created_by_id,
+        'manager': dossier.safety_manager_id,
+        'uploader': document.uploaded_by_id if document else dossier.created_by_id,
+    }
+
+
+# ─── Indexes ──────────────────────────────────────────────────────
+
+def analyze():
+    """Refreshes the planner statistics, so both runs are planned from current data."""
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+@contextmanager
+def indexes_removed(models=INDEXED_MODELS):
+    """
+    Drops the Meta.indexes of `models` for the duration of the block (the
+    "before" side of the comparison) and creates them again on exit, even
+    if the block fails. Field-level indexes (FKs, unique, db_index) stay.
+    """
+    removed = []
+    try:
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+                    removed.append((model, index))
+        analyze()
+        yield [index.name for _, index in removed]
+    finally:
+        with connection.schema_editor() as editor:
+            for model, index in removed:
+                editor.add_index(model, index)
+        analyze()
+
+
+# ─── Measurement ──────────────────────────────────────────────────
+
+def explain(queryset):
+    return queryset.explain().splitlines()
+
+
+def measure_plan(query, ids, runs, warmup=2):
+    """EXPLAIN of the query, then `runs` timed evaluations (after `warmup` unmeasured ones)."""
+    queryset = query.build(ids)
+    for _ in range(warmup):
+        list(queryset.all())
+
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = len(list(queryset.all()))
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    return {
+        'query': query.name,
+        'sql': str(queryset.query),
+        'plan': explain(queryset),
+        'rows': rows,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'min': round(latencies[0], 3),
+            'max': round(latencies[-1], 3),
+        },
+    }
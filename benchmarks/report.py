@@ -0,0 +1,160 @@
+# /home/siisi/atmp/benchmarks/report.py
+
+import json
+import platform
+import statistics
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.db import connection
+
+
+# Metrics shown by compare(); a higher value is worse for all of them
+COMPARED_METRICS = (
+    ('latency_ms', 'p50'),
+    ('latency_ms', 'p95'),
+    ('latency_ms', 'p99'),
+    ('queries', 'mean'),
+    ('bytes', 'mean'),
+    ('peak_rss_kb', None),
+)
+
+
+def percentile(sorted_values, percent):
+    """Linear interpolation between closest ranks (same as numpy's default)."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(scenario, mode, dataset, run):
+    """Turns the raw samples of benchmarks.runner.run_scenario into one result row."""
+    samples = run['samples']
+    latencies = sorted(sample['latency'] * 1000 for sample in samples)
+    sizes = [sample['bytes'] for sample in samples]
+    queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+
+    return {
+        'scenario': scenario.name,
+        'mode': mode,
+        'dataset': dataset,
+        'requests': len(samples),
+        'status': dict(Counter(str(sample['status']) for sample in samples)),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'min': round(latencies[0], 3),
+            'max': round(latencies[-1], 3),
+        },
+        'throughput_rps': round(len(samples) / run['elapsed'], 2) if run['elapsed'] else None,
+        'queries': {
+            'mean': round(statistics.fmean(queries), 2),
+            'max': max(queries),
+        } if queries else None,
+        'bytes': {
+            'mean': round(statistics.fmean(sizes)),
+            'max': max(sizes),
+        },
+        'peak_rss_kb': run['peak_rss_kb'],
+        'peak_rss_scope': run['peak_rss_scope'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(options):
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'database': connection.vendor,
+        'debug': settings.DEBUG,
+        'requests': options['requests'],
+        'warmup': options['warmup'],
+        'seed': options['seed'],
+    }
+
+
+def load(path):
+    with open(path) as report:
+        return json.load(report)
+
+
+def _metric(result, metric, stat):
+    value = result.get(metric)
+    if stat is not None:
+        value = (value or {}).get(stat)
+    return value
+
+
+def compare(baseline, candidate, threshold=None):
+    """
+    Matches the results of two reports on (scenario, mode, dataset).
+    Returns (rows, regressions): one row per metric with both values and
+    the relative change, and the rows whose change exceeds `threshold`
+    percent (latency, memory) or whose query count went up at all.
+    """
+    key = lambda result: (result['scenario'], result['mode'], result['dataset'])
+    before = {key(result): result for result in baseline['results']}
+    rows, regressions = [], []
+
+    for result in candidate['results']:
+        previous = before.get(key(result))
+        if previous is None:
+            continue
+        for metric, stat in COMPARED_METRICS:
+            old, new = _metric(previous, metric, stat), _metric(result, metric, stat)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else (0.0 if new == old else None)
+            row = {
+                'scenario': result['scenario'],
+                'mode': result['mode'],
+                'dataset': result['dataset'],
+                'metric': f"{metric}.{stat}" if stat else metric,
+                'baseline': old,
+                'candidate': new,
+                'change_pct': round(change, 1) if change is not None else None,
+            }
+            rows.append(row)
+
+            if metric == 'queries':
+                regressed = new > old
+            elif threshold is None or metric == 'bytes':
+                regressed = False
+            else:
+                regressed = change is None or change > threshold
+            if regressed:
+                regressions.append(row)
+
+    return rows, regressions
+
+
+def format_comparison(rows):
+    header = f"{'scenario':<28} {'mode':<8} {'dataset':>8} {'metric':<16} {'baseline':>12} {'candidate':>12} {'change':>8}"
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        change = '' if row['change_pct'] is None else f"{row['change_pct']:+.1f}%"
+        lines.append(
+            f"{row['scenario']:<28} {row['mode']:<8} {str(row['dataset']):>8} {row['metric']:<16} "
+            f"{row['baseline']:>12} {row['candidate']:>12} {change:>8}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,224 @@
+# /home/siisi/atmp/benchmarks/runner.py
+
+import http.client
+import os
+import re
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.test import Client, override_settings
+
+from praevia_app.middleware import QueryRecorder
+
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries')
+
+
+# ─── Memory ───────────────────────────────────────────────────────
+
+def reset_peak_rss(pid='self'):
+    """
+    Resets the kernel's peak RSS counter (VmHWM) of a process, so the
+    next reading covers one scenario only. Linux-only; no-op elsewhere.
+    """
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb(pid='self'):
+    """Peak resident set size of a process, in KiB."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid != 'self':
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+
+# ─── Drivers ──────────────────────────────────────────────────────
+
+class ClientDriver:
+    """
+    Requests go through django.test.Client, in this process: no network,
+    no WSGI server, just the middleware/view/template stack. Query counts
+    come from a QueryRecorder around each request.
+    """
+    mode = 'client'
+
+    def __init__(self, user):
+        # Test client requests use the 'testserver' host
+        self.settings = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+        self.settings.enable()
+        self.client = Client()
+        self.client.force_login(user)
+
+    def request(self, path, params):
+        with QueryRecorder() as recorder:
+            response = self.client.get(path, params)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+        if hasattr(response, 'close'):
+            response.close()
+        return response.status_code, size, recorder.count
+
+    def reset_peak_rss(self):
+        return reset_peak_rss()
+
+    def peak_rss_kb(self):
+        return peak_rss_kb()
+
+    def close(self):
+        self.settings.disable()
+
+
+class GunicornDriver:
+    """
+    Requests go over HTTP to a local gunicorn (one sync worker) started
+    on a free port with the current settings. Query counts are read from
+    the Server-Timing header, so the server runs with QUERY_INSTRUMENTATION.
+    """
+    mode = 'gunicorn'
+
+    def __init__(self, user, workers=1, startup_timeout=30):
+        if shutil.which('gunicorn') is None:
+            raise RuntimeError("gunicorn is not installed (pip install gunicorn).")
+
+        # Log in through the session table shared with the server
+        client = Client()
+        client.force_login(user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'praevia_project.settings'),
+            'QUERY_INSTRUMENTATION': 'true',
+            # The benchmark's own (temporary) media, where the downloaded document is
+            'MEDIA_ROOT': str(settings.MEDIA_ROOT),
+        }
+        self.process = subprocess.Popen(
+            [
+                'gunicorn', 'praevia_project.wsgi:application',
+                '--bind', f'127.0.0.1:{self.port}',
+                '--workers', str(workers),
+                '--worker-class', 'sync',
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.wait_until_ready(startup_timeout)
+
+    def wait_until_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {self.process.returncode}.")
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f"gunicorn did not start within {timeout}s.")
+
+    def request(self, path, params):
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request('GET', path, headers={'Cookie': self.cookie, 'Host': 'localhost'})
+            response = connection.getresponse()
+            size = len(response.read())
+            match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing') or '')
+            return response.status, size, int(match.group(1)) if match else None
+        finally:
+            connection.close()
+
+    def worker_pids(self):
+        try:
+            with open(f'/proc/{self.process.pid}/task/{self.process.pid}/children') as children:
+                return [int(pid) for pid in children.read().split()]
+        except OSError:
+            return []
+
+    def reset_peak_rss(self):
+        pids = self.worker_pids()
+        return bool(pids) and all(reset_peak_rss(pid) for pid in pids)
+
+    def peak_rss_kb(self):
+        readings = [peak_rss_kb(pid) for pid in self.worker_pids()]
+        readings = [reading for reading in readings if reading is not None]
+        return max(readings) if readings else None
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+DRIVERS = {
+    ClientDriver.mode: ClientDriver,
+    GunicornDriver.mode: GunicornDriver,
+}
+
+
+# ─── Measurement ──────────────────────────────────────────────────
+
+def run_scenario(driver, path, params, requests, warmup):
+    """
+    Requests `path` `warmup` times (discarded: template, cache and
+    connection warm-up), then `requests` times, timing each one.
+    Returns the raw samples.
+    """
+    for _ in range(warmup):
+        driver.request(path, params)
+
+    rss_reset = driver.reset_peak_rss()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        status, size, queries = driver.request(path, params)
+        samples.append({
+            'latency': time.perf_counter() - request_started,
+            'status': status,
+            'bytes': size,
+            'queries': queries,
+        })
+    elapsed = time.perf_counter() - started
+
+    return {
+        'samples': samples,
+        'elapsed': elapsed,
+        'peak_rss_kb': driver.peak_rss_kb(),
+        # Without a reset, the peak may come from an earlier scenario
+        'peak_rss_scope': 'scenario' if rss_reset else 'process',
+    }
@@ -0,0 +1,127 @@
+# /home/siisi/atmp/benchmarks/scenarios.py
+
+import tempfile
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.urls import reverse
+
+from praevia_app.models import DossierATMP, Document, StoredBlob
+from users.models import CustomUser as User, UserRole
+
+
+BENCHMARK_USER_EMAIL = 'benchmark@benchmarks.local'
+DOWNLOAD_DOCUMENT_NAME = 'benchmark-download.bin'
+
+
+class Scenario:
+    """
+    One endpoint to benchmark. `target` picks the object a detail route
+    needs (called once per run, after the dataset is in place).
+    """
+
+    def __init__(self, name, url_name, params=None, target=None):
+        self.name = name
+        self.url_name = url_name
+        self.params = params or {}
+        self.target = target
+
+    def url(self, fixtures):
+        args = [self.target(fixtures)] if self.target else []
+        return reverse(f'praevia_app:{self.url_name}', args=args)
+
+
+def latest_dossier(fixtures):
+    return fixtures['dossier'].pk
+
+
+def download_document(fixtures):
+    return fixtures['document'].pk
+
+
+SCENARIOS = [
+    Scenario('incident-list', 'incident-list'),
+    Scenario('incident-list-page-50', 'incident-list', params={'page': 50}),
+    Scenario('incident-detail', 'incident-detail', target=latest_dossier),
+    Scenario('api-dossier-list', 'dossier-list'),
+    Scenario('api-dossier-list-cursor', 'dossier-list', params={'pagination': 'cursor', 'count': 'false'}),
+    Scenario('api-dossier-list-expanded', 'dossier-list', params={'expand': 'audit,contentieux,documents'}),
+    Scenario('api-dossier-detail', 'dossier-detail', target=latest_dossier),
+    Scenario('dashboard', 'dashboard'),
+    Scenario('dashboard-juridique', 'dashboard-juridique'),
+    Scenario('dashboard-rh', 'dashboard-rh'),
+    Scenario('dashboard-qse', 'dashboard-qse'),
+    Scenario('dashboard-direction', 'dashboard-direction'),
+    Scenario('api-dashboard-direction', 'direction_dashboard_data'),
+    Scenario('api-document-download', 'document-download', target=download_document),
+]
+
+
+def select_scenarios(names=None):
+    if not names:
+        return SCENARIOS
+    unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return [scenario for scenario in SCENARIOS if scenario.name in names]
+
+
+@contextmanager
+def benchmark_fixtures(download_size):
+    """
+    The objects the scenarios need (see setup_fixtures), for the duration
+    of the block. Files are written under a temporary MEDIA_ROOT, and the
+    document, its blob row and the benchmark user (when this run created
+    it) are deleted afterwards: the configured database and media are left
+    as they were.
+    """
+    with tempfile.TemporaryDirectory(prefix='praevia-benchmark-') as media_root, override_settings(MEDIA_ROOT=media_root):
+        fixtures = setup_fixtures(download_size)
+        try:
+            yield fixtures
+        finally:
+            teardown_fixtures(fixtures)
+
+
+def setup_fixtures(download_size):
+    """
+    Returns the objects the scenarios need: a superuser to log in with
+    (every view and queryset is open to it), the most recent dossier and a
+    document with a `download_size` bytes file.
+    """
+    dossier = DossierATMP.objects.order_by('-created_at').first()
+    if dossier is None:
+        raise ValueError("There are no dossiers to benchmark: pass --sizes or run seed_bulk first.")
+
+    user, created = User.objects.get_or_create(
+        email=BENCHMARK_USER_EMAIL,
+        defaults={
+            'name': 'Benchmark',
+            'role': UserRole.ADMIN,
+            'is_staff': True,
+            'is_superuser': True,
+            'is_seeded': True,
+        },
+    )
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+
+    document = Document(uploaded_by=user, original_name=DOWNLOAD_DOCUMENT_NAME, mime_type='application/octet-stream')
+    # Deterministic, incompressible-enough payload
+    payload = bytes(range(256)) * (download_size // 256) + bytes(download_size % 256)
+    document.file.save(DOWNLOAD_DOCUMENT_NAME, ContentFile(payload), save=False)
+    document.save()
+    dossier.documents.add(document)
+
+    return {'user': user, 'user_created': created, 'dossier': dossier, 'document': document}
+
+
+def teardown_fixtures(fixtures):
+    document = fixtures['document']
+    blob_id = document.blob_id
+    document.delete()
+    StoredBlob.objects.filter(pk=blob_id, ref_count=0).delete()
+    if fixtures['user_created']:
+        fixtures['user'].delete()
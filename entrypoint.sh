@@ -4,6 +4,9 @@ set -e
 echo "Running migrations..."
 python manage.py migrate
 
+echo "Creating cache table (only used by the database cache backend)..."
+python manage.py createcachetable
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
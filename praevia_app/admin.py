@@ -1,12 +1,15 @@
 # /home/siisi/atmp/praevia_app/admin.py
 
 from django.contrib import admin
+from django.utils import timezone
 
 from .models import (
     Action, Document, Contentieux, DossierATMP,
     Audit, AuditChecklistItem,
-    JuridictionStep, Temoin, Tiers
+    JuridictionStep, Temoin, Tiers, DashboardSnapshot,
+    OutboundEmail, OutboundEmailStatus, DocumentProcessingStatus, ReferenceCounter, IdempotencyKey, StoredBlob, UploadSession
 )
+from .search import search_dossiers
 
 
 # ───────────────────────────────
@@ -14,11 +17,25 @@ from .models import (
 # ───────────────────────────────
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('original_name', 'document_type', 'uploaded_by', 'contentieux', 'created_at')
-    list_filter = ('document_type', 'uploaded_by')
+    list_display = ('original_name', 'document_type', 'uploaded_by', 'contentieux', 'processing_status', 'created_at')
+    list_filter = ('document_type', 'processing_status', 'uploaded_by')
     search_fields = ('original_name', 'mime_type', 'description')
     ordering = ('-created_at',)
     raw_id_fields = ('uploaded_by', 'contentieux') # Use raw_id_fields for FK to improve admin performance with many users/contentieux
+    # Set from the uploaded file's content (blob) and by the process_documents worker
+    readonly_fields = (
+        'blob', 'processing_status', 'processing_attempts', 'processing_due_at', 'processing_error',
+        'processed_at', 'detected_mime_type', 'page_count', 'thumbnail',
+    )
+    actions = ['reprocess']
+
+    @admin.action(description='Analyze selected documents again')
+    def reprocess(self, request, queryset):
+        updated = queryset.exclude(file='').exclude(file__isnull=True).update(
+            processing_status=DocumentProcessingStatus.PENDING, processing_due_at=timezone.now(),
+            processing_attempts=0, processing_error=None,
+        )
+        self.message_user(request, f"{updated} document(s) queued for analysis.")
 
 # ───────────────────────────────
 # Contentieux Admin
@@ -43,6 +60,13 @@ class DossierATMPAdmin(admin.ModelAdmin):
     raw_id_fields = ('created_by', 'safety_manager')
     filter_horizontal = ('documents',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index (JSON contents included) instead of ILIKE on every search
+        # field; email addresses are not in the index and keep the search_fields lookup
+        if not search_term or '@' in search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return search_dossiers(queryset, search_term), False
+
 # ───────────────────────────────
 # Audit Admin
 # ───────────────────────────────
@@ -100,3 +124,75 @@ class TiersAdmin(admin.ModelAdmin):
     list_display = ('nom', 'dossier_atmp', 'assurance')
     search_fields = ('nom', 'adresse', 'assurance', 'immatriculation', 'dossier_atmp__reference')
     raw_id_fields = ('dossier_atmp',)
+
+# ───────────────────────────────
+# DashboardSnapshot Admin
+# ───────────────────────────────
+@admin.register(DashboardSnapshot)
+class DashboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('dimension', 'value', 'count', 'updated_at')
+    list_filter = ('dimension',)
+    search_fields = ('dimension', 'value')
+    readonly_fields = ('dimension', 'value', 'count', 'updated_at')
+
+# ───────────────────────────────
+# OutboundEmail Admin
+# ───────────────────────────────
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+    ordering = ('-created_at',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmailStatus.SENT).update(
+            status=OutboundEmailStatus.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} email(s) queued for retry.")
+
+
+# ───────────────────────────────
+# ReferenceCounter Admin
+# ───────────────────────────────
+@admin.register(ReferenceCounter)
+class ReferenceCounterAdmin(admin.ModelAdmin):
+    list_display = ('prefix', 'day', 'last_value')
+    list_filter = ('prefix',)
+    ordering = ('-day', 'prefix')
+    readonly_fields = ('prefix', 'day', 'last_value')
+
+
+# ───────────────────────────────
+# IdempotencyKey Admin
+# ───────────────────────────────
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at')
+    search_fields = ('key', 'user__email')
+    readonly_fields = ('user', 'key', 'fingerprint', 'status_code', 'response', 'created_at')
+
+
+# ───────────────────────────────
+# StoredBlob Admin
+# ───────────────────────────────
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'ref_count', 'created_at', 'updated_at')
+    search_fields = ('sha256',)
+    ordering = ('-created_at',)
+    readonly_fields = ('sha256', 'name', 'size', 'ref_count', 'created_at', 'updated_at')
+
+
+# ───────────────────────────────
+# UploadSession Admin
+# ───────────────────────────────
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'offset', 'length', 'updated_at')
+    search_fields = ('filename', 'user__email')
+    ordering = ('-updated_at',)
+    readonly_fields = ('id', 'user', 'filename', 'length', 'offset', 'created_at', 'updated_at')
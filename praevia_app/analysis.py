@@ -0,0 +1,261 @@
+# /home/siisi/atmp/praevia_app/analysis.py
+#
+# Content analysis of document files: real MIME type, page count, text and
+# a preview image. Pure functions of the file (standard library and Pillow,
+# no Django) so that they run in the worker processes of
+# `process_documents`; the results are written by processing.py.
+
+import html
+import io
+import logging
+import re
+import zipfile
+import zlib
+
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+
+# (offset, magic bytes, MIME type), tried in order on the first bytes of the file
+MAGIC_NUMBERS = [
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),  # .doc, .xls, .msg
+    (0, b'PK\x03\x04', 'application/zip'),
+]
+# Members identifying the office formats that are zip archives
+ZIP_FORMATS = [
+    ('word/document.xml', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ('xl/workbook.xml', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    ('ppt/presentation.xml', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+]
+IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/tiff', 'image/webp', 'image/bmp'}
+SNIFF_SIZE = 4096
+# Decompressed bytes kept per PDF stream and per zip member: a few KB can inflate to gigabytes
+MAX_INFLATED_SIZE = 16 * 1024 * 1024
+
+PDF_STREAM_RE = re.compile(rb'stream\r?\n')
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+PDF_COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+PDF_TEXT_BLOCK_RE = re.compile(rb'BT(.*?)ET', re.S)
+# Literal strings, one level of nested parentheses, shown with Tj, ' or " (or inside a TJ array)
+PDF_STRING_RE = re.compile(rb'\((?:\\.|[^\\()]|\([^()]*\))*\)', re.S)
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+XML_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def sniff_mime_type(head, zip_names=()):
+    """The MIME type of a file from its first bytes (and, for zip archives, its member names)."""
+    for offset, magic, mime_type in MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            if mime_type == 'application/zip':
+                if 'mimetype' in zip_names:
+                    return None  # OpenDocument: the archive says it, see analyze_file
+                for member, office_type in ZIP_FORMATS:
+                    if member in zip_names:
+                        return office_type
+            return mime_type
+    if b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut at the end of the sample is still text
+            if e.start >= len(head) - 3:
+                return 'text/plain'
+    return 'application/octet-stream'
+
+
+def clean_text(text, max_chars):
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)[:max_chars]
+
+
+def thumbnail_of(image, size):
+    """A JPEG of at most size × size pixels from a Pillow image."""
+    image.seek(0)
+    image.thumbnail((size, size))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue()
+
+
+# ─── PDF ──────────────────────────────────────────────────────────
+
+def pdf_streams(data):
+    """(dictionary, raw bytes) of every stream object of a PDF."""
+    for match in PDF_STREAM_RE.finditer(data):
+        if data[match.start() - 3:match.start()] == b'end':
+            continue
+        header_start = data.rfind(b' obj', 0, match.start())
+        end = data.find(b'endstream', match.end())
+        if header_start < 0 or end < 0:
+            continue
+        yield data[header_start:match.start()], data[match.end():end]
+
+
+def inflate(raw, limit):
+    """
+    The Flate-decoded `raw`, cut at `limit` bytes (None when it is not
+    valid zlib data). The output is bounded while decompressing: the rest
+    of a larger stream is never inflated.
+    """
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(raw, limit)
+    except zlib.error:
+        return None
+    if decompressor.unconsumed_tail:
+        logger.warning(f"PDF stream inflated past {limit} bytes, the rest is ignored")
+    return data
+
+
+def pdf_unescape(literal):
+    """The bytes of a PDF literal string, without its parentheses."""
+    body, output, i = literal[1:-1], bytearray(), 0
+    while i < len(body):
+        char = body[i:i + 1]
+        if char != b'\\':
+            output += char
+            i += 1
+            continue
+        following = body[i + 1:i + 2]
+        octal = re.match(rb'[0-7]{1,3}', body[i + 1:i + 4])
+        if octal:
+            output.append(int(octal.group(), 8) & 0xFF)
+            i += 1 + len(octal.group())
+        else:
+            output += PDF_ESCAPES.get(following, following if following not in (b'\r', b'\n') else b'')
+            i += 2
+    return bytes(output)
+
+
+def pdf_text(content_streams):
+    """
+    Text shown by the content streams, one line per BT … ET block. Only
+    literal strings in single-byte encodings are read: text drawn with
+    CID fonts (hex glyph ids) or only present as a scanned image is not.
+    """
+    lines = []
+    for content in content_streams:
+        for block in PDF_TEXT_BLOCK_RE.findall(content):
+            parts = [pdf_unescape(literal).decode('cp1252', errors='replace') for literal in PDF_STRING_RE.findall(block)]
+            line = ''.join(parts)
+            # Mostly control characters: glyph ids of an embedded subset font, not text
+            if line and sum(char.isprintable() for char in line) >= 0.8 * len(line):
+                lines.append(line)
+    return '\n'.join(lines)
+
+
+def analyze_pdf(data, thumbnail_size, max_inflated=MAX_INFLATED_SIZE * 2):
+    """(page count, text, thumbnail) of a PDF; at most `max_inflated` bytes are decompressed in all."""
+    objects, contents, first_image = [data], [], None
+    budget = max_inflated
+    for dictionary, raw in pdf_streams(data):
+        if b'/DCTDecode' in dictionary:
+            # Scanned pages are JPEGs: the first one is the preview
+            if first_image is None and b'/Image' in dictionary:
+                first_image = raw
+            continue
+        if b'/FlateDecode' not in dictionary or b'/Image' in dictionary:
+            continue
+        if budget <= 0:
+            logger.warning(f"PDF inflated past {max_inflated} bytes, the remaining streams are ignored")
+            break
+        decoded = inflate(raw, min(budget, MAX_INFLATED_SIZE))
+        if decoded is None:
+            continue
+        budget -= len(decoded)
+        if b'/ObjStm' in dictionary:
+            objects.append(decoded)  # Compressed objects, page dictionaries among them
+        elif b'/XRef' not in dictionary:
+            contents.append(decoded)
+
+    pages = sum(len(PDF_PAGE_RE.findall(chunk)) for chunk in objects)
+    if not pages:
+        # The root of the page tree counts every page
+        pages = max((int(count) for chunk in objects for count in PDF_COUNT_RE.findall(chunk)), default=None)
+    thumbnail = None
+    if first_image is not None:
+        try:
+            thumbnail = thumbnail_of(Image.open(io.BytesIO(first_image)), thumbnail_size)
+        except (UnidentifiedImageError, OSError):
+            pass
+    return pages, pdf_text(contents), thumbnail
+
+
+# ─── Office documents ─────────────────────────────────────────────
+
+def xml_text(xml, paragraph_tag):
+    xml = xml.replace(f'</{paragraph_tag}>', '\n')
+    return html.unescape(XML_TAG_RE.sub('', xml))
+
+
+def analyze_zip(archive, mime_type):
+    sizes = {member.filename: member.file_size for member in archive.infolist()}
+
+    def read(name):
+        if name not in sizes:
+            return ''
+        if sizes[name] > MAX_INFLATED_SIZE:
+            # zipfile stops at the declared size: a member cannot inflate past it
+            logger.warning(f"Zip member {name} is {sizes[name]} bytes once inflated, skipped")
+            return ''
+        return archive.read(name).decode('utf-8', errors='replace')
+
+    if mime_type.endswith('wordprocessingml.document'):
+        pages = re.search(r'<Pages>(\d+)</Pages>', read('docProps/app.xml'))
+        return int(pages.group(1)) if pages else None, xml_text(read('word/document.xml'), 'w:p')
+    if mime_type.endswith('spreadsheetml.sheet'):
+        return None, xml_text(read('xl/sharedStrings.xml'), 'si')
+    if mime_type.startswith('application/vnd.oasis.opendocument'):
+        pages = re.search(r'meta:page-count="(\d+)"', read('meta.xml'))
+        return int(pages.group(1)) if pages else None, xml_text(read('content.xml'), 'text:p')
+    return None, ''
+
+
+# ─── Entry point ──────────────────────────────────────────────────
+
+def analyze_file(path, thumbnail_size=256, max_bytes=64 * 1024 * 1024, max_chars=200_000):
+    """
+    {'mime_type', 'page_count', 'text', 'thumbnail'} of the file at `path`.
+    At most `max_bytes` are read for PDFs; the text is cut at `max_chars`.
+    `thumbnail` is JPEG bytes, or None when the format has no preview.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+
+    zip_names = ()
+    if head.startswith(b'PK\x03\x04') and zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            zip_names = set(archive.namelist())
+            mime_type = sniff_mime_type(head, zip_names)
+            if mime_type is None:
+                mimetype = archive.getinfo('mimetype')
+                mime_type = archive.read(mimetype).decode('ascii', errors='replace').strip() if mimetype.file_size <= 255 else 'application/zip'
+            pages, text = analyze_zip(archive, mime_type)
+        return {'mime_type': mime_type, 'page_count': pages, 'text': clean_text(text, max_chars), 'thumbnail': None}
+
+    mime_type = sniff_mime_type(head)
+    result = {'mime_type': mime_type, 'page_count': None, 'text': '', 'thumbnail': None}
+    if mime_type == 'application/pdf':
+        with open(path, 'rb') as f:
+            pages, text, thumbnail = analyze_pdf(f.read(max_bytes), thumbnail_size)
+        result.update(page_count=pages, text=clean_text(text, max_chars), thumbnail=thumbnail)
+    elif mime_type in IMAGE_TYPES:
+        with Image.open(path) as image:
+            result.update(page_count=getattr(image, 'n_frames', 1), thumbnail=thumbnail_of(image, thumbnail_size))
+    elif mime_type == 'text/plain':
+        with open(path, 'rb') as f:
+            result['text'] = clean_text(f.read(max_chars * 4).decode('utf-8', errors='replace'), max_chars)
+    return result
@@ -4,6 +4,7 @@ from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 from users.models import CustomUser
 from django_otp.plugins.otp_totp.models import TOTPDevice
+from django.db.models import Exists, OuterRef
 from django.contrib.auth import get_user_model # <--- Get Django's active User model
 
 User = get_user_model() # Get the actual User model defined in settings.AUTH_USER_MODEL
@@ -80,7 +81,16 @@ class ProfileSerializer(serializers.ModelSerializer):
         fields = ["id", "email", "name", "username", "role", "has_2fa"]
 
     def get_has_2fa(self, user):
-        return bool(TOTPDevice.objects.filter(user=user, confirmed=True))
+        # Annotated by with_has_2fa() when serializing many users
+        if hasattr(user, 'has_confirmed_totp'):
+            return user.has_confirmed_totp
+        return TOTPDevice.objects.filter(user=user, confirmed=True).exists()
+
+    @staticmethod
+    def with_has_2fa(queryset):
+        return queryset.annotate(
+            has_confirmed_totp=Exists(TOTPDevice.objects.filter(user=OuterRef('pk'), confirmed=True))
+        )
 
 
 class LogoutSerializer(serializers.Serializer):
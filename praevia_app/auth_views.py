@@ -149,7 +149,7 @@ class AuthViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         """
         if request.method == "GET":
             if request.user.is_superuser:
-                qs = CustomUser.objects.all()
+                qs = ProfileSerializer.with_has_2fa(CustomUser.objects.all())
                 ser = ProfileSerializer(qs, many=True, context={"request": request})
             else:
                 ser = ProfileSerializer(request.user, context={"request": request})
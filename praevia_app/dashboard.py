@@ -0,0 +1,394 @@
+# /home/siisi/atmp/praevia_app/dashboard.py
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils.functional import cached_property
+
+from .models import (
+    DossierATMP, DossierStatus, Contentieux, ContentieuxStatus,
+    Audit, AuditStatus, AuditDecision, JuridictionStep, DashboardSnapshot
+)
+from users.models import UserRole
+
+logger = logging.getLogger(__name__)
+
+
+# Grouped counters materialized in DashboardSnapshot, per model and lookup.
+# Lookups may follow relations (e.g. created_by__role); they are resolved
+# with .values() so they behave exactly like the GROUP BY they replace.
+SNAPSHOT_DIMENSIONS = {
+    DossierATMP: ('status', 'location', 'created_by__role', 'safety_manager__email'),
+    Contentieux: ('status',),
+    Audit: ('status', 'decision'),
+    JuridictionStep: ('juridiction', 'decision'),
+}
+
+
+def snapshot_dimension(model, field):
+    return f"{model._meta.model_name}.{field}"
+
+
+def snapshot_values(instance):
+    """
+    Returns the bucket values of `instance` for every tracked dimension,
+    read from the database, or None if the row does not exist (yet).
+    """
+    model = type(instance)
+    if instance.pk is None:
+        return None
+    return model.objects.filter(pk=instance.pk).values(*SNAPSHOT_DIMENSIONS[model]).first()
+
+
+def _bump(dimension, value, delta):
+    value = '' if value is None else str(value)
+    bucket = DashboardSnapshot.objects.filter(dimension=dimension, value=value)
+    if not bucket.update(count=F('count') + delta):
+        DashboardSnapshot.objects.get_or_create(dimension=dimension, value=value)
+        bucket.update(count=F('count') + delta)
+
+
+def apply_snapshot_delta(model, before, after):
+    """
+    Moves one row from the `before` buckets to the `after` buckets.
+    Either side may be None (creation / deletion).
+    """
+    for field in SNAPSHOT_DIMENSIONS[model]:
+        if before is not None and after is not None and before[field] == after[field]:
+            continue
+        dimension = snapshot_dimension(model, field)
+        if before is not None:
+            _bump(dimension, before[field], -1)
+        if after is not None:
+            _bump(dimension, after[field], 1)
+
+
+def _apply_bucket_deltas(deltas):
+    """
+    Adds {(dimension, value): delta} to the snapshot: missing buckets are
+    created with one INSERT, then all of them change with one UPDATE.
+    """
+    deltas = {bucket: delta for bucket, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    DashboardSnapshot.objects.bulk_create(
+        [DashboardSnapshot(dimension=dimension, value=value) for dimension, value in deltas],
+        ignore_conflicts=True,
+    )
+    buckets = Q()
+    for dimension, value in deltas:
+        buckets |= Q(dimension=dimension, value=value)
+    DashboardSnapshot.objects.filter(buckets).update(count=F('count') + Case(
+        *(When(dimension=dimension, value=value, then=Value(delta)) for (dimension, value), delta in deltas.items()),
+        default=Value(0),
+    ))
+
+
+def add_to_snapshot(model, pks):
+    """
+    Counts rows inserted without signals (bulk_create) into the snapshot:
+    one GROUP BY per dimension over the new rows, then every bucket is
+    created if missing and incremented with a single INSERT and UPDATE.
+    """
+    if not pks:
+        return
+    rows = model.objects.filter(pk__in=pks)
+    deltas = {}
+    for field in SNAPSHOT_DIMENSIONS[model]:
+        for row in rows.values(field).annotate(count=Count('id')).order_by():
+            value = '' if row[field] is None else str(row[field])
+            deltas[(snapshot_dimension(model, field), value)] = row['count']
+    _apply_bucket_deltas(deltas)
+    invalidate_dashboards(model)
+
+
+def move_in_snapshot(model, changes):
+    """
+    Snapshot counterpart of bulk_update(): `changes` holds one
+    ({field: old value}, {field: new value}) pair per updated row, for the
+    dimensions of `model` the update may have changed. Every bucket moves
+    with a single INSERT and UPDATE.
+    """
+    deltas = defaultdict(int)
+    for before, after in changes:
+        for field, old in before.items():
+            new = after[field]
+            if old == new:
+                continue
+            dimension = snapshot_dimension(model, field)
+            deltas[(dimension, '' if old is None else str(old))] -= 1
+            deltas[(dimension, '' if new is None else str(new))] += 1
+    _apply_bucket_deltas(deltas)
+    invalidate_dashboards(model)
+
+
+def user_dimensions():
+    """
+    (model, foreign key, user field) of every dimension read through a
+    foreign key to the user model, e.g. (DossierATMP, 'created_by', 'role').
+    """
+    for model, fields in SNAPSHOT_DIMENSIONS.items():
+        for field in fields:
+            relation, _, user_field = field.partition('__')
+            if user_field and model._meta.get_field(relation).related_model is get_user_model():
+                yield model, relation, user_field
+
+
+def user_dimension_fields():
+    return {user_field for _, _, user_field in user_dimensions()}
+
+
+def user_snapshot_values(user):
+    """
+    Returns the fields of `user` that rows are bucketed by, read from the
+    database, or None if the user does not exist (yet).
+    """
+    if user.pk is None:
+        return None
+    return type(user).objects.filter(pk=user.pk).values(*user_dimension_fields()).first()
+
+
+def move_user_in_snapshot(user, before, after):
+    """
+    Moves the rows bucketed by a field of `user` (its role, its email…)
+    from the `before` to the `after` values of that field: one COUNT per
+    changed dimension, then a single INSERT and UPDATE of the buckets.
+    """
+    if before is None or after is None:
+        return  # A new user has no rows yet; deleted ones were cascaded or protected
+    deltas, models = defaultdict(int), set()
+    for model, relation, user_field in user_dimensions():
+        old, new = before[user_field], after[user_field]
+        if old == new:
+            continue
+        count = model.objects.filter(**{relation: user}).count()
+        if count:
+            dimension = snapshot_dimension(model, f"{relation}__{user_field}")
+            deltas[(dimension, '' if old is None else str(old))] -= count
+            deltas[(dimension, '' if new is None else str(new))] += count
+            models.add(model)
+    _apply_bucket_deltas(deltas)
+    if models:
+        invalidate_dashboards(*models)
+
+
+def rebuild_dashboard_snapshot():
+    """
+    Recomputes every DashboardSnapshot bucket from the source tables.
+    Needed after writes that bypass signals (queryset.update(), bulk_create()).
+    Returns the number of buckets written.
+    """
+    buckets = []
+    for model, fields in SNAPSHOT_DIMENSIONS.items():
+        for field in fields:
+            rows = model.objects.values(field).annotate(count=Count('id')).order_by()
+            buckets.extend(
+                DashboardSnapshot(
+                    dimension=snapshot_dimension(model, field),
+                    value='' if row[field] is None else str(row[field]),
+                    count=row['count'],
+                )
+                for row in rows
+            )
+
+    with transaction.atomic():
+        DashboardSnapshot.objects.all().delete()
+        DashboardSnapshot.objects.bulk_create(buckets)
+    invalidate_dashboards(*SNAPSHOT_DIMENSIONS)
+    logger.info(f"Dashboard snapshot rebuilt with {len(buckets)} buckets")
+    return len(buckets)
+
+
+_maintenance = threading.local()
+
+
+@contextmanager
+def snapshot_maintenance_paused():
+    """
+    Turns off the per-row snapshot updates done by signals.py inside the
+    block. For bulk jobs, which call rebuild_dashboard_snapshot() once done.
+    """
+    previous = is_snapshot_maintenance_paused()
+    _maintenance.paused = True
+    try:
+        yield
+    finally:
+        _maintenance.paused = previous
+
+
+def is_snapshot_maintenance_paused():
+    return getattr(_maintenance, 'paused', False)
+
+
+# ---------------------- Versioned dashboard cache ----------------------
+#
+# Cached payloads are keyed by dashboard name plus the current generation
+# of every model they read. A write to one of those models bumps its
+# generation, so the next read misses and recomputes: entries never need
+# to be deleted, stale ones simply age out.
+
+def _dashboard_cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(model):
+    return f"dashboard:generation:{model._meta.label_lower}"
+
+
+def _new_generation():
+    # Never reuse a value seen before, even if the counter was evicted
+    return time.time_ns()
+
+
+def dashboard_generations(models):
+    cache = _dashboard_cache()
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def invalidate_dashboards(*models):
+    """
+    Bumps the generation of `models` so every cached dashboard reading them
+    is recomputed. Deferred until the surrounding transaction commits, so a
+    concurrent reader cannot cache pre-commit data under the new generation.
+    """
+    def bump():
+        cache = _dashboard_cache()
+        for model in models:
+            key = _generation_key(model)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, _new_generation(), None)
+    transaction.on_commit(bump)
+
+
+def cached_dashboard(name, models, builder):
+    """
+    Returns builder() from the dashboard cache. `models` lists every model
+    the payload is computed from; `name` identifies the dashboard (one per
+    role, HTML and API payloads kept apart).
+    """
+    cache = _dashboard_cache()
+    generations = dashboard_generations(models)
+    key = f"dashboard:{name}:" + "-".join(str(generation) for generation in generations)
+    payload = cache.get(key)
+    if payload is None:
+        payload = builder()
+        cache.set(key, payload, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return payload
+
+
+class DashboardStats:
+    """
+    Card counters shared by the HTML dashboards and the /api/dashboard/* endpoints.
+
+    Totals and GROUP BY breakdowns are read from DashboardSnapshot (one query
+    over the buckets, whatever the table sizes). Counters that depend on the
+    current user or cross several tables use a single conditional-aggregation
+    query (COUNT(*) FILTER (WHERE ...)). Everything is evaluated lazily and
+    memoized on the instance.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+
+    @property
+    def user_id(self):
+        if self.user is not None and self.user.is_authenticated:
+            return self.user.pk
+        return None
+
+    @cached_property
+    def buckets(self):
+        buckets = defaultdict(dict)
+        rows = DashboardSnapshot.objects.filter(count__gt=0).values_list('dimension', 'value', 'count')
+        for dimension, value, count in rows:
+            buckets[dimension][value or None] = count
+        return buckets
+
+    def bucket(self, model, field):
+        return self.buckets.get(snapshot_dimension(model, field), {})
+
+    @cached_property
+    def dossiers(self):
+        by_status = self.bucket(DossierATMP, 'status')
+        total = sum(by_status.values())
+        stats = {
+            'total': total,
+            'a_analyser': by_status.get(DossierStatus.A_ANALYSER, 0),
+            'analyse_en_cours': by_status.get(DossierStatus.ANALYSE_EN_COURS, 0),
+            'open': total - by_status.get(DossierStatus.CLOTURE_SANS_SUITE, 0),
+            'created_by_employee': self.bucket(DossierATMP, 'created_by__role').get(UserRole.EMPLOYEE, 0),
+            'mine': 0,
+            'managed': 0,
+        }
+        if self.user_id is not None:
+            stats.update(DossierATMP.objects.aggregate(
+                mine=Count('id', filter=Q(created_by_id=self.user_id)),
+                managed=Count('id', filter=Q(safety_manager_id=self.user_id)),
+            ))
+        return stats
+
+    @cached_property
+    def contentieux(self):
+        by_status = self.bucket(Contentieux, 'status')
+        return {
+            'total': sum(by_status.values()),
+            'en_cours': by_status.get(ContentieuxStatus.EN_COURS, 0),
+        }
+
+    @cached_property
+    def contentieux_origin(self):
+        # Depends on the audit of the parent dossier, so it cannot be bucketed per row
+        return Contentieux.objects.aggregate(
+            from_contested=Count('id', filter=Q(dossier_atmp__audit__decision=AuditDecision.CONTEST)),
+            from_not_contested=Count('id', filter=Q(dossier_atmp__audit__decision=AuditDecision.DO_NOT_CONTEST)),
+        )
+
+    @cached_property
+    def audits(self):
+        # Audit is one-to-one with DossierATMP, so counting audits by decision
+        # is the same as counting dossiers by audit__decision.
+        by_status = self.bucket(Audit, 'status')
+        return {
+            'total': sum(by_status.values()),
+            'in_progress': by_status.get(AuditStatus.IN_PROGRESS, 0),
+            'completed': by_status.get(AuditStatus.COMPLETED, 0),
+            'contest': self.bucket(Audit, 'decision').get(AuditDecision.CONTEST, 0),
+        }
+
+    @cached_property
+    def juridiction_steps(self):
+        return {'total': sum(self.bucket(JuridictionStep, 'juridiction').values())}
+
+    def breakdown(self, model, field, order_by=None):
+        """
+        Returns [{field: value, 'count': n}, ...] grouped by `field`.
+        Ordered by `field` unless `order_by` is given (e.g. '-count').
+        """
+        if field not in SNAPSHOT_DIMENSIONS.get(model, ()):
+            return list(
+                model.objects.values(field)
+                .annotate(count=Count('id'))
+                .order_by(order_by or field)
+            )
+
+        rows = [{field: value, 'count': count} for value, count in self.bucket(model, field).items()]
+        by_value = lambda row: (row[field] is None, row[field] or '')
+        rows.sort(key=by_value)
+        if order_by == '-count':
+            rows.sort(key=lambda row: row['count'], reverse=True)
+        return rows
@@ -0,0 +1,54 @@
+# /home/siisi/atmp/praevia_app/denormalized.py
+
+import re
+import unicodedata
+from django.utils.crypto import salted_hmac
+from django.utils.dateparse import parse_date
+
+# Indexed copies of the JSON keys dossiers are filtered on. Computed by
+# DossierATMP.prepare_for_save() and by the backfill of migration 0012.
+
+NSS_HASH_SALT = 'praevia_app.DossierATMP.salarie_nss_hash'
+
+
+def normalize_siret(value):
+    """Digits only: '123 456 789 00011' and '12345678900011' are the same SIRET."""
+    return re.sub(r'\D', '', str(value or ''))[:14]
+
+
+def normalize_name(value):
+    """Case and accent insensitive form of a name, for exact and prefix lookups."""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())[:100]
+
+
+def hash_nss(value):
+    """
+    Keyed hash of a social security number (spaces and case ignored), so
+    dossiers can be looked up by NSS without an index of the clear value.
+    Depends on SECRET_KEY: rotating it requires re-running the backfill.
+    """
+    value = re.sub(r'\s', '', str(value or '')).upper()
+    if not value:
+        return ''
+    return salted_hmac(NSS_HASH_SALT, value, algorithm='sha256').hexdigest()
+
+
+def parse_accident_date(value):
+    try:
+        return parse_date(str(value)) if value else None
+    except ValueError:
+        return None
+
+
+def denormalized_columns(entreprise, salarie, accident):
+    entreprise = entreprise if isinstance(entreprise, dict) else {}
+    salarie = salarie if isinstance(salarie, dict) else {}
+    accident = accident if isinstance(accident, dict) else {}
+    return {
+        'siret': normalize_siret(entreprise.get('siret')),
+        'salarie_last_name': normalize_name(salarie.get('last_name')),
+        'salarie_nss_hash': hash_nss(salarie.get('social_security_number')),
+        'accident_date': parse_accident_date(accident.get('date')),
+    }
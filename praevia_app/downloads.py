@@ -0,0 +1,172 @@
+# /home/siisi/atmp/praevia_app/downloads.py
+
+import logging
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+from .storage import blob_digest
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes read per chunk when the file is streamed by Python (no sendfile)
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Headers whose value is a filesystem path instead of an internal URI
+PATH_OFFLOAD_HEADERS = ('x-sendfile', 'x-lighttpd-send-file')
+
+
+class FileRange:
+    """
+    The [start, start + length) bytes of an open file. read() stops at the
+    end of the range; fileno() is the file's own, positioned at `start`, so
+    a WSGI server using sendfile (gunicorn) sends the range from the page
+    cache, bounded by the Content-Length header.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class DocumentFileResponse(FileResponse):
+    block_size = DOWNLOAD_BLOCK_SIZE
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single-range `Range: bytes=` header, end included.
+    None when the header should be ignored (absent, malformed or several
+    ranges: the whole file is sent); ValueError when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        if not int(last):
+            raise ValueError("Empty suffix range")
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    return start, end
+
+
+def file_etag(document, stat):
+    """
+    Strong validator: the SHA-256 of a blob-backed file, which names its
+    content (the blob's mtime moves when another upload reuses it); size
+    and modification time for a legacy file.
+    """
+    digest = blob_digest(document.file.name)
+    if digest:
+        return quote_etag(digest)
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def offload_target(header, document, path):
+    """The value of the offload header: an internal URI for nginx, the path for X-Sendfile."""
+    if header.lower() in PATH_OFFLOAD_HEADERS:
+        return path
+    return settings.DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(document.file.name)
+
+
+def serve_document(request, document):
+    """
+    The download response of `document`, whose permission has been checked
+    by the caller. Conditional requests (If-None-Match, If-Modified-Since)
+    are answered here from a stat() of the file. With DOWNLOAD_OFFLOAD_HEADER
+    set, the bytes are sent by the front proxy (X-Accel-Redirect, X-Sendfile):
+    the worker is released at once. Otherwise the file is streamed with
+    single Range support, through sendfile when the WSGI server offers it.
+    Raises Http404 when the file is missing.
+    """
+    if not document.file or not document.file.name:
+        raise Http404("File not found for this document.")
+    path = document.file.path
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        logger.error(f"File not found on disk for Document ID {document.pk} at path {path}")
+        raise Http404("File not found on server storage.")
+
+    etag = file_etag(document, stat)
+    # A blob's content never changes: the document row says when it got this file
+    last_modified = int(document.updated_at.timestamp() if blob_digest(document.file.name) else stat.st_mtime)
+    # Sniffed from the content by process_documents, then declared at upload (blob names have no extension)
+    content_type = (
+        document.detected_mime_type or document.mime_type
+        or mimetypes.guess_type(document.original_name or '')[0] or 'application/octet-stream'
+    )
+    filename = os.path.basename(document.original_name or document.file.name)
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        # Documents are personal data: no shared cache keeps them
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return with_headers(conditional)
+
+    offload_header = settings.DOWNLOAD_OFFLOAD_HEADER
+    if offload_header:
+        response = HttpResponse(content_type=content_type)
+        response[offload_header] = offload_target(offload_header, document, path)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return with_headers(response)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            return with_headers(response)
+
+    start, end = byte_range or (0, stat.st_size - 1)
+    length = max(end - start + 1, 0)
+    response = DocumentFileResponse(
+        FileRange(open(path, 'rb'), start, length),
+        status=206 if byte_range else 200,
+        as_attachment=True, filename=filename, content_type=content_type,
+    )
+    response['Content-Length'] = length
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    return with_headers(response)
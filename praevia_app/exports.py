@@ -0,0 +1,210 @@
+# /home/siisi/atmp/praevia_app/exports.py
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from .forms import AccidentForm, EntrepriseForm, SalarieForm
+
+
+# Bytes buffered before a chunk is handed to the server
+EXPORT_FLUSH_SIZE = 64 * 1024
+
+
+class Export:
+    """
+    A flat, streamable projection of a model: `columns` are .values()
+    lookups, `json_columns` maps JSONField lookups to their keys, which
+    become `field.key` columns. Keys outside that list are kept in NDJSON
+    and dropped from CSV, whose header is written before the first row.
+    """
+
+    def __init__(self, name, columns, json_columns=None):
+        self.name = name
+        self.columns = columns
+        self.json_columns = json_columns or {}
+
+    @property
+    def header(self):
+        return [
+            *self.columns,
+            *(f"{field}.{key}" for field, keys in self.json_columns.items() for key in keys),
+        ]
+
+    def rows(self, queryset):
+        """Flat dicts, fetched `EXPORT_CHUNK_SIZE` rows at a time."""
+        chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+        lookups = [*self.columns, *self.json_columns]
+        for values in queryset.values(*lookups).iterator(chunk_size=chunk_size):
+            row = {column: values[column] for column in self.columns}
+            for field, keys in self.json_columns.items():
+                data = values[field] if isinstance(values[field], dict) else {}
+                for key in keys:
+                    row[f"{field}.{key}"] = data.get(key)
+                for key in sorted(data.keys() - set(keys)):
+                    row[f"{field}.{key}"] = data[key]
+            yield row
+
+
+DOSSIER_EXPORT = Export(
+    'dossiers',
+    columns=[
+        'id', 'reference', 'status', 'title', 'description', 'date_of_incident', 'location',
+        'service_sante', 'created_by__email', 'safety_manager__email',
+        'audit__status', 'audit__decision', 'contentieux__reference', 'contentieux__status',
+        'created_at', 'updated_at',
+    ],
+    json_columns={
+        'entreprise': list(EntrepriseForm.base_fields),
+        'salarie': list(SalarieForm.base_fields),
+        'accident': list(AccidentForm.base_fields),
+    },
+)
+
+CONTENTIEUX_EXPORT = Export(
+    'contentieux',
+    columns=['id', 'reference', 'status', 'dossier_atmp__reference', 'created_at', 'updated_at'],
+    json_columns={'subject': ['title', 'description']},
+)
+
+AUDIT_EXPORT = Export(
+    'audits',
+    columns=[
+        'id', 'dossier_atmp__reference', 'status', 'decision', 'auditor__email', 'comments',
+        'started_at', 'completed_at', 'created_at', 'updated_at',
+    ],
+)
+
+
+# ---------------- Encoders ----------------
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+# First characters that make spreadsheet software read a cell as a formula
+# (plus tab and carriage return, OWASP's CSV injection list)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    """_text(value), with a leading quote on cells that would be read as a formula."""
+    text = _text(value)
+    if text.startswith(FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def ndjson_lines(export, rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=_json_default) + "\n"
+
+
+def csv_lines(export, rows):
+    header = export.header
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(header)
+    # UTF-8 BOM so that spreadsheet software detects the encoding
+    yield '\ufeff' + take()
+    for row in rows:
+        writer.writerow([_csv_cell(row.get(column)) for column in header])
+        yield take()
+
+
+ENCODERS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
+
+
+def _chunked(lines):
+    """
+    Groups small lines into ~EXPORT_FLUSH_SIZE chunks. The first line (the
+    CSV header, or the first NDJSON row) goes out on its own, right away.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    yield first.encode('utf-8')
+
+    chunk, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        chunk.append(data)
+        size += len(data)
+        if size >= EXPORT_FLUSH_SIZE:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Lets export actions accept ?format=ndjson|csv (or the Accept header).
+    The export itself is a StreamingHttpResponse; only error payloads are
+    rendered here, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, default=_json_default).encode()
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+EXPORT_RENDERERS = [NDJSONRenderer, CSVRenderer]
+
+
+def streaming_export(export, queryset, export_format):
+    """
+    StreamingHttpResponse over `queryset`: rows are read with a chunked
+    iterator and encoded one by one, so memory use does not depend on the
+    number of rows and the first bytes leave before the query is exhausted.
+    """
+    renderer = {renderer.format: renderer for renderer in EXPORT_RENDERERS}[export_format]
+    lines = ENCODERS[export_format](export, export.rows(queryset))
+    response = StreamingHttpResponse(
+        _chunked(lines), content_type=f"{renderer.media_type}; charset={renderer.charset}"
+    )
+    filename = f"{export.name}-{timezone.localdate():%Y%m%d}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
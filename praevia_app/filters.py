@@ -0,0 +1,137 @@
+# /home/siisi/atmp/praevia_app/filters.py
+
+import django_filters
+from rest_framework.filters import BaseFilterBackend
+
+from .denormalized import hash_nss, normalize_name, normalize_siret
+from .models import (
+    OPEN_AUDIT_STATUSES, OPEN_CONTENTIEUX_STATUSES, OPEN_DOSSIER_STATUSES,
+    Audit, AuditDecision, AuditStatus, Contentieux, ContentieuxStatus, DossierATMP, DossierStatus,
+)
+from .search import search_documents, search_dossiers
+
+
+class DossierSearchFilter(BaseFilterBackend):
+    """
+    ?q=martin 1234 keeps the dossiers matching every term (prefix match)
+    in their text columns and entreprise/salarie/accident JSON, through the
+    full-text index of search.py.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        return search_dossiers(queryset, request.query_params.get(self.search_param, ''))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search: reference, title, description, location, employee, company, SIRET, social security number.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class DocumentSearchFilter(BaseFilterBackend):
+    """
+    ?q=expertise genou keeps the documents containing every term (prefix
+    match) in their name, description or extracted text (see processing.py),
+    through the full-text index of search.py.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        return search_documents(queryset, request.query_params.get(self.search_param, ''))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search: file name, description, text of the document.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class ChoiceInFilter(django_filters.BaseInFilter, django_filters.ChoiceFilter):
+    """Comma-separated choices: ?status=A,B."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('lookup_expr', 'in')
+        super().__init__(*args, **kwargs)
+
+
+class OpenStatusFilterSet(django_filters.FilterSet):
+    """
+    ?status=A,B and ?open=true|false. `open_statuses` is the condition of
+    the model's partial "open" index, so ?open=true is served by it.
+    """
+    open_statuses = ()
+
+    open = django_filters.BooleanFilter(method='filter_open')
+
+    def filter_open(self, queryset, name, value):
+        if value:
+            return queryset.filter(status__in=self.open_statuses)
+        return queryset.exclude(status__in=self.open_statuses)
+
+
+class DossierFilter(OpenStatusFilterSet):
+    """
+    Filters on the indexed copies of the JSON keys (see denormalized.py);
+    values are normalized the same way before the lookup.
+
+    ?siret=123 456 789 00011
+    ?last_name=lefèvre        case and accent insensitive
+    ?last_name_prefix=lef
+    ?nss=1 85 05 75 123 456   matched through its hash
+    ?accident_date=2024-03-01, ?accident_date_after=…, ?accident_date_before=…
+    ?status=A_ANALYSER,ANALYSE_EN_COURS, ?open=true (see OPEN_DOSSIER_STATUSES)
+    """
+    open_statuses = OPEN_DOSSIER_STATUSES
+
+    status = ChoiceInFilter(choices=DossierStatus.choices)
+    siret = django_filters.CharFilter(method='filter_siret')
+    last_name = django_filters.CharFilter(method='filter_last_name')
+    last_name_prefix = django_filters.CharFilter(method='filter_last_name_prefix')
+    nss = django_filters.CharFilter(method='filter_nss')
+    accident_date = django_filters.DateFilter(field_name='accident_date')
+    accident_date_after = django_filters.DateFilter(field_name='accident_date', lookup_expr='gte')
+    accident_date_before = django_filters.DateFilter(field_name='accident_date', lookup_expr='lte')
+
+    class Meta:
+        model = DossierATMP
+        fields = []
+
+    def filter_siret(self, queryset, name, value):
+        return queryset.filter(siret=normalize_siret(value))
+
+    def filter_last_name(self, queryset, name, value):
+        return queryset.filter(salarie_last_name=normalize_name(value))
+
+    def filter_last_name_prefix(self, queryset, name, value):
+        return queryset.filter(salarie_last_name__startswith=normalize_name(value))
+
+    def filter_nss(self, queryset, name, value):
+        return queryset.filter(salarie_nss_hash=hash_nss(value))
+
+
+class ContentieuxFilter(OpenStatusFilterSet):
+    open_statuses = OPEN_CONTENTIEUX_STATUSES
+
+    status = ChoiceInFilter(choices=ContentieuxStatus.choices)
+
+    class Meta:
+        model = Contentieux
+        fields = []
+
+
+class AuditFilter(OpenStatusFilterSet):
+    open_statuses = OPEN_AUDIT_STATUSES
+
+    status = ChoiceInFilter(choices=AuditStatus.choices)
+    decision = ChoiceInFilter(choices=AuditDecision.choices)
+
+    class Meta:
+        model = Audit
+        fields = ['auditor']
@@ -1,16 +1,21 @@
 # /home/siisi/atmp/praevia_app/forms.py
 
 import json
+from datetime import datetime, time
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.forms import formset_factory
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .dashboard import add_to_snapshot, move_in_snapshot
 from .models import (
     DossierATMP, Contentieux, Document, Temoin,
     DocumentType, DossierStatus, ContentieuxStatus,
-    JuridictionType
+    JuridictionType, JuridictionStep
 )
 from users.models import CustomUser, UserRole
 
@@ -204,6 +209,8 @@ class DossierATMPForm(forms.ModelForm):
 
 # --- NEW FORM FOR INDIVIDUAL JURIDICTION STEP ---
 class JuridictionStepForm(forms.Form): # This is a regular forms.Form, not ModelForm
+    # The JuridictionStep row the form edits; empty for a new step
+    step_id = forms.IntegerField(required=False, widget=forms.HiddenInput())
     step_type = forms.ChoiceField(
         choices=JuridictionType.choices, # Using the Enum from models.py
         label=_("Type of Jurisdiction"),
@@ -240,7 +247,7 @@ class ContentieuxForm(forms.ModelForm):
     class Meta:
         model = Contentieux
         # EXCLUDE the original JSONFields from the form as they are handled by new fields/formset
-        exclude = ['reference', 'documents', 'actions', 'subject', 'juridiction_steps']
+        exclude = ['reference', 'documents', 'actions', 'subject']
         widgets = {
             'dossier_atmp': forms.HiddenInput(), # Still hidden, not directly user-editable
             'status': forms.Select(attrs={'class': 'form-select'}),
@@ -257,31 +264,17 @@ class ContentieuxForm(forms.ModelForm):
             self.initial['subject_title'] = self.instance.subject.get('title', '')
             self.initial['subject_description'] = self.instance.subject.get('description', '')
 
-        # --- Initialize the Formset for juridiction_steps ---
+        # --- Initialize the Formset from the JuridictionStep rows (the timeline, in order) ---
+        self.existing_steps = {}
         initial_steps_data = []
-        if self.instance.pk and isinstance(self.instance.juridiction_steps, dict):
-            # Sort the keys (e.g., 'step1', 'step2') to ensure consistent order
-            sorted_keys = sorted(
-                self.instance.juridiction_steps.keys(),
-                key=lambda x: int(x.replace('step', '')) if x.startswith('step') and x[4:].isdigit() else float('inf')
-            )
-            for key in sorted_keys:
-                step_data = self.instance.juridiction_steps[key]
-                # Ensure date is in 'YYYY-MM-DD' format if coming from non-standard JSON
-                step_date_str = step_data.get('date')
-                if step_date_str:
-                    try:
-                        # Attempt to parse as date object for DateField
-                        step_date_obj = forms.DateField().to_python(step_date_str)
-                    except ValidationError:
-                        step_date_obj = None # Or handle error appropriately
-                else:
-                    step_date_obj = None
-
+        if self.instance.pk:
+            self.existing_steps = {step.pk: step for step in self.instance.juridiction_steps_set.all()}
+            for step in self.existing_steps.values():
                 initial_steps_data.append({
-                    'step_type': step_data.get('type', ''),
-                    'step_date': step_date_obj,
-                    'step_notes': step_data.get('notes', ''),
+                    'step_id': step.pk,
+                    'step_type': step.juridiction or '',
+                    'step_date': timezone.localtime(step.submitted_at).date(),
+                    'step_notes': step.notes or '',
                 })
 
         # Define the formset factory for juridiction steps
@@ -318,23 +311,10 @@ class ContentieuxForm(forms.ModelForm):
             'description': self.cleaned_data['subject_description'],
         }
 
-        # Process juridiction_steps from the formset
-        cleaned_steps = {}
-        # Iterate over formset forms, only processing those that are valid and not marked for deletion
-        # form.cleaned_data will be {} if the form is empty, or if marked for deletion and no data changed.
-        for i, form in enumerate(self.juridiction_step_formset):
-            if form.is_valid() and not form.cleaned_data.get('DELETE'):
-                step_data = {
-                    'type': form.cleaned_data['step_type'],
-                    'date': form.cleaned_data['step_date'].isoformat() if form.cleaned_data['step_date'] else None,
-                    'notes': form.cleaned_data['step_notes'],
-                }
-                cleaned_steps[f'step{i+1}'] = step_data # Assign a simple key, e.g., 'step1', 'step2'
-
-        instance.juridiction_steps = cleaned_steps
-
         if commit:
-            instance.save()
+            with transaction.atomic():
+                instance.save()
+                self.save_steps()
             # If you enable ManyToMany fields like 'documents' or 'actions' as form fields,
             # you would need to call self.save_m2m() here.
             # E.g., if 'documents' was added to 'fields' in Meta:
@@ -342,6 +322,50 @@ class ContentieuxForm(forms.ModelForm):
 
         return instance
 
+    def save_steps(self):
+        """
+        Writes the formset to the JuridictionStep rows of the saved instance:
+        one bulk INSERT for the new steps, one bulk UPDATE for the edited
+        ones and one DELETE for those marked for deletion. Unchanged forms
+        cost nothing.
+        """
+        new_steps, edited_steps, changes, deleted_ids = [], [], [], []
+        for form in self.juridiction_step_formset:
+            data = form.cleaned_data
+            step = self.existing_steps.get(data.get('step_id'))
+            if data.get('DELETE'):
+                if step:
+                    deleted_ids.append(step.pk)
+                continue
+            if not data or not form.has_changed():
+                continue
+
+            submitted_at = step.submitted_at if step else None
+            if submitted_at is None or timezone.localtime(submitted_at).date() != data['step_date']:
+                submitted_at = timezone.make_aware(datetime.combine(data['step_date'], time.min))
+            values = {
+                'juridiction': data['step_type'] or None,
+                'submitted_at': submitted_at,
+                'notes': data['step_notes'] or None,
+            }
+            if step is None:
+                new_steps.append(JuridictionStep(contentieux=self.instance, **values))
+                continue
+            changes.append(({'juridiction': step.juridiction}, {'juridiction': values['juridiction']}))
+            for field, value in values.items():
+                setattr(step, field, value)
+            edited_steps.append(step)
+
+        if new_steps:
+            created = JuridictionStep.objects.bulk_create(new_steps)
+            add_to_snapshot(JuridictionStep, [step.pk for step in created])
+        if edited_steps:
+            JuridictionStep.objects.bulk_update(edited_steps, ['juridiction', 'submitted_at', 'notes'])
+            move_in_snapshot(JuridictionStep, changes)
+        if deleted_ids:
+            # Per-row delete signals keep the snapshot current
+            self.instance.juridiction_steps_set.filter(pk__in=deleted_ids).delete()
+
 
 class DocumentForm(forms.ModelForm):
     class Meta:
@@ -368,6 +392,50 @@ class DocumentForm(forms.ModelForm):
         return file
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A file input accepting several files; cleans to a list of them."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput(attrs={'class': 'form-control'}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
+
+class DocumentBatchUploadForm(forms.Form):
+    """Several files attached to a dossier at once (see uploads.attach_documents)."""
+    document_type = forms.ChoiceField(
+        choices=[('', '---------')] + DocumentType.choices, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    files = MultipleFileField()
+    description = forms.CharField(required=False, widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}))
+
+    def clean_document_type(self):
+        return self.cleaned_data['document_type'] or None
+
+    def clean_files(self):
+        files = self.cleaned_data.get('files') or []
+        max_files = settings.DOCUMENT_BATCH_UPLOAD_MAX_FILES
+        if len(files) > max_files:
+            raise forms.ValidationError(f"Too many files. Send at most {max_files} at once.")
+        max_size = settings.DOCUMENT_BATCH_UPLOAD_MAX_FILE_SIZE
+        too_large = [file.name for file in files if file.size > max_size]
+        if too_large:
+            raise forms.ValidationError(
+                f"File too large: {', '.join(too_large)}. Size should not exceed {max_size/1024/1024}MB."
+            )
+        return files
+
+
 class TemoinForm(forms.ModelForm):
     class Meta:
         model = Temoin
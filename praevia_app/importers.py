@@ -0,0 +1,213 @@
+# /home/siisi/atmp/praevia_app/importers.py
+
+import csv
+import json
+import logging
+from itertools import islice
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .dashboard import add_to_snapshot
+from .models import DossierATMP, ReferenceCounter
+from .notifications import notify_imported_dossiers
+from .references import DOSSIER_REFERENCE_PREFIX
+from .serializers import DossierImportSerializer
+from users.models import CustomUser, UserRole
+
+logger = logging.getLogger(__name__)
+
+
+IMPORT_FORMATS = ('ndjson', 'csv')
+
+# JSON columns that CSV files spell out as dotted headers (entreprise.siret, ...)
+NESTED_COLUMNS = ('entreprise', 'salarie', 'accident')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+# ---------------- Readers ----------------
+#
+# Both yield (line number, row dict) pairs, or (line number, ImportFormatError)
+# for lines that cannot be read, so one bad line does not stop the import.
+
+def read_ndjson(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, ImportFormatError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield number, ImportFormatError("Each line must be a JSON object.")
+            continue
+        yield number, row
+
+
+def read_csv(lines):
+    """
+    First line is the header. Dotted columns are grouped into the JSON
+    fields: `salarie.last_name` becomes row['salarie']['last_name'].
+    Empty cells are left out.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        number = reader.line_num
+        if None in row:
+            yield number, ImportFormatError("More values than columns.")
+            continue
+        data = {}
+        for column, value in row.items():
+            if value is None or value == '':
+                continue
+            section, _, key = column.partition('.')
+            if key and section in NESTED_COLUMNS:
+                data.setdefault(section, {})[key] = value
+            else:
+                data[column] = value
+        yield number, data
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def guess_format(name='', content_type=''):
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return None
+
+
+def read_rows(lines, import_format):
+    if import_format not in READERS:
+        raise ImportFormatError(f"Unsupported format: {import_format} (expected one of {', '.join(IMPORT_FORMATS)}).")
+    return READERS[import_format](lines)
+
+
+# ---------------- Import ----------------
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _reference_taken(dossier):
+    return {'reference': [f"A dossier with reference {dossier.reference} already exists."]}
+
+
+def _exists(dossier):
+    return DossierATMP.objects.filter(reference=dossier.reference).exists()
+
+
+def _insert(dossiers):
+    DossierATMP.objects.bulk_create(dossiers)
+    if dossiers[0].pk is None:
+        # Backends that cannot return the ids of bulk inserted rows
+        ids = dict(DossierATMP.objects.filter(
+            reference__in=[dossier.reference for dossier in dossiers]
+        ).values_list('reference', 'id'))
+        for dossier in dossiers:
+            dossier.pk = ids[dossier.reference]
+    return dossiers
+
+
+def import_dossiers(rows, created_by, batch_size=None, dry_run=False):
+    """
+    Validates (line, row) pairs with DossierImportSerializer and inserts the
+    valid ones with bulk_create, one transaction per batch. Every committed
+    batch queues a single summary notification and is added to the dashboard
+    snapshot in one pass. Rows without a reference get theirs from one block
+    of the day's counter per batch. Invalid rows are skipped and reported,
+    as are references taken by a concurrent import while the batch was
+    checked (the batch is then inserted row by row).
+
+    Returns {'received', 'created', 'failed', 'errors': [{'line', 'errors'}]}.
+    """
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 500)
+    context = {
+        'safety_managers': CustomUser.objects.filter(role=UserRole.SAFETY_MANAGER).only('id', 'email').in_bulk(),
+    }
+    report = {'received': 0, 'created': 0, 'failed': 0, 'errors': []}
+    seen_references = set()
+
+    def reject(line, errors):
+        report['failed'] += 1
+        report['errors'].append({'line': line, 'errors': errors})
+
+    for batch in _batches(rows, batch_size):
+        report['received'] += len(batch)
+        valid = []
+        for line, row in batch:
+            if isinstance(row, ImportFormatError):
+                reject(line, {'non_field_errors': [str(row)]})
+                continue
+            serializer = DossierImportSerializer(data=row, context=context)
+            if not serializer.is_valid():
+                reject(line, serializer.errors)
+                continue
+            dossier = DossierATMP(created_by=created_by, **serializer.validated_data)
+            if dossier.reference:
+                if dossier.reference in seen_references:
+                    reject(line, {'reference': [f"Duplicate reference in this import: {dossier.reference}"]})
+                    continue
+                seen_references.add(dossier.reference)
+            valid.append((line, dossier))
+
+        # References already in the database, for the whole batch in one query
+        taken = set(DossierATMP.objects.filter(
+            reference__in=[dossier.reference for _, dossier in valid if dossier.reference]
+        ).values_list('reference', flat=True))
+        pending = []
+        for line, dossier in valid:
+            if dossier.reference in taken:
+                reject(line, _reference_taken(dossier))
+            else:
+                pending.append((line, dossier))
+
+        if dry_run or not pending:
+            report['created'] += len(pending)
+            continue
+
+        # One block of the day's counter for the rows without a reference,
+        # reserved before the batch transaction so the counter is not locked
+        # while the rows are inserted
+        unnamed = [dossier for _, dossier in pending if not dossier.reference]
+        for dossier, reference in zip(unnamed, ReferenceCounter.objects.allocate(DOSSIER_REFERENCE_PREFIX, len(unnamed))):
+            dossier.reference = reference
+        for _, dossier in pending:
+            dossier.prepare_for_save()
+
+        try:
+            with transaction.atomic():
+                dossiers = _insert([dossier for _, dossier in pending])
+                add_to_snapshot(DossierATMP, [dossier.pk for dossier in dossiers])
+                notify_imported_dossiers(dossiers, created_by)
+        except IntegrityError:
+            # A concurrent import took one of the references between the check
+            # above and the insert: the batch is retried row by row, each in
+            # its own savepoint, and the rows that clash are reported
+            logger.warning(f"Batch of {len(pending)} dossiers hit a duplicate reference, inserting it row by row")
+            with transaction.atomic():
+                dossiers = []
+                for line, dossier in pending:
+                    dossier.pk = None
+                    try:
+                        with transaction.atomic():
+                            dossiers += _insert([dossier])
+                    except IntegrityError as e:
+                        reject(line, _reference_taken(dossier) if _exists(dossier) else {'non_field_errors': [str(e)]})
+                if dossiers:
+                    add_to_snapshot(DossierATMP, [dossier.pk for dossier in dossiers])
+                    notify_imported_dossiers(dossiers, created_by)
+        report['created'] += len(dossiers)
+        logger.info(f"Imported {len(dossiers)} dossiers ({report['created']} so far) for {created_by.email}")
+
+    return report
@@ -0,0 +1,235 @@
+# praevia_app/management/commands/benchmark.py
+
+import json
+from contextlib import ExitStack
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.concurrency import run_finalize
+from benchmarks.plans import indexes_removed, measure_plan, plan_fixtures, select_plan_queries
+from benchmarks.report import compare, environment, format_comparison, load, summarize
+from benchmarks.runner import DRIVERS, run_scenario
+from benchmarks.scenarios import benchmark_fixtures, select_scenarios
+from praevia_app.models import DossierATMP
+
+
+def comma_separated(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the HTTP hot paths (incident list/detail, dossier API, dashboards, document download) '
+        'and reports p50/p95/p99 latency, queries, bytes and peak RSS per request as JSON, '
+        'or compares two reports with --compare. With --plans, reports the query plans and timings of '
+        'the role-scoped list and dashboard queries without and with the composite indexes instead; '
+        'with --finalize, concurrent audit finalizations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=comma_separated, default=None,
+            help='Comma-separated dataset sizes (dossiers), e.g. 1000,10000. Each size is generated with '
+                 'seed_bulk, which replaces the previous bulk data of the configured database. '
+                 'Default: benchmark the data already there.'
+        )
+        parser.add_argument('--users', type=int, default=None, help='Users per dataset (default: 1 per 100 dossiers, at least 10).')
+        parser.add_argument('--documents-per-dossier', type=int, default=3, help='Documents per dossier (default: 3).')
+        parser.add_argument('--seed', type=int, default=42, help='seed_bulk random seed (default: 42).')
+        parser.add_argument('--requests', type=int, default=30, help='Measured requests per scenario (default: 30).')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests before each scenario (default: 3).')
+        parser.add_argument(
+            '--mode', choices=[*DRIVERS, 'both'], default='client',
+            help="'client' (django.test.Client, in process), 'gunicorn' (HTTP to a local gunicorn) or 'both'."
+        )
+        parser.add_argument('--workers', type=int, default=1, help='gunicorn workers (default: 1).')
+        parser.add_argument('--scenarios', type=comma_separated, default=None, help='Comma-separated scenario names (default: all).')
+        parser.add_argument('--download-size', type=int, default=1024 * 1024, help='Size of the downloaded document, in bytes (default: 1 MiB).')
+        parser.add_argument(
+            '--plans', action='store_true',
+            help='Benchmark query plans instead of HTTP requests: each plan query (see benchmarks/plans.py) is '
+                 'EXPLAINed and timed with the Meta.indexes of the dossier/contentieux/audit/document tables '
+                 'dropped, then with them in place. --scenarios then selects plan queries.'
+        )
+        parser.add_argument(
+            '--finalize', type=int, metavar='SUBMISSIONS', default=None,
+            help='Benchmark concurrent audit finalizations instead of HTTP requests: --requests rounds of '
+                 'SUBMISSIONS simultaneous finalizations of the same audit, without and with a shared '
+                 'Idempotency-Key, checking that each round creates exactly one contentieux.'
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument(
+            '--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'),
+            help='Diff two JSON reports instead of running the benchmarks.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=None,
+            help='With --compare: fail if a latency or memory metric got worse by more than this percentage. '
+                 'More queries per request always fail.'
+        )
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], threshold=options['threshold'])
+        if options['finalize']:
+            return self.write_report(self.run_finalize(options), options['output'])
+        if options['plans']:
+            return self.write_report(self.run_plans(options), options['output'])
+
+        try:
+            scenarios = select_scenarios(options['scenarios'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+        modes = list(DRIVERS) if options['mode'] == 'both' else [options['mode']]
+
+        report = {'environment': environment(options), 'datasets': {}, 'results': []}
+        for size in options['sizes'] or [None]:
+            dataset = self.prepare_dataset(size, options)
+            with ExitStack() as stack:
+                fixtures = self.enter_fixtures(stack, options)
+                report['datasets'][dataset] = {'dossiers': DossierATMP.objects.count()}
+
+                for mode in modes:
+                    self.stderr.write(f"⏱️  dataset={dataset} mode={mode}")
+                    try:
+                        if mode == 'gunicorn':
+                            driver = DRIVERS[mode](fixtures['user'], workers=options['workers'])
+                        else:
+                            driver = DRIVERS[mode](fixtures['user'])
+                    except RuntimeError as e:
+                        raise CommandError(str(e))
+                    try:
+                        for scenario in scenarios:
+                            run = run_scenario(
+                                driver, scenario.url(fixtures), scenario.params,
+                                options['requests'], options['warmup'],
+                            )
+                            result = summarize(scenario, mode, dataset, run)
+                            report['results'].append(result)
+                            self.stderr.write(
+                                f"   {scenario.name:<28} p50={result['latency_ms']['p50']:>9.2f}ms "
+                                f"p95={result['latency_ms']['p95']:>9.2f}ms "
+                                f"queries={(result['queries'] or {}).get('mean', '?')} bytes={result['bytes']['mean']}"
+                            )
+                    finally:
+                        driver.close()
+
+        self.write_report(report, options['output'])
+
+    def run_plans(self, options):
+        try:
+            queries = select_plan_queries(options['scenarios'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+
+        report = {'environment': environment(options), 'datasets': {}, 'plans': []}
+        for size in options['sizes'] or [None]:
+            dataset = self.prepare_dataset(size, options)
+            try:
+                ids = plan_fixtures()
+            except ValueError as e:
+                raise CommandError(str(e))
+            report['datasets'][dataset] = {'dossiers': DossierATMP.objects.count()}
+
+            with indexes_removed() as removed:
+                self.stderr.write(f"⏱️  dataset={dataset} indexes=without ({len(removed)} dropped)")
+                report['plans'].extend(self.measure_plans(queries, ids, dataset, 'without', options))
+            self.stderr.write(f"⏱️  dataset={dataset} indexes=with")
+            report['plans'].extend(self.measure_plans(queries, ids, dataset, 'with', options))
+        return report
+
+    def run_finalize(self, options):
+        if options['finalize'] < 2:
+            raise CommandError("--finalize needs at least 2 concurrent submissions.")
+        report = {'environment': environment(options), 'datasets': {}, 'finalize': []}
+        for size in options['sizes'] or [None]:
+            dataset = self.prepare_dataset(size, options)
+            with ExitStack() as stack:
+                user = self.enter_fixtures(stack, options)['user']
+                report['datasets'][dataset] = {'dossiers': DossierATMP.objects.count()}
+
+                for idempotency_key in (False, True):
+                    result = {'dataset': dataset, **run_finalize(user, options['finalize'], options['requests'], idempotency_key)}
+                    report['finalize'].append(result)
+                    self.stderr.write(
+                        f"⏱️  dataset={dataset} submissions={result['submissions']} key={idempotency_key} "
+                        f"p50={result['latency_ms']['p50']:.2f}ms p95={result['latency_ms']['p95']:.2f}ms "
+                        f"outcomes={result['outcomes']} anomalies={result['anomalies']}"
+                    )
+        anomalies = sum(result['anomalies'] for result in report['finalize'])
+        if anomalies:
+            self.stderr.write(self.style.ERROR(f"❌ {anomalies} round(s) did not end with exactly one contentieux"))
+        return report
+
+    def enter_fixtures(self, stack, options):
+        """The benchmark fixtures, removed when `stack` closes."""
+        try:
+            return stack.enter_context(benchmark_fixtures(options['download_size']))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def measure_plans(self, queries, ids, dataset, indexes, options):
+        results = []
+        for query in queries:
+            result = {'dataset': dataset, 'indexes': indexes, **measure_plan(query, ids, options['requests'], options['warmup'])}
+            results.append(result)
+            self.stderr.write(
+                f"   {query.name:<24} p50={result['latency_ms']['p50']:>9.2f}ms rows={result['rows']:<6} "
+                f"plan: {' | '.join(line.strip() for line in result['plan'])}"
+            )
+        return results
+
+    def write_report(self, report, path):
+        output = json.dumps(report, indent=2)
+        if path:
+            with open(path, 'w') as report_file:
+                report_file.write(output + "\n")
+            self.stderr.write(self.style.SUCCESS(f"✅ Benchmark report written to {path}"))
+        else:
+            self.stdout.write(output)
+
+    def prepare_dataset(self, size, options):
+        if size is None:
+            return 'current'
+        try:
+            dossiers = int(size)
+        except ValueError:
+            raise CommandError(f"Invalid dataset size: {size}")
+        users = options['users'] or max(10, dossiers // 100)
+        self.stderr.write(f"🔄 Generating dataset: {dossiers} dossiers, {users} users…")
+        call_command(
+            'seed_bulk',
+            dossiers=dossiers,
+            users=users,
+            documents_per_dossier=options['documents_per_dossier'],
+            seed=options['seed'],
+            stdout=self.stderr._out,
+        )
+        return str(dossiers)
+
+    def compare(self, baseline_path, candidate_path, threshold=None):
+        try:
+            baseline, candidate = load(baseline_path), load(candidate_path)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read report: {e}")
+
+        rows, regressions = compare(baseline, candidate, threshold)
+        if not rows:
+            raise CommandError("The two reports have no scenario/mode/dataset in common.")
+        self.stdout.write(format_comparison(rows))
+
+        if regressions:
+            self.stdout.write("")
+            self.stdout.write(self.style.ERROR(f"❌ {len(regressions)} regression(s):"))
+            for row in regressions:
+                self.stdout.write(
+                    f"   {row['scenario']} [{row['mode']}, {row['dataset']}] {row['metric']}: "
+                    f"{row['baseline']} → {row['candidate']}"
+                )
+            raise CommandError("Benchmark regressions detected.")
+        self.stdout.write(self.style.SUCCESS("✅ No regressions."))
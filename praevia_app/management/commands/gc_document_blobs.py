@@ -0,0 +1,49 @@
+# praevia_app/management/commands/gc_document_blobs.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from praevia_app.models import Document, StoredBlob
+from praevia_app.storage import BLOB_DIRECTORY, document_storage
+from praevia_app.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes the content-addressed document blobs no document points at, stray files under blobs/ and expired resumable uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None, help='Seconds a blob stays unused before it is deleted (default: settings.DOCUMENT_BLOB_GC_GRACE).')
+        parser.add_argument('--recount', action='store_true', help='Recompute the reference counts from the documents first.')
+        parser.add_argument('--adopt', action='store_true', help='Move the files of documents uploaded before the blob store into it (deduplicated).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        grace = options['grace'] if options['grace'] is not None else settings.DOCUMENT_BLOB_GC_GRACE
+        dry_run = options['dry_run']
+
+        if options['adopt'] and not dry_run:
+            legacy = Document.objects.filter(blob=None).exclude(Q(file='') | Q(file=None) | Q(file__startswith=f'{BLOB_DIRECTORY}/'))
+            adopted = missing = 0
+            for document in legacy.iterator():
+                if not document_storage.exists(document.file.name):
+                    missing += 1
+                    continue
+                StoredBlob.objects.adopt(document, document_storage)
+                adopted += 1
+            self.stdout.write(f"📥 {adopted} legacy file(s) moved into the blob store, {missing} missing on disk")
+
+        if options['recount'] and not dry_run:
+            fixed = StoredBlob.objects.recount()
+            self.stdout.write(f"🔢 {fixed} reference count(s) corrected")
+
+        if not dry_run:
+            expired = purge_expired()
+            self.stdout.write(f"⏳ {expired} expired resumable upload(s) discarded")
+
+        blobs, freed = StoredBlob.objects.collect_garbage(document_storage, grace, dry_run)
+        stray = StoredBlob.objects.sweep_stray_files(document_storage, grace, dry_run)
+        verb = 'would be deleted' if dry_run else 'deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {blobs} unreferenced blob(s) {verb} ({freed / 1024 / 1024:.1f} MB), {stray} stray file(s) {verb}"
+        ))
@@ -0,0 +1,68 @@
+# praevia_app/management/commands/import_dossiers.py
+
+import codecs
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+from praevia_app.importers import IMPORT_FORMATS, ImportFormatError, guess_format, import_dossiers, read_rows
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports dossiers AT/MP from an NDJSON or CSV file: rows are validated like the API, '
+        'inserted in batches with bulk_create, and rejected rows are reported with their line number.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--user', required=True, help='Email of the user recorded as creator of the dossiers.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None, help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (default: settings.IMPORT_BATCH_SIZE).')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, insert nothing.')
+        parser.add_argument('--report', help='Write the JSON import report (with every rejected row) to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(email=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}.")
+
+        import_format = options['format'] or guess_format(options['path'])
+        if import_format is None:
+            raise CommandError("Cannot tell the format from the file name, use --format.")
+
+        if options['path'] == '-':
+            source = codecs.getreader('utf-8-sig')(sys.stdin.buffer)
+        else:
+            try:
+                source = open(options['path'], encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(f"Cannot read {options['path']}: {e}")
+
+        self.stdout.write(f"🔄 Importing {options['path']} ({import_format}){' [dry run]' if options['dry_run'] else ''}…")
+        try:
+            with source:
+                report = import_dossiers(
+                    read_rows(source, import_format), user,
+                    batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+
+        for error in report['errors'][:20]:
+            self.stdout.write(self.style.WARNING(f"   line {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}"))
+        if len(report['errors']) > 20:
+            self.stdout.write(self.style.WARNING(f"   … and {len(report['errors']) - 20} more"))
+
+        if options['report']:
+            with open(options['report'], 'w') as report_file:
+                json.dump(report, report_file, indent=2, ensure_ascii=False)
+
+        verb = 'valid' if options['dry_run'] else 'imported'
+        summary = f"{report['created']}/{report['received']} rows {verb}, {report['failed']} rejected"
+        if report['failed']:
+            self.stdout.write(self.style.WARNING(f"⚠️  {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {summary}"))
@@ -0,0 +1,55 @@
+# praevia_app/management/commands/process_documents.py
+
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from praevia_app.processing import create_pool, drain_documents
+
+
+class Command(BaseCommand):
+    help = 'Analyzes the queued documents (real MIME type, page count, thumbnail, text) with a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes, 0 to analyze in this process (default: settings.DOCUMENT_PROCESSING_WORKERS).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Documents claimed per batch (default: settings.DOCUMENT_PROCESSING_BATCH_SIZE).')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before a document is marked FAILED (default: settings.DOCUMENT_PROCESSING_MAX_ATTEMPTS).')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the queue (worker mode).')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop (default: 5).')
+
+    def handle(self, *args, **options):
+        workers = settings.DOCUMENT_PROCESSING_WORKERS if options['workers'] is None else options['workers']
+        if not options['loop']:
+            done, failed = drain_documents(workers, options['batch_size'], options['max_attempts'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Documents processed: {done} done, {failed} failed"))
+            return
+
+        self.running = True
+        # Finish the current batch on SIGTERM (docker stop) instead of dying mid-analysis
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # One pool for the life of the worker: processes are spawned once, on the first document
+        pool = create_pool(workers) if workers else None
+        self.stdout.write(f"🗂️ Document worker started ({workers or 'no'} worker processes, polling every {options['interval']}s)")
+        try:
+            while self.running:
+                try:
+                    done, failed = drain_documents(workers, options['batch_size'], options['max_attempts'], pool=pool)
+                except BrokenProcessPool as e:
+                    self.stderr.write(f"⚠️ Worker process died, restarting the pool: {e}")
+                    pool.shutdown(cancel_futures=True)
+                    pool = create_pool(workers)
+                    continue
+                if done or failed:
+                    self.stdout.write(f"📄 {done} done, {failed} failed")
+                else:
+                    time.sleep(options['interval'])
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        self.stdout.write(self.style.SUCCESS("✅ Document worker stopped"))
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,16 @@
+# praevia_app/management/commands/purge_idempotency_keys.py
+
+from django.core.management.base import BaseCommand
+
+from praevia_app.services import AuditFinalizationService
+
+
+class Command(BaseCommand):
+    help = 'Deletes the stored Idempotency-Key responses older than their time to live.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None, help='Seconds a key is kept (default: settings.IDEMPOTENCY_KEY_TTL).')
+
+    def handle(self, *args, **options):
+        deleted = AuditFinalizationService.purge_expired_keys(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(f"✅ {deleted} expired idempotency key(s) deleted"))
@@ -0,0 +1,14 @@
+# praevia_app/management/commands/rebuild_dashboard_stats.py
+
+from django.core.management.base import BaseCommand
+
+from praevia_app.dashboard import rebuild_dashboard_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the DashboardSnapshot counters from the dossier, audit, contentieux and juridiction step tables.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Rebuilding dashboard statistics…")
+        buckets = rebuild_dashboard_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"✅ Dashboard statistics rebuilt ({buckets} buckets)"))
@@ -0,0 +1,349 @@
+# praevia_app/management/commands/seed_bulk.py
+
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from praevia_app.dashboard import rebuild_dashboard_snapshot, snapshot_maintenance_paused
+from praevia_app.models import (
+    DossierATMP, DossierStatus,
+    Contentieux, ContentieuxStatus,
+    Document, DocumentType,
+    Audit, AuditStatus, AuditDecision,
+    JuridictionStep, JuridictionType,
+    Temoin,
+    Tiers
+)
+from users.models import CustomUser as User, UserRole
+
+
+BULK_EMAIL_DOMAIN = 'bulk.example.com'
+BULK_PASSWORD = 'bulk123'
+
+# Dates are drawn back from a fixed day so that a given --seed always
+# produces the same dataset, whenever it is run.
+ANCHOR_DATE = date(2025, 6, 30)
+HISTORY_DAYS = 3 * 365
+
+FIRST_NAMES = (
+    'Jean', 'Marie', 'Pierre', 'Nathalie', 'Michel', 'Isabelle', 'Philippe', 'Sylvie', 'Alain', 'Catherine',
+    'Nicolas', 'Sophie', 'Julien', 'Camille', 'Thomas', 'Julie', 'Karim', 'Fatima', 'Mamadou', 'Aïcha',
+)
+LAST_NAMES = (
+    'Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+    'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier',
+    'Morel', 'Girard', 'André', 'Mercier', 'Dupont', 'Lambert', 'Bonnet', 'François', 'Martinez', 'Legrand',
+)
+CITIES = ('Paris', 'Lyon', 'Marseille', 'Toulouse', 'Lille', 'Nantes', 'Bordeaux', 'Strasbourg', 'Rennes', 'Nice')
+SITES = ('Siège social', 'Entrepôt', 'Atelier', 'Chantier', 'Agence', 'Usine', 'Magasin', 'Parking')
+JOB_TITLES = ('Technicien', 'Cariste', 'Magasinier', 'Opérateur', 'Chef d\'équipe', 'Comptable', 'Vendeur', 'Chauffeur')
+ACCIDENTS = (
+    ('Chute de plain-pied', 'Glissade sur un sol mouillé'),
+    ('Chute de hauteur', 'Chute depuis un escabeau'),
+    ('Manutention', 'Douleur lombaire en soulevant une charge'),
+    ('Chute d\'objet', 'Chute d\'un carton lourd sur le pied'),
+    ('Coupure', 'Coupure à la main avec un cutter'),
+    ('Accident de trajet', 'Collision en se rendant sur le lieu de travail'),
+    ('Maladie professionnelle', 'Troubles musculo-squelettiques du poignet'),
+)
+INSURERS = ('Axa Assurance', 'Allianz', 'MAIF', 'MACIF', 'Groupama', 'Generali')
+
+# Share of employees among generated users; the rest is spread over the other roles
+ROLE_WEIGHTS = (
+    (UserRole.EMPLOYEE, 85),
+    (UserRole.SAFETY_MANAGER, 5),
+    (UserRole.MANAGER, 4),
+    (UserRole.RH, 2),
+    (UserRole.JURISTE, 2),
+    (UserRole.QSE, 1),
+    (UserRole.DIRECTION, 1),
+)
+DOCUMENT_TYPES = [choice for choice, _ in DocumentType.choices]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a large, reproducible dataset (users, dossiers with audits, contentieux, '
+        'témoins, tiers and documents) with bulk_create, for load and scaling benchmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dossiers', type=int, default=1000, help='Number of DossierATMP to create (default: 1000).')
+        parser.add_argument('--users', type=int, default=100, help='Number of users to create (default: 100).')
+        parser.add_argument('--documents-per-dossier', type=int, default=3, help='Documents attached to each dossier (default: 3).')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same dataset (default: 42).')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Dossiers per bulk_create batch and transaction (default: 2000).')
+        parser.add_argument('--no-clear', action='store_true', help=f"Keep the data of a previous run (users @{BULK_EMAIL_DOMAIN}).")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['dossiers'] < 0 or options['documents_per_dossier'] < 0:
+            raise CommandError("--users must be at least 1, --dossiers and --documents-per-dossier cannot be negative.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        self.rng = random.Random(options['seed'])
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.documents_per_dossier = options['documents_per_dossier']
+        started = time.perf_counter()
+
+        self.stdout.write(
+            f"🔄 Bulk seeding {options['dossiers']} dossiers and {options['users']} users (seed={self.seed})…"
+        )
+        with snapshot_maintenance_paused():
+            if not options['no_clear']:
+                self.clear()
+            self.seed_dataset(options)
+
+        buckets = rebuild_dashboard_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"✅ Dashboard statistics rebuilt ({buckets} buckets)"))
+        self.stdout.write(self.style.SUCCESS(
+            f"🎉 Bulk seeding complete in {time.perf_counter() - started:.1f}s! "
+            f"Users log in with password '{BULK_PASSWORD}'."
+        ))
+
+    def seed_dataset(self, options):
+        """Users first, then dossiers batch by batch, each batch in its own transaction."""
+        users = self.create_users(options['users'])
+        self.employees = [user for user in users if user.role == UserRole.EMPLOYEE] or users
+        self.safety_managers = [user for user in users if user.role == UserRole.SAFETY_MANAGER] or users
+        self.uploaders = users
+        self.companies = self.build_companies(max(1, options['users'] // 50))
+
+        created = 0
+        for start in range(0, options['dossiers'], self.batch_size):
+            count = min(self.batch_size, options['dossiers'] - start)
+            with transaction.atomic():
+                self.create_batch(start, count)
+            created += count
+            self.stdout.write(f"   … {created}/{options['dossiers']} dossiers")
+
+    # ─── Cleanup ──────────────────────────────────────────────────
+
+    def clear(self):
+        """Deletes the users of a previous run and everything attached to them, batch by batch."""
+        users = User.objects.filter(email__endswith=f"@{BULK_EMAIL_DOMAIN}")
+        dossiers = DossierATMP.objects.filter(created_by__in=users)
+        deleted = 0
+        while True:
+            pks = list(dossiers.values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                Document.objects.filter(dossier_atmp_documents__in=pks).delete()
+                DossierATMP.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+        Document.objects.filter(uploaded_by__in=users).delete()
+        count_users = users.count()
+        users.delete()
+        self.stdout.write(f"🗑️  Cleared {deleted} dossiers and {count_users} users from a previous bulk seed.")
+
+    # ─── Users & reference data ───────────────────────────────────
+
+    def create_users(self, count):
+        roles = [role for role, _ in ROLE_WEIGHTS]
+        weights = [weight for _, weight in ROLE_WEIGHTS]
+        # Hashing is deliberately slow: hash once and share it
+        password = make_password(BULK_PASSWORD)
+        users = []
+        for i in range(count):
+            first_name = self.rng.choice(FIRST_NAMES)
+            last_name = self.rng.choice(LAST_NAMES)
+            # The first users cover every role, so each dashboard has someone to log in with
+            role = roles[i] if i < len(roles) else self.rng.choices(roles, weights)[0]
+            users.append(User(
+                email=f"user{i:06d}@{BULK_EMAIL_DOMAIN}",
+                password=password,
+                name=f"{first_name} {last_name}",
+                first_name=first_name,
+                last_name=last_name,
+                role=role,
+                is_staff=role != UserRole.EMPLOYEE,
+                is_seeded=True,
+            ))
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        self.stdout.write(self.style.SUCCESS(f"✅ {len(users)} users created"))
+        return users
+
+    def build_companies(self, count):
+        companies = []
+        for i in range(count):
+            city = self.rng.choice(CITIES)
+            companies.append({
+                'name': f"Entreprise {self.rng.choice(LAST_NAMES)} {i}",
+                'siret': f"{self.rng.randrange(10 ** 13, 10 ** 14)}",
+                'address': f"{self.rng.randint(1, 200)} Rue {self.rng.choice(LAST_NAMES)}, {city}",
+                'numeroRisque': f"{self.rng.randint(100, 999)}{self.rng.choice('ABCDEFGH')}{self.rng.choice('ABCDEFGH')}",
+                'city': city,
+            })
+        return companies
+
+    # ─── Dossier graphs ───────────────────────────────────────────
+
+    def dossier_rng(self, index):
+        # One generator per dossier: the output does not depend on --batch-size
+        return random.Random(f"{self.seed}-{index}")
+
+    @staticmethod
+    def random_moment(rng, day):
+        moment = datetime.combine(day, dt_time(rng.randint(6, 19), rng.randrange(0, 60)))
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+    def create_batch(self, start, count):
+        """
+        Builds the graphs of dossiers start..start+count in memory, then
+        writes them with one bulk_create per table. Children point at their
+        (still unsaved) parents; bulk_create fills in the foreign keys once
+        the parents have their primary keys.
+        """
+        dossiers, audits, contentieux_list = [], [], []
+        temoins, tiers, steps, documents = [], [], [], []
+        dossier_links, contentieux_links = [], []
+
+        for i in range(start, start + count):
+            rng = self.dossier_rng(i)
+            incident_day = ANCHOR_DATE - timedelta(days=rng.randrange(HISTORY_DAYS))
+            company = rng.choice(self.companies)
+            accident_type, circumstances = rng.choice(ACCIDENTS)
+            first_name = rng.choice(FIRST_NAMES)
+            last_name = rng.choice(LAST_NAMES)
+            birth_year = rng.randint(1960, 2004)
+
+            # Lifecycle: not audited yet → audit in progress → closed or contested
+            stage = rng.choices(('new', 'auditing', 'closed', 'contested'), (20, 25, 35, 20))[0]
+            status = {
+                'new': DossierStatus.A_ANALYSER,
+                'auditing': DossierStatus.ANALYSE_EN_COURS,
+                'closed': DossierStatus.CLOTURE_SANS_SUITE,
+                'contested': DossierStatus.TRANSFORME_EN_CONTENTIEUX,
+            }[stage]
+
+            dossier = DossierATMP(
+                reference=f"ATMP-BULK{self.seed}-{i:08d}",
+                safety_manager=rng.choice(self.safety_managers),
+                created_by=rng.choice(self.employees),
+                title=accident_type,
+                description=circumstances,
+                date_of_incident=incident_day,
+                location=f"{rng.choice(SITES)}, {company['city']}",
+                status=status,
+                entreprise={key: value for key, value in company.items() if key != 'city'},
+                salarie={
+                    'first_name': first_name,
+                    'last_name': last_name,
+                    'social_security_number': (
+                        f"{rng.randint(1, 2)}{birth_year % 100:02d}{rng.randint(1, 12):02d}"
+                        f"{rng.randrange(10 ** 10):010d}"
+                    ),
+                    'date_of_birth': f"{birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                    'job_title': rng.choice(JOB_TITLES),
+                },
+                accident={
+                    'date': incident_day.isoformat(),
+                    'time': f"{rng.randint(6, 19):02d}:{rng.randrange(0, 60, 5):02d}",
+                    'description': circumstances,
+                    'type_of_accident': accident_type,
+                    'detailed_circumstances': circumstances,
+                },
+                tiers_implique=None,
+                service_sante='Service de Santé au Travail',
+            )
+            # bulk_create skips save(): fill search_document and the other derived columns
+            dossier.prepare_for_save()
+            dossiers.append(dossier)
+
+            if stage != 'new':
+                started_at = self.random_moment(rng, incident_day + timedelta(days=rng.randint(1, 10)))
+                completed = stage in ('closed', 'contested')
+                audits.append(Audit(
+                    dossier_atmp=dossier,
+                    auditor=dossier.safety_manager,
+                    status=AuditStatus.COMPLETED if completed else AuditStatus.IN_PROGRESS,
+                    decision=(
+                        AuditDecision.CONTEST if stage == 'contested'
+                        else AuditDecision.DO_NOT_CONTEST if completed else None
+                    ),
+                    comments='Audit généré automatiquement.',
+                    started_at=started_at,
+                    completed_at=started_at + timedelta(days=rng.randint(1, 30)) if completed else None,
+                ))
+
+            contentieux = None
+            if stage == 'contested':
+                contentieux = Contentieux(
+                    dossier_atmp=dossier,
+                    reference=f"CTX-BULK{self.seed}-{i:08d}",
+                    subject={
+                        'title': f"Contentieux {dossier.reference}",
+                        'description': f"Initiated after audit of {dossier.reference}",
+                    },
+                    status=rng.choice((ContentieuxStatus.DRAFT, ContentieuxStatus.EN_COURS, ContentieuxStatus.CLOTURE)),
+                )
+                contentieux_list.append(contentieux)
+
+                submitted_at = self.random_moment(rng, incident_day + timedelta(days=rng.randint(30, 90)))
+                for juridiction in list(JuridictionType)[:rng.randint(0, 2)]:
+                    decided = rng.random() < 0.6
+                    steps.append(JuridictionStep(
+                        contentieux=contentieux,
+                        juridiction=juridiction,
+                        submitted_at=submitted_at,
+                        decision=rng.choice(('FAVORABLE', 'DEFAVORABLE')) if decided else None,
+                        decision_at=submitted_at + timedelta(days=rng.randint(30, 240)) if decided else None,
+                    ))
+                    submitted_at += timedelta(days=rng.randint(60, 300))
+
+            for _ in range(rng.choices((0, 1, 2, 3), (30, 40, 20, 10))[0]):
+                temoins.append(Temoin(
+                    dossier_atmp=dossier,
+                    nom=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    coordonnees=f"06{rng.randrange(10 ** 8):08d}",
+                ))
+
+            if rng.random() < 0.15:
+                tiers.append(Tiers(
+                    dossier_atmp=dossier,
+                    nom=f"Société {rng.choice(LAST_NAMES)}",
+                    adresse=f"{rng.randint(1, 200)} Avenue {rng.choice(LAST_NAMES)}, {rng.choice(CITIES)}",
+                    assurance=rng.choice(INSURERS),
+                    immatriculation=f"FR{rng.randrange(10 ** 9):09d}",
+                ))
+
+            for n in range(self.documents_per_dossier):
+                document_type = rng.choice(DOCUMENT_TYPES)
+                document = Document(
+                    contentieux=contentieux,
+                    uploaded_by=rng.choice(self.uploaders),
+                    document_type=document_type,
+                    original_name=f"{document_type}_{dossier.reference}_{n + 1}.pdf",
+                    mime_type='application/pdf',
+                    size=rng.randint(20_000, 5_000_000),
+                )
+                documents.append(document)
+                dossier_links.append((dossier, document))
+                if contentieux is not None:
+                    contentieux_links.append((contentieux, document))
+
+        DossierATMP.objects.bulk_create(dossiers)
+        Audit.objects.bulk_create(audits)
+        Contentieux.objects.bulk_create(contentieux_list)
+        JuridictionStep.objects.bulk_create(steps)
+        Temoin.objects.bulk_create(temoins)
+        Tiers.objects.bulk_create(tiers)
+        Document.objects.bulk_create(documents)
+
+        # M2M rows go straight into the through tables
+        DossierDocuments = DossierATMP.documents.through
+        ContentieuxDocuments = Contentieux.documents.through
+        DossierDocuments.objects.bulk_create([
+            DossierDocuments(dossieratmp_id=dossier.pk, document_id=document.pk)
+            for dossier, document in dossier_links
+        ])
+        ContentieuxDocuments.objects.bulk_create([
+            ContentieuxDocuments(contentieux_id=contentieux.pk, document_id=document.pk)
+            for contentieux, document in contentieux_links
+        ])
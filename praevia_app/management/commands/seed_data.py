@@ -203,7 +203,6 @@ class Command(BaseCommand):
                     'description': f"Initiated after audit of {dossier.reference}"
                 },
                 status=ContentieuxStatus.DRAFT,
-                juridiction_steps={}
             )
             self.stdout.write(self.style.SUCCESS(f"✅ Contentieux {content.reference}"))
 
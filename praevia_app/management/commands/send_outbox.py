@@ -0,0 +1,39 @@
+# praevia_app/management/commands/send_outbox.py
+
+import signal
+import time
+from django.core.management.base import BaseCommand
+
+from praevia_app.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued OutboundEmail rows in batches over one SMTP connection per batch, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per batch (default: settings.OUTBOX_BATCH_SIZE).')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before an email is marked FAILED (default: settings.OUTBOX_MAX_ATTEMPTS).')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll the outbox (worker mode).')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop (default: 5).')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            sent, failed = drain_outbox(options['batch_size'], options['max_attempts'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Outbox drained: {sent} sent, {failed} failed"))
+            return
+
+        self.running = True
+        # Finish the current batch on SIGTERM (docker stop) instead of dying mid-send
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(f"📬 Outbox worker started (polling every {options['interval']}s)")
+        while self.running:
+            sent, failed = drain_outbox(options['batch_size'], options['max_attempts'])
+            if sent or failed:
+                self.stdout.write(f"📨 {sent} sent, {failed} failed")
+            else:
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS("✅ Outbox worker stopped"))
+
+    def stop(self, signum, frame):
+        self.running = False
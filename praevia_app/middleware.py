@@ -0,0 +1,104 @@
+# /home/siisi/atmp/praevia_app/middleware.py
+
+import logging
+import time
+from collections import Counter
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('praevia_app.queries')
+
+
+class QueryRecorder:
+    """
+    Records every SQL statement run on the default connection while active,
+    with its duration. Used by QueryInstrumentationMiddleware and by the
+    query budget tests.
+
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.total_time, recorder.duplicates
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+        self._wrapper = None
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        """Total time spent in the database, in seconds."""
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """
+        {sql: times} for statements run more than once. The SQL is taken
+        before parameter binding, so N+1 loops show up as one signature.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: times for sql, times in counts.items() if times > 1}
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Adds per-request database metrics as a Server-Timing header
+    (visible in the browser dev tools) and as one log line on the
+    'praevia_app.queries' logger:
+
+        Server-Timing: db;dur=4.21;desc="7 queries, 2 duplicated", app;dur=18.90
+
+    Enabled by settings.QUERY_INSTRUMENTATION.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.duplicate_threshold = getattr(settings, 'QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        duplicated = sum(recorder.duplicates.values())
+        response['Server-Timing'] = (
+            f'db;dur={recorder.total_time * 1000:.2f};desc="{recorder.count} queries, {duplicated} duplicated", '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+
+        level = logging.WARNING if duplicated >= self.duplicate_threshold else logging.INFO
+        logger.log(
+            level,
+            f"method={request.method} path={request.path} status={response.status_code} "
+            f"queries={recorder.count} db_ms={recorder.total_time * 1000:.2f} "
+            f"duplicated={duplicated} total_ms={elapsed * 1000:.2f}",
+            extra={
+                'queries': recorder.count,
+                'db_time': recorder.total_time,
+                'duplicate_signatures': recorder.duplicates,
+            },
+        )
+        return response
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Frozen copy of praevia_app.dashboard.SNAPSHOT_DIMENSIONS at the time of this migration
+SNAPSHOT_DIMENSIONS = {
+    'DossierATMP': ('status', 'location', 'created_by__role', 'safety_manager__email'),
+    'Contentieux': ('status',),
+    'Audit': ('status', 'decision'),
+    'JuridictionStep': ('juridiction', 'decision'),
+}
+
+
+def populate_dashboard_snapshot(apps, schema_editor):
+    DashboardSnapshot = apps.get_model('praevia_app', 'DashboardSnapshot')
+    buckets = []
+    for model_name, fields in SNAPSHOT_DIMENSIONS.items():
+        model = apps.get_model('praevia_app', model_name)
+        for field in fields:
+            for row in model.objects.values(field).annotate(count=Count('id')).order_by():
+                buckets.append(DashboardSnapshot(
+                    dimension=f"{model._meta.model_name}.{field}",
+                    value='' if row[field] is None else str(row[field]),
+                    count=row['count'],
+                ))
+    DashboardSnapshot.objects.bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0008_alter_dossieratmp_safety_manager'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=100)),
+                ('value', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dashboard Snapshot',
+                'verbose_name_plural': 'Dashboard Snapshots',
+                'ordering': ['dimension', 'value'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value'), name='unique_dashboard_snapshot_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_dashboard_snapshot, migrations.RunPython.noop),
+    ]
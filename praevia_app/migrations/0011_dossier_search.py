@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+from praevia_app.search import (
+    SEARCH_FIELDS, SEARCH_JSON_KEYS, build_search_document, install_search_index, uninstall_search_index
+)
+
+
+BATCH_SIZE = 1000
+
+
+def populate_search_document(apps, schema_editor):
+    DossierATMP = apps.get_model('praevia_app', 'DossierATMP')
+    dossiers = DossierATMP.objects.only('id', *SEARCH_FIELDS, *SEARCH_JSON_KEYS).order_by('id')
+    last_id = 0
+    while batch := list(dossiers.filter(id__gt=last_id)[:BATCH_SIZE]):
+        for dossier in batch:
+            dossier.search_document = build_search_document(dossier)
+        DossierATMP.objects.bulk_update(batch, ['search_document'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0010_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dossieratmp',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_document, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
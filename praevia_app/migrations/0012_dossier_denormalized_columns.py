@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+from praevia_app.denormalized import denormalized_columns
+
+
+BATCH_SIZE = 1000
+COLUMNS = ['siret', 'salarie_last_name', 'salarie_nss_hash', 'accident_date']
+
+
+def populate_denormalized_columns(apps, schema_editor):
+    DossierATMP = apps.get_model('praevia_app', 'DossierATMP')
+    dossiers = DossierATMP.objects.only('id', 'entreprise', 'salarie', 'accident').order_by('id')
+    last_id = 0
+    while batch := list(dossiers.filter(id__gt=last_id)[:BATCH_SIZE]):
+        for dossier in batch:
+            for field, value in denormalized_columns(dossier.entreprise, dossier.salarie, dossier.accident).items():
+                setattr(dossier, field, value)
+        DossierATMP.objects.bulk_update(batch, COLUMNS)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0011_dossier_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dossieratmp',
+            name='accident_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dossieratmp',
+            name='salarie_last_name',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='dossieratmp',
+            name='salarie_nss_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='dossieratmp',
+            name='siret',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=14),
+        ),
+        migrations.RunPython(populate_denormalized_columns, migrations.RunPython.noop),
+    ]
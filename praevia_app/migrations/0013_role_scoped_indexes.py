@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0012_dossier_denormalized_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audit',
+            index=models.Index(fields=['-created_at', '-id'], name='audit_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audit',
+            index=models.Index(fields=['auditor', '-created_at', '-id'], name='audit_auditor_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audit',
+            index=models.Index(fields=['status'], name='audit_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audit',
+            index=models.Index(fields=['decision'], name='audit_decision_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audit',
+            index=models.Index(condition=models.Q(('status__in', ('NOT_STARTED', 'IN_PROGRESS'))), fields=['-created_at', '-id'], name='audit_open_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentieux',
+            index=models.Index(fields=['-created_at', '-id'], name='contentieux_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentieux',
+            index=models.Index(fields=['status'], name='contentieux_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contentieux',
+            index=models.Index(condition=models.Q(('status__in', ('DRAFT', 'EN_COURS'))), fields=['-created_at', '-id'], name='contentieux_open_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['-created_at', '-id'], name='document_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['uploaded_by', '-created_at', '-id'], name='document_uploader_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(fields=['-created_at', '-id'], name='dossier_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(fields=['created_by', '-created_at', '-id'], name='dossier_creator_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(fields=['safety_manager', '-created_at', '-id'], name='dossier_manager_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(fields=['status'], name='dossier_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(fields=['location'], name='dossier_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dossieratmp',
+            index=models.Index(condition=models.Q(('status__in', ('A_ANALYSER', 'ANALYSE_EN_COURS', 'CONTESTATION_RECOMMANDEE'))), fields=['-created_at', '-id'], name='dossier_open_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0013_role_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Reference Counter',
+                'verbose_name_plural': 'Reference Counters',
+                'ordering': ['prefix', 'day'],
+                'constraints': [models.UniqueConstraint(fields=('prefix', 'day'), name='unique_reference_counter_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:05
+
+from collections import Counter
+from datetime import date, datetime, time
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+BATCH_SIZE = 500
+
+
+def step_order(key):
+    # 'step2' before 'step10'; unexpected keys last
+    number = key[4:]
+    return (0, int(number), key) if key.startswith('step') and number.isdigit() else (1, 0, key)
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def steps_from_json(apps, schema_editor):
+    """Turns the juridiction_steps dict of every contentieux into JuridictionStep rows."""
+    Contentieux = apps.get_model('praevia_app', 'Contentieux')
+    JuridictionStep = apps.get_model('praevia_app', 'JuridictionStep')
+    DashboardSnapshot = apps.get_model('praevia_app', 'DashboardSnapshot')
+    juridictions = {choice for choice, _ in JuridictionStep._meta.get_field('juridiction').choices}
+
+    contentieux = Contentieux.objects.only('id', 'juridiction_steps', 'created_at').order_by('id')
+    buckets = Counter()
+    last_id = 0
+    while batch := list(contentieux.filter(id__gt=last_id)[:BATCH_SIZE]):
+        # Steps already stored as rows (written by both sides before, or a re-applied migration) are not copied twice
+        existing = {
+            (step.contentieux_id, step.juridiction, timezone.localtime(step.submitted_at).date())
+            for step in JuridictionStep.objects.filter(contentieux__in=batch)
+        }
+        steps = []
+        for item in batch:
+            data = item.juridiction_steps if isinstance(item.juridiction_steps, dict) else {}
+            for key in sorted(data, key=step_order):
+                step = data[key] if isinstance(data[key], dict) else {}
+                day = parse_day(step.get('date'))
+                juridiction = step.get('type') if step.get('type') in juridictions else None
+                # Dates had no time: midnight, local time; undated steps take the contentieux creation
+                submitted_at = timezone.make_aware(datetime.combine(day, time.min)) if day else item.created_at
+                if (item.id, juridiction, timezone.localtime(submitted_at).date()) in existing:
+                    continue
+                notes = step.get('notes') or None
+                if step.get('type') and juridiction is None:
+                    # Unknown juridiction types are kept in the notes rather than lost
+                    notes = f"{step['type']}: {notes}" if notes else step['type']
+                steps.append(JuridictionStep(
+                    contentieux_id=item.id, juridiction=juridiction, submitted_at=submitted_at, notes=notes,
+                ))
+                buckets[('juridictionstep.juridiction', juridiction or '')] += 1
+                buckets[('juridictionstep.decision', '')] += 1
+        JuridictionStep.objects.bulk_create(steps)
+        last_id = batch[-1].id
+
+    # bulk_create sends no signals: count the new rows in the dashboard snapshot
+    for (dimension, value), count in buckets.items():
+        DashboardSnapshot.objects.get_or_create(dimension=dimension, value=value)
+        DashboardSnapshot.objects.filter(dimension=dimension, value=value).update(count=F('count') + count)
+
+
+def steps_to_json(apps, schema_editor):
+    Contentieux = apps.get_model('praevia_app', 'Contentieux')
+    JuridictionStep = apps.get_model('praevia_app', 'JuridictionStep')
+
+    contentieux = Contentieux.objects.only('id').order_by('id')
+    last_id = 0
+    while batch := list(contentieux.filter(id__gt=last_id)[:BATCH_SIZE]):
+        timelines = {item.id: {} for item in batch}
+        steps = JuridictionStep.objects.filter(contentieux__in=batch).order_by('contentieux', 'submitted_at', 'id')
+        for step in steps:
+            timeline = timelines[step.contentieux_id]
+            timeline[f'step{len(timeline) + 1}'] = {
+                'type': step.juridiction or '',
+                'date': timezone.localtime(step.submitted_at).date().isoformat(),
+                'notes': step.notes or '',
+            }
+        for item in batch:
+            item.juridiction_steps = timelines[item.id]
+        Contentieux.objects.bulk_update(batch, ['juridiction_steps'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0015_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='juridictionstep',
+            options={'ordering': ['submitted_at', 'id'], 'verbose_name': 'Juridiction Step', 'verbose_name_plural': 'Juridiction Steps'},
+        ),
+        migrations.AddIndex(
+            model_name='juridictionstep',
+            index=models.Index(fields=['contentieux', 'submitted_at'], name='juridiction_step_timeline_idx'),
+        ),
+        migrations.RunPython(steps_from_json, steps_to_json),
+        migrations.RemoveField(
+            model_name='contentieux',
+            name='juridiction_steps',
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:01
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0017_content_addressed_documents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('document_type', models.CharField(blank=True, choices=[('DAT', 'DAT'), ('CERTIFICAT_MEDICAL', 'Certificat Médical'), ('ARRET_TRAVAIL', 'Arrêt de Travail'), ('TEMOIGNAGE', 'Témoignage'), ('DECISION_CPAM', 'Décision CPAM'), ('EXPERTISE_MEDICALE', 'Expertise Médicale'), ('LETTRE_RESERVE', 'Lettre de Réserve'), ('CONTRAT_TRAVAIL', 'Contrat de Travail'), ('FICHE_POSTE', 'Fiche de Poste'), ('RAPPORT_ENQUETE', 'Rapport d’Enquête'), ('NOTIFICATION_TAUX', 'Notification de Taux'), ('COURRIER', 'Courrier'), ('AUTRE', 'Autre')], max_length=50, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('length', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('contentieux', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='praevia_app.contentieux')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Upload Session',
+                'verbose_name_plural': 'Upload Sessions',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
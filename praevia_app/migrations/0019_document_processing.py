@@ -0,0 +1,74 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def queue_existing_documents(apps, schema_editor):
+    # Documents uploaded before the pipeline are analyzed by the first run of process_documents
+    Document = apps.get_model('praevia_app', 'Document')
+    Document.objects.exclude(file='').exclude(file__isnull=True).update(
+        processing_status='PENDING', processing_due_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0018_upload_session'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='detected_mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_attempts',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_due_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_error',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('DONE', 'Done'), ('FAILED', 'Failed')], editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_content',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('processing_status__in', ['PENDING', 'PROCESSING'])), fields=['processing_due_at', 'id'], name='document_processing_due_idx'),
+        ),
+        migrations.RunPython(queue_existing_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:41
+
+from django.db import migrations
+
+from praevia_app.search import install_document_search_index, uninstall_document_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0020_idempotency_key_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_document_search_index, uninstall_document_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0021_document_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:02
+
+from django.db import migrations
+
+from praevia_app.search import reinstall_postgresql_search_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('praevia_app', '0022_document_size_bigint'),
+    ]
+
+    operations = [
+        # PostgreSQL only: the columns generated with the plain french configuration are
+        # regenerated with the unaccented one (SQLite's FTS5 tables already ignore accents)
+        migrations.RunPython(reinstall_postgresql_search_indexes, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,11 @@ from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 
+from .denormalized import denormalized_columns
+from .references import CONTENTIEUX_REFERENCE_PREFIX, DOSSIER_REFERENCE_PREFIX, ReferenceCounterManager
+from .search import build_search_document
+from .storage import StoredBlobManager, document_storage
+
 User = get_user_model()
 
 
@@ -61,6 +66,29 @@ class DocumentType(models.TextChoices):
     COURRIER = 'COURRIER', 'Courrier'
     AUTRE = 'AUTRE', 'Autre'
 
+class OutboundEmailStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    SENDING = 'SENDING', 'Sending'
+    SENT = 'SENT', 'Sent'
+    FAILED = 'FAILED', 'Failed'
+
+
+class DocumentProcessingStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    PROCESSING = 'PROCESSING', 'Processing'
+    DONE = 'DONE', 'Done'
+    FAILED = 'FAILED', 'Failed'
+
+
+# Statuses still awaiting work, covered by the partial "open" indexes below
+OPEN_DOSSIER_STATUSES = (
+    DossierStatus.A_ANALYSER,
+    DossierStatus.ANALYSE_EN_COURS,
+    DossierStatus.CONTESTATION_RECOMMANDEE,
+)
+OPEN_CONTENTIEUX_STATUSES = (ContentieuxStatus.DRAFT, ContentieuxStatus.EN_COURS)
+OPEN_AUDIT_STATUSES = (AuditStatus.NOT_STARTED, AuditStatus.IN_PROGRESS)
+
 # ---------------------------- #
 #           Models            #
 # ---------------------------- #
@@ -80,15 +108,59 @@ class Action(models.Model):
         return self.name
 
 
+class StoredBlob(models.Model):
+    """
+    One file of the content-addressed document store (see storage.py),
+    shared by every Document with the same bytes. `ref_count` is the number
+    of documents pointing at it, kept by the signal handlers in signals.py;
+    blobs back at 0 are deleted by the `gc_document_blobs` command.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StoredBlobManager()
+
+    class Meta:
+        verbose_name = 'Stored Blob'
+        verbose_name_plural = 'Stored Blobs'
+        indexes = [
+            # The garbage collector's candidates
+            models.Index(fields=['updated_at'], name='stored_blob_orphan_idx', condition=models.Q(ref_count=0)),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]}… ({self.ref_count} refs)"
+
+
 class Document(models.Model):
     contentieux = models.ForeignKey('Contentieux', on_delete=models.CASCADE, related_name='document_set', null=True, blank=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploaded_documents')
     document_type = models.CharField(max_length=50, choices=DocumentType.choices, null=True, blank=True)
     original_name = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to='documents/%Y/%m/%d/', blank=True, null=True)
+    # upload_to only names legacy files: new uploads are stored once per content under blobs/
+    file = models.FileField(upload_to='documents/%Y/%m/%d/', storage=document_storage, blank=True, null=True)
+    # PROTECT: a blob cannot be collected while a document points at it
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, related_name='documents', null=True, blank=True)
     mime_type = models.CharField(max_length=100, blank=True, null=True)
-    size = models.PositiveIntegerField(null=True, blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+
+    # Filled from the file's content by the `process_documents` worker (see processing.py)
+    processing_status = models.CharField(max_length=20, choices=DocumentProcessingStatus.choices, null=True, blank=True, editable=False)
+    processing_attempts = models.PositiveIntegerField(default=0, editable=False)
+    # Retry time for PENDING rows, lease expiry for PROCESSING rows
+    processing_due_at = models.DateTimeField(null=True, blank=True, editable=False)
+    processing_error = models.TextField(blank=True, null=True, editable=False)
+    processed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    detected_mime_type = models.CharField(max_length=100, blank=True, null=True, editable=False)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnail = models.ImageField(upload_to='thumbnails/', blank=True, null=True, editable=False)
+    text_content = models.TextField(blank=True, default='', editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -96,6 +168,15 @@ class Document(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Document'
         verbose_name_plural = 'Documents'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='document_recent_idx'),
+            models.Index(fields=['uploaded_by', '-created_at', '-id'], name='document_uploader_recent_idx'),
+            # The processing queue: only the rows still to process are indexed
+            models.Index(
+                fields=['processing_due_at', 'id'], name='document_processing_due_idx',
+                condition=models.Q(processing_status__in=[DocumentProcessingStatus.PENDING, DocumentProcessingStatus.PROCESSING]),
+            ),
+        ]
 
     def __str__(self):
         # Provide a fallback if original_name is null
@@ -112,13 +193,35 @@ class Document(models.Model):
             if not self.size:
                 self.size = self.file.size
 
+            if not self.file._committed:
+                # Stored before the row (instead of in the field's pre_save) to link the row to its blob
+                self.file.save(self.file.name, self.file.file, save=False)
+                self.blob = StoredBlob.objects.for_file(self.file.name, self.file.size)
+                self.queue_processing()
+            elif self._state.adding:
+                self.queue_processing()
+
         else:
             self.original_name = None
             self.mime_type = None
             self.size = None
-            
+            self.blob = None
+            self.processing_status = None
+            self.processing_due_at = None
+
         super().save(*args, **kwargs)
 
+    def queue_processing(self):
+        """
+        Marks the document for the `process_documents` worker. Only a
+        column of the row: the worker sees it once the transaction saving
+        the document has committed.
+        """
+        self.processing_status = DocumentProcessingStatus.PENDING
+        self.processing_due_at = timezone.now()
+        self.processing_attempts = 0
+        self.processing_error = None
+
 
 class DossierATMP(models.Model):
     reference = models.CharField(max_length=255, unique=True, blank=True)
@@ -140,6 +243,16 @@ class DossierATMP(models.Model):
 
     documents = models.ManyToManyField(Document, related_name='dossier_atmp_documents', blank=True)
 
+    # Indexed copies of JSON keys, for filtering (see denormalized.py)
+    siret = models.CharField(max_length=14, blank=True, default='', db_index=True, editable=False)
+    salarie_last_name = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    salarie_nss_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)
+    accident_date = models.DateField(blank=True, null=True, db_index=True, editable=False)
+
+    # Denormalized text of the dossier and its JSON fields, indexed for ?q=
+    # (tsvector + GIN on PostgreSQL, FTS5 on SQLite, see search.py)
+    search_document = models.TextField(blank=True, default='', editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -147,11 +260,37 @@ class DossierATMP(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Dossier AT/MP'
         verbose_name_plural = 'Dossiers AT/MP'
+        # Lists are scoped by role (created_by for employees, safety_manager
+        # for safety managers) and ordered like KeysetPagination: the
+        # composite indexes serve the filter and the ORDER BY ... LIMIT.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='dossier_recent_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='dossier_creator_recent_idx'),
+            models.Index(fields=['safety_manager', '-created_at', '-id'], name='dossier_manager_recent_idx'),
+            models.Index(fields=['status'], name='dossier_status_idx'),
+            models.Index(fields=['location'], name='dossier_location_idx'),
+            models.Index(
+                fields=['-created_at', '-id'], name='dossier_open_recent_idx',
+                condition=models.Q(status__in=OPEN_DOSSIER_STATUSES),
+            ),
+        ]
+
+    @staticmethod
+    def generate_reference():
+        return ReferenceCounter.objects.next_reference(DOSSIER_REFERENCE_PREFIX)
 
     def save(self, *args, **kwargs):
+        self.prepare_for_save()
+        super().save(*args, **kwargs)
+
+    def prepare_for_save(self):
+        """
+        Fills the derived columns. Called by save(); bulk inserts, which
+        bypass save(), call it on each instance themselves.
+        """
         if not self.reference:
             # Generate a unique reference if it's not set
-            self.reference = f"ATMP-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+            self.reference = self.generate_reference()
 
         # Convert empty JSONField dicts/lists to None for database storage if preferred
         if self.entreprise == {}:
@@ -162,8 +301,10 @@ class DossierATMP(models.Model):
             self.accident = None
         if self.tiers_implique == {}:
             self.tiers_implique = None
-            
-        super().save(*args, **kwargs)
+
+        for field, value in denormalized_columns(self.entreprise, self.salarie, self.accident).items():
+            setattr(self, field, value)
+        self.search_document = build_search_document(self)
 
     def __str__(self):
         return self.reference
@@ -174,7 +315,6 @@ class Contentieux(models.Model):
     reference = models.CharField(max_length=255, unique=True, blank=True, null=True)
     subject = models.JSONField()
     status = models.CharField(max_length=50, choices=ContentieuxStatus.choices, default=ContentieuxStatus.DRAFT, null=True, blank=True)
-    juridiction_steps = models.JSONField(default=dict)
     documents = models.ManyToManyField(Document, related_name='contentieux_documents', blank=True)
     actions = models.ManyToManyField(Action, related_name='contentieux_actions', blank=True)
 
@@ -185,6 +325,14 @@ class Contentieux(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Contentieux'
         verbose_name_plural = 'Contentieux'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='contentieux_recent_idx'),
+            models.Index(fields=['status'], name='contentieux_status_idx'),
+            models.Index(
+                fields=['-created_at', '-id'], name='contentieux_open_recent_idx',
+                condition=models.Q(status__in=OPEN_CONTENTIEUX_STATUSES),
+            ),
+        ]
 
     def __str__(self):
         return self.reference or f"New Contentieux for {self.dossier_atmp.reference}"
@@ -192,8 +340,7 @@ class Contentieux(models.Model):
     # Add a save method to auto-generate the reference
     def save(self, *args, **kwargs):
         if not self.reference: # Only generate if it's not set (e.g., for new instances)
-            # You can base this on dossier reference, or just a new unique string
-            self.reference = f"CTX-{timezone.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+            self.reference = ReferenceCounter.objects.next_reference(CONTENTIEUX_REFERENCE_PREFIX)
         super().save(*args, **kwargs)
 
 
@@ -213,6 +360,16 @@ class Audit(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Audit'
         verbose_name_plural = 'Audits'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='audit_recent_idx'),
+            models.Index(fields=['auditor', '-created_at', '-id'], name='audit_auditor_recent_idx'),
+            models.Index(fields=['status'], name='audit_status_idx'),
+            models.Index(fields=['decision'], name='audit_decision_idx'),
+            models.Index(
+                fields=['-created_at', '-id'], name='audit_open_recent_idx',
+                condition=models.Q(status__in=OPEN_AUDIT_STATUSES),
+            ),
+        ]
 
     def __str__(self):
         return f"Audit for {self.dossier_atmp.reference}"
@@ -243,8 +400,13 @@ class JuridictionStep(models.Model):
     notes = models.TextField(blank=True, null=True)
 
     class Meta:
+        # The contentieux timeline: read in this order, through the index below
+        ordering = ['submitted_at', 'id']
         verbose_name = 'Juridiction Step'
         verbose_name_plural = 'Juridiction Steps'
+        indexes = [
+            models.Index(fields=['contentieux', 'submitted_at'], name='juridiction_step_timeline_idx'),
+        ]
 
     def __str__(self):
         return f"{self.juridiction} ({self.submitted_at.date()})"
@@ -276,3 +438,146 @@ class Tiers(models.Model):
 
     def __str__(self):
         return self.nom or "Tiers Impliqué"
+
+
+class DashboardSnapshot(models.Model):
+    """
+    Materialized GROUP BY counters for the dashboards, one row per
+    (dimension, value) bucket, e.g. ('dossieratmp.status', 'A_ANALYSER').
+    Kept current by the signal handlers in signals.py and reconciled by
+    the `rebuild_dashboard_stats` management command.
+    """
+    dimension = models.CharField(max_length=100)
+    # NULL source values are stored as '' so the unique constraint holds on every backend
+    value = models.CharField(max_length=255, blank=True, default='')
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['dimension', 'value']
+        verbose_name = 'Dashboard Snapshot'
+        verbose_name_plural = 'Dashboard Snapshots'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='unique_dashboard_snapshot_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.value or '∅'}: {self.count}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox of emails to send, written once the triggering transaction has
+    committed (see outbox.enqueue_email) and delivered by the `send_outbox`
+    management command. Failed sends are retried with exponential backoff
+    until OUTBOX_MAX_ATTEMPTS.
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    to = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=OutboundEmailStatus.choices, default=OutboundEmailStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # When the row may next be picked up: retry time for PENDING rows,
+    # lease expiry for SENDING rows (a worker died mid-batch)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.get_status_display()})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable document upload in progress (see uploads.py): the client
+    declares `length`, then sends the bytes in PATCH chunks appended to a
+    temporary file; `offset` is how many are stored. The last chunk turns
+    it into a Document. Abandoned sessions expire after
+    RESUMABLE_UPLOAD_EXPIRY seconds.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100, blank=True, null=True)
+    document_type = models.CharField(max_length=50, choices=DocumentType.choices, null=True, blank=True)
+    description = models.TextField(blank=True, null=True)
+    contentieux = models.ForeignKey('Contentieux', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Upload Session'
+        verbose_name_plural = 'Upload Sessions'
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a request sent with an Idempotency-Key header, e.g.
+    POST /api/audits/{id}/finalize/. The same user sending the same key
+    again gets this response back instead of a second execution (see
+    services.AuditFinalizationService). Kept IDEMPOTENCY_KEY_TTL seconds,
+    then deleted by the `purge_idempotency_keys` command.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # SHA-256 of what the request asked for: a key reused for another request is refused
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Idempotency Key'
+        verbose_name_plural = 'Idempotency Keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            # Range scanned by purge_idempotency_keys
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+
+class ReferenceCounter(models.Model):
+    """
+    Last number handed out per reference prefix and day, e.g. ('ATMP',
+    2025-03-14) → 42. References are allocated from it by
+    ReferenceCounter.objects.allocate() (see references.py).
+    """
+    prefix = models.CharField(max_length=20)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    objects = ReferenceCounterManager()
+
+    class Meta:
+        ordering = ['prefix', 'day']
+        verbose_name = 'Reference Counter'
+        verbose_name_plural = 'Reference Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'day'], name='unique_reference_counter_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix} {self.day}: {self.last_value}"
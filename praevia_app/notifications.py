@@ -0,0 +1,175 @@
+# /home/siisi/atmp/praevia_app/notifications.py
+
+import logging
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.urls import reverse
+
+from .models import DossierATMP
+from .outbox import build_email, enqueue_emails
+
+logger = logging.getLogger(__name__)
+
+
+# Always copied on new incident notifications
+STATIC_RECIPIENTS = ['medusadbt@gmail.com', 'charikajadida@gmail.com']
+
+# Everything the "new incident" email reads, for .only()
+NOTIFICATION_FIELDS = (
+    'title', 'description', 'date_of_incident', 'location',
+    'created_by__email', 'created_by__first_name', 'created_by__last_name',
+    'safety_manager__email',
+)
+
+REVIEW_URLS = (
+    ('ADMIN', 'admin:praevia_app_dossieratmp_change'),
+    ('HTML', 'praevia_app:incident-detail'),
+    ('API', 'praevia_app:dossier-detail'),
+)
+
+# Reversed in place of the pk, then swapped for a format field
+_PK_PLACEHOLDER = 987654321
+
+
+# ---------------- Per-process caches ----------------
+#
+# The site domain and URL patterns do not change between requests; they
+# are resolved once per process. clear_notification_caches() is called
+# from signals.py when a Site row changes.
+
+@lru_cache(maxsize=None)
+def site_base_url():
+    # Requires 'django.contrib.sites' and SITE_ID pointing to the public domain
+    return f"https://{Site.objects.get_current().domain}"
+
+
+@lru_cache(maxsize=None)
+def url_template(viewname):
+    """reverse(viewname, args=[pk]) as a str.format template with a {pk} field."""
+    return reverse(viewname, args=[_PK_PLACEHOLDER]).replace(str(_PK_PLACEHOLDER), '{pk}')
+
+
+def clear_notification_caches():
+    site_base_url.cache_clear()
+    url_template.cache_clear()
+
+
+# ---------------- Rendering ----------------
+
+def with_notification_users(queryset):
+    """Loads the dossiers with the columns of their creator and safety manager, in one query."""
+    return queryset.select_related('created_by', 'safety_manager').only(*NOTIFICATION_FIELDS)
+
+
+def load_notification_users(dossiers):
+    """
+    Makes sure created_by and safety_manager are loaded on every dossier.
+    Those built from a user object (the usual create path) already are;
+    the others are re-read together in a single query.
+    """
+    missing = [
+        dossier.pk for dossier in dossiers
+        if not DossierATMP.created_by.is_cached(dossier)
+        or (dossier.safety_manager_id is not None and not DossierATMP.safety_manager.is_cached(dossier))
+    ]
+    if not missing:
+        return
+    loaded = with_notification_users(DossierATMP.objects.filter(pk__in=missing)).in_bulk()
+    for dossier in dossiers:
+        if dossier.pk in loaded:
+            dossier.created_by = loaded[dossier.pk].created_by
+            dossier.safety_manager = loaded[dossier.pk].safety_manager
+
+
+def render_new_dossier_email(dossier):
+    base_url = site_base_url()
+    review_links = "\n".join(
+        f"        {label}, Please review at: {base_url}{url_template(viewname).format(pk=dossier.pk)}"
+        for label, viewname in REVIEW_URLS
+    )
+    creator = dossier.created_by
+    body = f"""
+        New incident reported by {creator.get_full_name()} ({creator.email})
+
+        Details:
+        Title: {dossier.title}
+        Date: {dossier.date_of_incident}
+        Location: {dossier.location}
+        Description: {dossier.description}
+{review_links}
+        """
+
+    recipients = []
+    if dossier.safety_manager and dossier.safety_manager.email:
+        recipients.append(dossier.safety_manager.email)
+    if creator and creator.email:
+        recipients.append(creator.email)
+    recipients.extend(STATIC_RECIPIENTS)
+
+    return build_email(
+        f"New ATMP Incident: {dossier.title}",
+        body,
+        from_email=settings.DEFAULT_FROM_EMAIL,    # MUST match your EMAIL_HOST_USER
+        to=[settings.DEFAULT_FROM_EMAIL],          # Can be yourself, to satisfy Gmail
+        bcc=recipients,                            # Actual recipients hidden
+    )
+
+
+def notify_new_dossiers(dossiers):
+    """
+    Queues the "new incident" email of each dossier. Bulk callers pass the
+    whole batch: users are loaded with one query and the site/URLs come
+    from the per-process caches.
+    """
+    dossiers = list(dossiers)
+    load_notification_users(dossiers)
+    emails = enqueue_emails(render_new_dossier_email(dossier) for dossier in dossiers)
+    logger.info(f"New incident notification queued for {len(emails)} dossier(s)")
+    return emails
+
+
+def render_import_email(dossiers, imported_by):
+    """One summary email for a batch of imported dossiers."""
+    base_url = site_base_url()
+    html_url = url_template('praevia_app:incident-detail')
+    lines = "\n".join(
+        f"        - {dossier.reference} | {dossier.date_of_incident} | {dossier.location} | {dossier.title}: "
+        f"{base_url}{html_url.format(pk=dossier.pk)}"
+        for dossier in dossiers
+    )
+    body = f"""
+        {len(dossiers)} incidents imported by {imported_by.get_full_name()} ({imported_by.email})
+
+{lines}
+        """
+
+    recipients = sorted({
+        dossier.safety_manager.email for dossier in dossiers
+        if dossier.safety_manager and dossier.safety_manager.email
+    })
+    if imported_by.email:
+        recipients.append(imported_by.email)
+    recipients.extend(STATIC_RECIPIENTS)
+
+    return build_email(
+        f"{len(dossiers)} ATMP incidents imported",
+        body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[settings.DEFAULT_FROM_EMAIL],
+        bcc=recipients,
+    )
+
+
+def notify_imported_dossiers(dossiers, imported_by):
+    """
+    Queues a single email for a batch of bulk-imported dossiers, instead of
+    the per-dossier email notify_syndic sends (bulk_create sends no signals).
+    """
+    dossiers = list(dossiers)
+    if not dossiers:
+        return None
+    load_notification_users(dossiers)
+    email, = enqueue_emails([render_import_email(dossiers, imported_by)])
+    logger.info(f"Import notification queued for {len(dossiers)} dossier(s)")
+    return email
@@ -0,0 +1,154 @@
+# /home/siisi/atmp/praevia_app/outbox.py
+
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail, OutboundEmailStatus
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_setting(name, default):
+    return getattr(settings, f'OUTBOX_{name}', default)
+
+
+def build_email(subject, body, to=None, bcc=None, from_email=None):
+    return OutboundEmail(
+        subject=subject[:255],
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to or []),
+        bcc=list(bcc or []),
+    )
+
+
+def enqueue_email(subject, body, to=None, bcc=None, from_email=None):
+    """
+    Queues an email for the `send_outbox` worker. The row is written once
+    the current transaction commits, so nothing is sent for a rolled back
+    change and the request never waits on SMTP.
+    """
+    return enqueue_emails([build_email(subject, body, to, bcc, from_email)])[0]
+
+
+def enqueue_emails(emails):
+    """Queues unsaved OutboundEmail instances (see build_email) with one INSERT on commit."""
+    emails = list(emails)
+
+    def write():
+        OutboundEmail.objects.bulk_create(emails)
+        logger.info(f"{len(emails)} outbound email(s) queued")
+
+    if emails:
+        transaction.on_commit(write)
+    return emails
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2×base, 4×base… capped at OUTBOX_RETRY_MAX_DELAY (seconds)."""
+    base = outbox_setting('RETRY_BACKOFF', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), outbox_setting('RETRY_MAX_DELAY', 3600)))
+
+
+def claim_batch(batch_size):
+    """
+    Marks up to `batch_size` due emails as SENDING and returns them. The
+    claim is a lease: if the worker dies, the rows become due again once
+    OUTBOX_LEASE_SECONDS have passed. Concurrent workers skip each other's
+    rows where the database supports SKIP LOCKED.
+    """
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        Q(status=OutboundEmailStatus.PENDING) | Q(status=OutboundEmailStatus.SENDING),
+        next_attempt_at__lte=now,
+    ).order_by('next_attempt_at', 'id')
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        emails = list(due[:batch_size])
+        if emails:
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                status=OutboundEmailStatus.SENDING,
+                next_attempt_at=now + timedelta(seconds=outbox_setting('LEASE_SECONDS', 600)),
+            )
+    return emails
+
+
+def record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = f"{type(error).__name__}: {error}"
+    if email.attempts >= max_attempts:
+        email.status = OutboundEmailStatus.FAILED
+        logger.error(f"Outbound email {email.pk} failed after {email.attempts} attempts: {email.last_error}")
+    else:
+        email.status = OutboundEmailStatus.PENDING
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+        logger.warning(f"Outbound email {email.pk} attempt {email.attempts} failed, retrying at {email.next_attempt_at}: {email.last_error}")
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_batch(emails, max_attempts):
+    """
+    Sends `emails` over a single connection of the configured EMAIL_BACKEND.
+    Returns (sent, failed) counts; failures are rescheduled or given up on.
+    """
+    sent = failed = 0
+    backend = get_connection(fail_silently=False)
+    try:
+        backend.open()
+    except Exception as e:
+        # Nothing went out: every email of the batch counts one failed attempt
+        for email in emails:
+            record_failure(email, e, max_attempts)
+        return 0, len(emails)
+
+    try:
+        for email in emails:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                to=email.to,
+                bcc=email.bcc,
+                connection=backend,
+            )
+            try:
+                message.send(fail_silently=False)
+            except Exception as e:
+                record_failure(email, e, max_attempts)
+                failed += 1
+                continue
+            email.status = OutboundEmailStatus.SENT
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.last_error = None
+            email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+            sent += 1
+    finally:
+        backend.close()
+    return sent, failed
+
+
+def drain_outbox(batch_size=None, max_attempts=None, max_batches=None):
+    """
+    Sends due emails batch by batch until none is left (or `max_batches`
+    batches were sent). Returns (sent, failed) totals.
+    """
+    batch_size = batch_size or outbox_setting('BATCH_SIZE', 50)
+    max_attempts = max_attempts or outbox_setting('MAX_ATTEMPTS', 5)
+    sent = failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        emails = claim_batch(batch_size)
+        if not emails:
+            break
+        batch_sent, batch_failed = deliver_batch(emails, max_attempts)
+        sent += batch_sent
+        failed += batch_failed
+        batches += 1
+    return sent, failed
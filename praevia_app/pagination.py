@@ -0,0 +1,124 @@
+# /home/siisi/atmp/praevia_app/pagination.py
+
+import base64
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination (the default) with two opt-in query parameters:
+
+    - ?pagination=cursor (or any ?cursor=...) switches to keyset pagination on
+      (-created_at, -id): each page is a `WHERE (created_at, id) < cursor`
+      range scan, so page 10 000 costs the same as page 1. Cursors are opaque
+      and only move forward, through the `next` link; a malformed one is a 400.
+    - ?count=false skips the COUNT(*) of the whole queryset in either mode;
+      `next` is then detected by fetching one extra row.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.with_count = request.query_params.get(self.count_query_param, 'true').lower() not in ('false', '0', 'no')
+        self.use_cursor = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+        if self.use_cursor:
+            return self.paginate_keyset(queryset)
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_without_count(queryset)
+
+    def paginate_keyset(self, queryset):
+        queryset = queryset.order_by(*self.ordering)
+        self.count = queryset.count() if self.with_count else None
+
+        position = self.decode_cursor(self.request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = (rows[-1].created_at, rows[-1].pk) if self.has_next else None
+        return rows
+
+    def paginate_without_count(self, queryset):
+        try:
+            self.page_number = int(self.request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=self.page_number, message='Invalid page.'))
+
+        offset = (self.page_number - 1) * self.page_size
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor and self.with_count:
+            return super().get_paginated_response(data)
+
+        payload = {}
+        if self.with_count:
+            payload['count'] = self.count
+        if self.use_cursor:
+            payload['next'] = self.get_cursor_link()
+        else:
+            payload['next'] = self.get_page_link(self.page_number + 1) if self.has_next else None
+            payload['previous'] = self.get_page_link(self.page_number - 1) if self.page_number > 1 else None
+        payload['results'] = data
+        return Response(payload)
+
+    def get_page_link(self, page_number):
+        url = self.request.build_absolute_uri()
+        if page_number == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, page_number)
+
+    def get_cursor_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(*self.next_position))
+
+    def encode_cursor(self, created_at, pk):
+        raw = f"{created_at.isoformat()}|{pk}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+            created_at, pk = datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        # Cursors this class wrote hold an aware datetime and a 64-bit id: anything else was edited
+        if created_at.tzinfo is None or not 0 < pk < 2 ** 63:
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        return created_at, pk
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['required'] = ['results']
+        return response_schema
@@ -0,0 +1,29 @@
+# /home/siisi/atmp/praevia_app/parsers.py
+
+import codecs
+from rest_framework.parsers import BaseParser
+
+
+class LineStreamParser(BaseParser):
+    """
+    Hands the request body to the view as a lazy stream of text lines,
+    for imports that are read row by row instead of loaded at once.
+    request.data is {'format': ..., 'lines': <line iterator>}.
+    """
+    import_format = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding') or 'utf-8'
+        if encoding.lower().replace('-', '') == 'utf8':
+            encoding = 'utf-8-sig'  # tolerate the BOM spreadsheet exports start with
+        return {'format': self.import_format, 'lines': codecs.getreader(encoding)(stream)}
+
+
+class NDJSONParser(LineStreamParser):
+    media_type = 'application/x-ndjson'
+    import_format = 'ndjson'
+
+
+class CSVParser(LineStreamParser):
+    media_type = 'text/csv'
+    import_format = 'csv'
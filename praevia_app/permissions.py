@@ -94,3 +94,16 @@ class IsDirection(BasePermission):
         if request.user.is_superuser:
             return True
         return request.user.role == UserRole.DIRECTION
+
+
+class CanExport(BasePermission):
+    """
+    Allows bulk exports to superusers and to the roles listed in the
+    view's `export_roles`.
+    """
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+            return False
+        if request.user.is_superuser:
+            return True
+        return request.user.role in getattr(view, 'export_roles', ())
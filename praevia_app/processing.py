@@ -0,0 +1,215 @@
+# /home/siisi/atmp/praevia_app/processing.py
+
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .analysis import analyze_file
+from .models import Document, DocumentProcessingStatus
+from .storage import blob_digest
+
+logger = logging.getLogger(__name__)
+
+
+# Columns written by the worker, with one bulk_update per batch for each outcome
+FAILURE_FIELDS = ['processing_status', 'processing_attempts', 'processing_due_at', 'processing_error']
+RESULT_FIELDS = FAILURE_FIELDS + ['processed_at', 'detected_mime_type', 'page_count', 'thumbnail', 'text_content']
+
+
+def processing_setting(name, default):
+    return getattr(settings, f'DOCUMENT_PROCESSING_{name}', default)
+
+
+def analysis_options():
+    return {
+        'thumbnail_size': getattr(settings, 'DOCUMENT_THUMBNAIL_SIZE', 256),
+        'max_chars': getattr(settings, 'DOCUMENT_TEXT_MAX_CHARS', 200_000),
+    }
+
+
+def retry_delay(attempts):
+    """Exponential backoff from DOCUMENT_PROCESSING_RETRY_BACKOFF seconds, capped at one day."""
+    return timedelta(seconds=min(processing_setting('RETRY_BACKOFF', 60) * 2 ** (attempts - 1), 24 * 3600))
+
+
+def create_pool(workers):
+    """
+    A pool of `workers` processes running analysis.analyze_file. Spawned,
+    not forked: the children only import analysis.py (Pillow, no Django,
+    no inherited database connection).
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def claim_documents(batch_size):
+    """
+    Marks up to `batch_size` due documents as PROCESSING and returns them,
+    with a lease of DOCUMENT_PROCESSING_LEASE_SECONDS: the documents of a
+    worker that died are picked up again afterwards. Concurrent workers
+    skip each other's rows where the database supports SKIP LOCKED.
+    """
+    now = timezone.now()
+    due = Document.objects.filter(
+        processing_status__in=[DocumentProcessingStatus.PENDING, DocumentProcessingStatus.PROCESSING],
+        processing_due_at__lte=now,
+    ).order_by('processing_due_at', 'id').only('id', 'file', 'blob_id', 'processing_attempts', 'thumbnail')
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        documents = list(due[:batch_size])
+        if documents:
+            Document.objects.filter(pk__in=[document.pk for document in documents]).update(
+                processing_status=DocumentProcessingStatus.PROCESSING,
+                processing_due_at=now + timedelta(seconds=processing_setting('LEASE_SECONDS', 900)),
+            )
+    return documents
+
+
+def thumbnail_name(document):
+    # Named after the content when the file is a blob: documents sharing it share the preview
+    digest = blob_digest(document.file.name)
+    if digest:
+        return f"thumbnails/{digest[:2]}/{digest}.jpg"
+    return f"thumbnails/documents/{document.pk}.jpg"
+
+
+def store_thumbnail(document, data):
+    name = thumbnail_name(document)
+    if blob_digest(document.file.name) and default_storage.exists(name):
+        return name
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(data))
+
+
+def analyze_documents(documents, pool=None):
+    """
+    {file name: analysis result or exception} of the distinct files of
+    `documents`, computed by `pool` (in parallel) or in this process.
+    """
+    analyze = partial(analyze_file, **analysis_options())
+    paths = {document.file.name: document.file.path for document in documents}
+    if pool is None:
+        results = {}
+        for name, path in paths.items():
+            try:
+                results[name] = analyze(path)
+            except Exception as e:
+                results[name] = e
+        return results
+
+    futures = {name: pool.submit(analyze, path) for name, path in paths.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            # BrokenProcessPool when a child died (e.g. a crash in an image decoder):
+            # the files analyzed before keep their results
+            results[name] = e
+    return results
+
+
+def record_result(document, result, now):
+    document.processing_status = DocumentProcessingStatus.DONE
+    document.processing_attempts += 1
+    document.processing_due_at = None
+    document.processing_error = None
+    document.processed_at = now
+    document.detected_mime_type = result['mime_type']
+    document.page_count = result['page_count']
+    document.text_content = result['text']
+    if result['thumbnail']:
+        document.thumbnail.name = store_thumbnail(document, result['thumbnail'])
+    else:
+        document.thumbnail = None
+
+
+def record_failure(document, error, max_attempts):
+    document.processing_attempts += 1
+    document.processing_error = f"{type(error).__name__}: {error}"
+    if document.processing_attempts >= max_attempts:
+        document.processing_status = DocumentProcessingStatus.FAILED
+        document.processing_due_at = None
+        logger.error(f"Document {document.pk} processing failed after {document.processing_attempts} attempts: {document.processing_error}")
+    else:
+        document.processing_status = DocumentProcessingStatus.PENDING
+        document.processing_due_at = timezone.now() + retry_delay(document.processing_attempts)
+        logger.warning(f"Document {document.pk} processing attempt {document.processing_attempts} failed, retrying at {document.processing_due_at}: {document.processing_error}")
+
+
+def process_batch(documents, pool=None, max_attempts=None):
+    """
+    Analyzes the files of claimed `documents` (each distinct file once) and
+    saves them with a bulk_update per outcome. Returns (done, failed) counts.
+    Raises BrokenProcessPool, once the batch is saved, when `pool` died.
+    """
+    max_attempts = max_attempts or processing_setting('MAX_ATTEMPTS', 3)
+    results = analyze_documents([document for document in documents if document.file], pool)
+    now = timezone.now()
+    done, failed = [], []
+    for document in documents:
+        result = results.get(document.file.name) if document.file else ValueError("The document has no file")
+        if not isinstance(result, Exception):
+            try:
+                record_result(document, result, now)
+                done.append(document)
+                continue
+            except OSError as e:
+                result = e
+        record_failure(document, result, max_attempts)
+        failed.append(document)
+    # Rows deleted since the claim are simply not updated
+    Document.objects.bulk_update(done, RESULT_FIELDS)
+    Document.objects.bulk_update(failed, FAILURE_FIELDS)
+    broken = next((result for result in results.values() if isinstance(result, BrokenProcessPool)), None)
+    if broken:
+        raise BrokenProcessPool(f"{len(failed)} document(s) of the batch failed: {broken}")
+    return len(done), len(failed)
+
+
+def drain_documents(workers=None, batch_size=None, max_attempts=None, max_batches=None, pool=None):
+    """
+    Processes due documents batch by batch until none is left (or
+    `max_batches` batches were processed), with `workers` processes (0:
+    in this process) or the given `pool`, which the caller restarts when it
+    dies. Returns (done, failed) totals.
+    """
+    workers = processing_setting('WORKERS', 2) if workers is None else workers
+    batch_size = batch_size or processing_setting('BATCH_SIZE', 20)
+    own_pool = pool is None and workers > 0
+    if own_pool:
+        pool = create_pool(workers)
+    done = failed = batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            documents = claim_documents(batch_size)
+            if not documents:
+                break
+            try:
+                batch_done, batch_failed = process_batch(documents, pool, max_attempts)
+            except BrokenProcessPool as e:
+                if not own_pool:
+                    raise
+                logger.error(f"Document processing pool died, restarting it: {e}")
+                pool.shutdown(cancel_futures=True)
+                pool = create_pool(workers)
+                batches += 1
+                continue
+            done += batch_done
+            failed += batch_failed
+            batches += 1
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+    return done, failed
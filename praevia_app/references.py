@@ -0,0 +1,51 @@
+# /home/siisi/atmp/praevia_app/references.py
+
+import logging
+from django.db import models, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+DOSSIER_REFERENCE_PREFIX = 'ATMP'
+CONTENTIEUX_REFERENCE_PREFIX = 'CTX'
+
+# Zero padded so that references of a day sort like their numbers: new rows
+# land at the right edge of the unique index instead of at random pages.
+REFERENCE_DIGITS = 6
+
+
+def format_reference(prefix, day, number):
+    return f"{prefix}-{day:%Y%m%d}-{number:0{REFERENCE_DIGITS}d}"
+
+
+class ReferenceCounterManager(models.Manager):
+
+    def allocate(self, prefix, count=1, day=None):
+        """
+        Reserves `count` consecutive numbers of the (prefix, day) counter and
+        returns them as references, e.g. ATMP-20250314-000042. The counter
+        row is bumped with a single UPDATE, which locks it until the
+        enclosing transaction ends: concurrent callers get disjoint,
+        increasing blocks. Numbers of a rolled back transaction are reused;
+        numbers handed out but never saved leave gaps.
+        """
+        if count < 1:
+            return []
+        day = day or timezone.localdate()
+        counter = self.filter(prefix=prefix, day=day)
+
+        with transaction.atomic():
+            if not counter.update(last_value=models.F('last_value') + count):
+                # First reference of the day: another process may create the row at the same time
+                self.bulk_create([self.model(prefix=prefix, day=day)], ignore_conflicts=True)
+                counter.update(last_value=models.F('last_value') + count)
+            last_value = counter.values_list('last_value', flat=True).get()
+
+        first = last_value - count + 1
+        if count > 1:
+            logger.info(f"Allocated {count} {prefix} references for {day}: {first}..{last_value}")
+        return [format_reference(prefix, day, number) for number in range(first, last_value + 1)]
+
+    def next_reference(self, prefix, day=None):
+        return self.allocate(prefix, 1, day)[0]
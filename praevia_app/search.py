@@ -0,0 +1,269 @@
+# /home/siisi/atmp/praevia_app/search.py
+
+import logging
+import re
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+
+# Parts of a dossier that are searchable, JSON keys included
+SEARCH_FIELDS = ('reference', 'title', 'description', 'location', 'service_sante')
+SEARCH_JSON_KEYS = {
+    'entreprise': ('name', 'siret', 'address'),
+    'salarie': ('first_name', 'last_name', 'social_security_number', 'job_title'),
+    'accident': ('description', 'type_of_accident', 'detailed_circumstances'),
+}
+
+# PostgreSQL text search configuration of the search_vector columns: french
+# with accents removed before stemming (created by POSTGRESQL_SEARCH_CONFIG),
+# so that "helene" finds "Hélène" as on SQLite (remove_diacritics)
+SEARCH_CONFIG = 'praevia_french'
+
+# Index objects created by migration 0011 (see install_search_index)
+FTS_TABLE = 'praevia_app_dossieratmp_fts'
+SEARCH_VECTOR_INDEX = 'dossier_search_vector_gin'
+
+# Searchable columns of a document, text extracted by processing.py included,
+# and the index objects created by migration 0021 (see install_document_search_index)
+DOCUMENT_SEARCH_FIELDS = ('original_name', 'description', 'text_content')
+DOCUMENT_FTS_TABLE = 'praevia_app_document_fts'
+DOCUMENT_SEARCH_VECTOR_INDEX = 'document_search_vector_gin'
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def build_search_document(dossier):
+    """
+    The text indexed for a dossier: its own columns plus the searchable keys
+    of the entreprise/salarie/accident JSON. Stored in search_document by
+    DossierATMP.prepare_for_save().
+    """
+    parts = [getattr(dossier, field) for field in SEARCH_FIELDS]
+    for field, keys in SEARCH_JSON_KEYS.items():
+        data = getattr(dossier, field)
+        if isinstance(data, dict):
+            parts.extend(data.get(key) for key in keys)
+    return ' '.join(str(part) for part in parts if part not in (None, ''))
+
+
+def search_terms(query):
+    return _TERM.findall(query or '')[:20]
+
+
+def _prefix_match(queryset, table, fts_table, query):
+    """
+    `queryset` narrowed to the rows whose index matches every term of
+    `query` as a prefix, or None when the backend has no full-text index.
+    """
+    terms = search_terms(query)
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        return queryset.alias(
+            search_match=RawSQL(
+                f'"{table}"."search_vector" @@ to_tsquery(%s::regconfig, %s)',
+                (SEARCH_CONFIG, tsquery),
+                output_field=BooleanField(),
+            )
+        ).filter(search_match=True)
+
+    if connection.vendor == 'sqlite':
+        fts_query = ' '.join('"{}"*'.format(term.replace('"', '')) for term in terms)
+        return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", (fts_query,)))
+    return None
+
+
+def search_dossiers(queryset, query):
+    """
+    Narrows a DossierATMP queryset to the rows matching every term of
+    `query`, each term as a prefix ("mart" finds "Martin").
+
+    - PostgreSQL: search_vector (generated tsvector column) @@ to_tsquery, GIN indexed.
+    - SQLite: FTS5 table kept in sync with triggers.
+    - Other backends: unindexed icontains on search_document.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    matches = _prefix_match(queryset, 'praevia_app_dossieratmp', FTS_TABLE, query)
+    if matches is not None:
+        return matches
+
+    for term in terms:
+        queryset = queryset.filter(search_document__icontains=term)
+    return queryset
+
+
+def search_documents(queryset, query):
+    """
+    Narrows a Document queryset to the rows whose name, description or
+    extracted text contain every term of `query` as a prefix, through the
+    same kind of index as search_dossiers (unindexed icontains elsewhere).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    matches = _prefix_match(queryset, 'praevia_app_document', DOCUMENT_FTS_TABLE, query)
+    if matches is not None:
+        return matches
+
+    for term in terms:
+        any_field = Q()
+        for field in DOCUMENT_SEARCH_FIELDS:
+            any_field |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(any_field)
+    return queryset
+
+
+# ---------------- Index maintenance (migrations) ----------------
+
+def sqlite_fts_statements(table, fts_table, columns):
+    """
+    (install, uninstall) statements of an external content FTS5 table over
+    `columns` of `table`, kept in sync by triggers. The install ends with a
+    rebuild that indexes the existing rows.
+    """
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    install = [
+        f"""CREATE VIRTUAL TABLE {fts_table} USING fts5(
+        {names}, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+        f"""CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new});
+    END""",
+        f"""CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts_table}({fts_table}, rowid, {names}) VALUES ('delete', old.id, {old});
+    END""",
+        f"""CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {names} ON {table} BEGIN
+        INSERT INTO {fts_table}({fts_table}, rowid, {names}) VALUES ('delete', old.id, {old});
+        INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new});
+    END""",
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ]
+    uninstall = [
+        f"DROP TRIGGER IF EXISTS {fts_table}_ai",
+        f"DROP TRIGGER IF EXISTS {fts_table}_ad",
+        f"DROP TRIGGER IF EXISTS {fts_table}_au",
+        f"DROP TABLE IF EXISTS {fts_table}",
+    ]
+    return install, uninstall
+
+
+SQLITE_INSTALL, SQLITE_UNINSTALL = sqlite_fts_statements('praevia_app_dossieratmp', FTS_TABLE, ['search_document'])
+DOCUMENT_SQLITE_INSTALL, DOCUMENT_SQLITE_UNINSTALL = sqlite_fts_statements(
+    'praevia_app_document', DOCUMENT_FTS_TABLE, DOCUMENT_SEARCH_FIELDS
+)
+
+# Idempotent: run before each index is created (migrations 0011, 0021 and 0023)
+POSTGRESQL_SEARCH_CONFIG = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{SEARCH_CONFIG}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {SEARCH_CONFIG} (COPY = french);
+            ALTER TEXT SEARCH CONFIGURATION {SEARCH_CONFIG}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+        END IF;
+    END $$""",
+]
+
+POSTGRESQL_INSTALL = [
+    *POSTGRESQL_SEARCH_CONFIG,
+    f"""ALTER TABLE praevia_app_dossieratmp ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(search_document, ''))) STORED""",
+    f"CREATE INDEX {SEARCH_VECTOR_INDEX} ON praevia_app_dossieratmp USING GIN (search_vector)",
+]
+
+POSTGRESQL_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {SEARCH_VECTOR_INDEX}",
+    "ALTER TABLE praevia_app_dossieratmp DROP COLUMN IF EXISTS search_vector",
+]
+
+_DOCUMENT_TEXT = " || ' ' || ".join(f"coalesce({field}, '')" for field in DOCUMENT_SEARCH_FIELDS)
+
+DOCUMENT_POSTGRESQL_INSTALL = [
+    *POSTGRESQL_SEARCH_CONFIG,
+    f"""ALTER TABLE praevia_app_document ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}'::regconfig, {_DOCUMENT_TEXT})) STORED""",
+    f"CREATE INDEX {DOCUMENT_SEARCH_VECTOR_INDEX} ON praevia_app_document USING GIN (search_vector)",
+]
+
+DOCUMENT_POSTGRESQL_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {DOCUMENT_SEARCH_VECTOR_INDEX}",
+    "ALTER TABLE praevia_app_document DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def ensure_search_index(connection):
+    """
+    SQLite drops triggers when a migration rebuilds an indexed table
+    (e.g. on AlterField): recreates them and resyncs the FTS table if so.
+    Called after every migrate (see signals.py).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    indexes = [
+        ('Dossier', FTS_TABLE, SQLITE_INSTALL, SQLITE_UNINSTALL),
+        ('Document', DOCUMENT_FTS_TABLE, DOCUMENT_SQLITE_INSTALL, DOCUMENT_SQLITE_UNINSTALL),
+    ]
+    with connection.cursor() as cursor:
+        for label, fts_table, install, uninstall in indexes:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s", (f"{fts_table}%",))
+            existing = {row[0] for row in cursor.fetchall()}
+            if fts_table not in existing or {f"{fts_table}_ai", f"{fts_table}_ad", f"{fts_table}_au"} <= existing:
+                continue
+            logger.warning(f"{label} search triggers missing, recreating them and rebuilding the index")
+            for statement in [*uninstall[:3], *install[1:]]:
+                cursor.execute(statement)
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_INSTALL)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_INSTALL)
+    else:
+        logger.warning(f"No full-text index for {vendor}: dossier search falls back to icontains")
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_UNINSTALL)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_UNINSTALL)
+
+
+def install_document_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, DOCUMENT_POSTGRESQL_INSTALL)
+    elif vendor == 'sqlite':
+        _run(schema_editor, DOCUMENT_SQLITE_INSTALL)
+    else:
+        logger.warning(f"No full-text index for {vendor}: document search falls back to icontains")
+
+
+def uninstall_document_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, DOCUMENT_POSTGRESQL_UNINSTALL)
+    elif vendor == 'sqlite':
+        _run(schema_editor, DOCUMENT_SQLITE_UNINSTALL)
+
+
+def reinstall_postgresql_search_indexes(apps, schema_editor):
+    """Recreates the search_vector columns of both tables with the current SEARCH_CONFIG."""
+    if schema_editor.connection.vendor == 'postgresql':
+        _run(schema_editor, [*POSTGRESQL_UNINSTALL, *DOCUMENT_POSTGRESQL_UNINSTALL])
+        _run(schema_editor, [*POSTGRESQL_INSTALL, *DOCUMENT_POSTGRESQL_INSTALL])
@@ -1,18 +1,139 @@
 # /home/siisi/atmp/praevia_app/serializers.py
 
+import os
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model # <--- Get Django's active User model
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from .models import (
     DossierATMP, Contentieux, Audit, Document, 
     JuridictionStep, Temoin, Tiers, Action,
     AuditDecision, AuditStatus, ContentieuxStatus,
-    JuridictionType, DocumentType, DossierStatus, AuditChecklistItem
+    JuridictionType, DocumentType, DossierStatus, AuditChecklistItem, UploadSession
 )
 from users.models import CustomUser
 
 User = get_user_model() # Get the actual User model defined in settings.AUTH_USER_MODEL
 
 
+class SparseFieldsetMixin:
+    """
+    Lets API clients pick the fields of a read response:
+    - ?fields=id,reference,status  keeps only those fields
+    - ?omit=entreprise,salarie     drops those fields
+    Only applied to the top-level serializer of a GET/HEAD request, nested
+    serializers always render in full, so only the serializers the API
+    renders at the top level use it. An unknown field name is a 400.
+    `prune_queryset` narrows the SQL to the remaining fields.
+
+    `sparse_field_dependencies` maps SerializerMethodFields (or other fields
+    whose source is not a model attribute) to the model fields they read;
+    without it such a field disables column deferral, to stay on the safe side.
+    """
+    sparse_field_dependencies = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, omitted = self.get_sparse_fieldset()
+        errors = {
+            param: [f"Unknown field(s): {', '.join(sorted(names - set(fields)))}."]
+            for param, names in (('fields', requested or set()), ('omit', omitted)) if names - set(fields)
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        for name in omitted:
+            fields.pop(name, None)
+        return fields
+
+    def get_sparse_fieldset(self):
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD') or not self.is_root_serializer():
+            return None, set()
+        params = getattr(request, 'query_params', request.GET)
+        requested = params.get('fields')
+        omitted = params.get('omit')
+        requested = {name.strip() for name in requested.split(',') if name.strip()} if requested else None
+        omitted = {name.strip() for name in omitted.split(',') if name.strip()} if omitted else set()
+        return requested, omitted
+
+    def is_root_serializer(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_sparse_sources(self):
+        """
+        Returns the model attributes the rendered fields read from, or None
+        if that cannot be determined for at least one of them.
+        """
+        sources = set()
+        for name, field in self.fields.items():
+            if name in self.sparse_field_dependencies:
+                sources.update(self.sparse_field_dependencies[name])
+                if not isinstance(field, serializers.SerializerMethodField):
+                    sources.add(field.source.split('.')[0])
+                continue
+            if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+                return None
+            source = field.source.split('.')[0]
+            if source.startswith('get_') and source.endswith('_display'):
+                source = source[len('get_'):-len('_display')]
+            sources.add(source)
+        return sources
+
+    def prune_queryset(self, queryset):
+        """
+        Drops the select_related/prefetch_related lookups and defers the
+        columns that none of the remaining fields need. No-op unless the
+        request asked for a sparse fieldset.
+        """
+        requested, omitted = self.get_sparse_fieldset()
+        if requested is None and not omitted:
+            return queryset
+
+        sources = self.get_sparse_sources()
+        needed = set(sources or ())
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            paths = [path for path in _select_related_paths(select_related) if path.split('__')[0] in needed]
+            queryset = queryset.select_related(None)
+            if paths:
+                # select_related() without paths would follow every non-null foreign key
+                queryset = queryset.select_related(*paths)
+
+        lookups = queryset._prefetch_related_lookups
+        queryset = queryset.prefetch_related(None).prefetch_related(
+            *(lookup for lookup in lookups if _prefetch_root(lookup) in needed)
+        )
+
+        if sources is not None:
+            # Columns used for ordering stay loaded (e.g. keyset pagination reads created_at)
+            needed.update(field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str))
+            deferred = [
+                field.name for field in queryset.model._meta.concrete_fields
+                if not field.primary_key and field.name not in needed and field.attname not in needed
+            ]
+            queryset = queryset.defer(*deferred)
+        return queryset
+
+
+def _select_related_paths(tree, prefix=''):
+    for name, subtree in tree.items():
+        path = f"{prefix}{name}"
+        yield path
+        yield from _select_related_paths(subtree, f"{path}__")
+
+
+def _prefetch_root(lookup):
+    path = getattr(lookup, 'prefetch_through', lookup)
+    return path.split('__')[0]
+
+
 class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
@@ -27,7 +148,7 @@ class ActionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     uploaded_by = CustomUserSerializer(read_only=True)
     document_type_display = serializers.CharField(
         source='get_document_type_display', 
@@ -39,9 +160,14 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'contentieux', 'uploaded_by', 'document_type', 
             'document_type_display', 'original_name', 'file', 
-            'mime_type', 'size', 'created_at'
+            'mime_type', 'size', 'created_at',
+            # Filled by the process_documents worker; text_content is only searched (?q=)
+            'processing_status', 'detected_mime_type', 'page_count', 'thumbnail',
+        ]
+        read_only_fields = [
+            'mime_type', 'size', 'created_at', 'uploaded_by',
+            'processing_status', 'detected_mime_type', 'page_count', 'thumbnail',
         ]
-        read_only_fields = ['mime_type', 'size', 'created_at', 'uploaded_by']
         extra_kwargs = {
             'file': {'write_only': True}
         }
@@ -60,7 +186,56 @@ class DocumentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class JuridictionStepSerializer(serializers.ModelSerializer):
+class DocumentBatchUploadSerializer(serializers.Serializer):
+    """Multipart body of POST /api/documents/batch/: the dossier, several `files`, one type and description for all."""
+    dossier = serializers.PrimaryKeyRelatedField(
+        queryset=DossierATMP.objects.only('id', 'created_by_id', 'safety_manager_id')
+    )
+    files = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    document_type = serializers.ChoiceField(choices=DocumentType.choices, required=False, allow_null=True, allow_blank=True)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate_files(self, value):
+        max_files = settings.DOCUMENT_BATCH_UPLOAD_MAX_FILES
+        if len(value) > max_files:
+            raise serializers.ValidationError(f"Too many files. Send at most {max_files} at once.")
+        max_size = settings.DOCUMENT_BATCH_UPLOAD_MAX_FILE_SIZE
+        too_large = [file.name for file in value if file.size > max_size]
+        if too_large:
+            raise serializers.ValidationError(f"File too large: {', '.join(too_large)}.")
+        return value
+
+    def validate_document_type(self, value):
+        return value or None
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """A resumable upload (POST /api/documents/uploads/): what the Document will be, and how far the bytes are."""
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'length', 'offset', 'mime_type',
+            'document_type', 'description', 'contentieux', 'created_at'
+        ]
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def validate_filename(self, value):
+        # Only the name: it becomes Document.original_name
+        value = os.path.basename(value.replace('\\', '/')).strip()
+        if not value:
+            raise serializers.ValidationError("A file name is required.")
+        return value
+
+    def validate_length(self, value):
+        if value > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Files are limited to {settings.RESUMABLE_UPLOAD_MAX_SIZE} bytes."
+            )
+        return value
+
+
+class JuridictionStepSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     juridiction_display = serializers.CharField(
         source='get_juridiction_display', 
         read_only=True
@@ -75,19 +250,22 @@ class JuridictionStepSerializer(serializers.ModelSerializer):
             'decision_at', 'notes'
         ]
 
+    sparse_field_dependencies = {'decision_display': ('decision',)}
+
     def get_decision_display(self, obj):
         if obj.decision:
             return dict(JuridictionStep._meta.get_field('decision').choices)[obj.decision]
         return None
 
 
-class ContentieuxSerializer(serializers.ModelSerializer):
+class ContentieuxSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(
         source='get_status_display', 
         read_only=True
     )
     documents = DocumentSerializer(many=True, read_only=True)
-    juridiction_steps = JuridictionStepSerializer(many=True, read_only=True)
+    # The timeline, from the JuridictionStep rows in Meta.ordering
+    juridiction_steps = JuridictionStepSerializer(source='juridiction_steps_set', many=True, read_only=True)
     actions = ActionSerializer(many=True, read_only=True)
 
     class Meta:
@@ -105,7 +283,7 @@ class ContentieuxCreateSerializer(ContentieuxSerializer):
     )
 
 
-class AuditSerializer(serializers.ModelSerializer):
+class AuditSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(
         source='get_status_display', 
         read_only=True
@@ -132,6 +310,13 @@ class AuditUpdateSerializer(serializers.ModelSerializer):
         fields = ['status', 'decision', 'comments']
 
 
+class AuditFinalizeItemSerializer(serializers.Serializer):
+    """One entry of POST /api/audits/finalize-batch/."""
+    audit_id = serializers.IntegerField()
+    decision = serializers.ChoiceField(choices=AuditDecision.choices)
+    comments = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
 class AuditChecklistItemSerializer(serializers.Serializer):
     question = serializers.CharField(max_length=255)
     answer = serializers.BooleanField(required=False, allow_null=True)
@@ -155,7 +340,7 @@ class TiersSerializer(serializers.ModelSerializer):
 # Removed UploadedFileSerializer (as UploadedFile model is removed)
 
 
-class DossierATMPSerializer(serializers.ModelSerializer):
+class DossierATMPSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     status_display = serializers.CharField(
         source='get_status_display', 
         read_only=True
@@ -179,6 +364,8 @@ class DossierATMPSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['reference', 'created_at', 'contentieux', 'audit']
 
+    sparse_field_dependencies = {'tiers': ('tiers',)}
+
     def get_tiers(self, obj):
         try:
             return TiersSerializer(obj.tiers).data
@@ -222,3 +409,114 @@ class DossierCreateSerializer(DossierATMPSerializer):
             'salarie', 'accident', 'service_sante'
         ]
         read_only_fields = [] # Ensure no read-only fields that should be writable on creation
+
+
+class DossierImportSerializer(DossierCreateSerializer):
+    """
+    Validates one row of a bulk import (see importers.py) with the same
+    rules as DossierCreateSerializer. Safety managers are checked against
+    context['safety_managers'] ({pk: user}), loaded once per import, rather
+    than with one query per row.
+    """
+    reference = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    status = serializers.ChoiceField(choices=DossierStatus.choices, default=DossierStatus.A_ANALYSER)
+    safety_manager = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta(DossierCreateSerializer.Meta):
+        fields = ['reference', 'status', *DossierCreateSerializer.Meta.fields]
+
+    def validate_safety_manager(self, value):
+        if value is None:
+            return None
+        try:
+            return self.context['safety_managers'][value]
+        except KeyError:
+            raise serializers.ValidationError(f"Unknown safety manager: {value}")
+
+
+def count_subquery(queryset, field):
+    """
+    Correlated COUNT(*) of `queryset` rows whose `field` points at the outer row.
+    Evaluated only for the rows actually returned (i.e. the current page),
+    unlike a JOIN + GROUP BY over the whole table.
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class ContentieuxSummarySerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(
+        source='get_status_display',
+        read_only=True
+    )
+
+    class Meta:
+        model = Contentieux
+        fields = ['id', 'reference', 'status', 'status_display', 'created_at']
+
+
+class DossierListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Flat representation used by the dossier list endpoint.
+    Nested sections are opt-in through ?expand=audit,contentieux,documents,
+    each of them costing exactly one prefetch query per page.
+    """
+    status_display = serializers.CharField(
+        source='get_status_display',
+        read_only=True
+    )
+    safety_manager_email = serializers.EmailField(source='safety_manager.email', read_only=True, default=None)
+    documents_count = serializers.IntegerField(read_only=True)
+    temoins_count = serializers.IntegerField(read_only=True)
+    audit = AuditSerializer(read_only=True)
+    contentieux = ContentieuxSummarySerializer(read_only=True)
+    documents = DocumentSerializer(many=True, read_only=True)
+
+    expandable_fields = ('audit', 'contentieux', 'documents')
+
+    class Meta:
+        model = DossierATMP
+        fields = [
+            'id', 'reference', 'title', 'date_of_incident', 'location',
+            'status', 'status_display', 'safety_manager', 'safety_manager_email',
+            'created_by', 'service_sante', 'documents_count', 'temoins_count',
+            'audit', 'contentieux', 'documents', 'created_at'
+        ]
+        read_only_fields = fields
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.get_expand(self.context.get('request'))
+        for name in self.expandable_fields:
+            if name not in expand:
+                fields.pop(name, None)
+        return fields
+
+    @classmethod
+    def get_expand(cls, request):
+        if request is None:
+            return set()
+        requested = request.query_params.get('expand', '')
+        return {name.strip() for name in requested.split(',')} & set(cls.expandable_fields)
+
+    def setup_queryset(self, queryset):
+        """
+        Adds the joins, count subqueries and prefetches needed by the fields
+        this serializer will render (after ?expand=, ?fields= and ?omit=).
+        """
+        fields = self.fields
+        if 'safety_manager_email' in fields:
+            queryset = queryset.select_related('safety_manager')
+        if 'documents_count' in fields:
+            queryset = queryset.annotate(
+                documents_count=count_subquery(DossierATMP.documents.through.objects.all(), 'dossieratmp')
+            )
+        if 'temoins_count' in fields:
+            queryset = queryset.annotate(temoins_count=count_subquery(Temoin.objects.all(), 'dossier_atmp'))
+
+        prefetches = {
+            'audit': Prefetch('audit', queryset=Audit.objects.select_related('auditor')),
+            'contentieux': Prefetch('contentieux', queryset=Contentieux.objects.all()),
+            'documents': Prefetch('documents', queryset=Document.objects.select_related('uploaded_by')),
+        }
+        return queryset.prefetch_related(*(prefetches[name] for name in self.expandable_fields if name in fields))
@@ -1,8 +1,19 @@
 # /home/siisi/atmp/praevia_app/services.py
 
-from.models import Audit, DossierATMP, Contentieux, ContentieuxStatus
+from.models import (
+    Audit, AuditDecision, AuditStatus, DossierATMP, DossierStatus, Contentieux, ContentieuxStatus, IdempotencyKey,
+    ReferenceCounter,
+)
+from .dashboard import add_to_snapshot, move_in_snapshot
+from .references import CONTENTIEUX_REFERENCE_PREFIX
+from .serializers import AuditSerializer, ContentieuxSerializer
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from datetime import datetime
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from datetime import timedelta
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,28 +34,30 @@ class ContentieuxService:
         except ObjectDoesNotExist:
             return None
 
+    @staticmethod
+    def build_from_audit(dossier: DossierATMP, reference=None):
+        """The unsaved Contentieux opened when an audit of `dossier` decides to contest."""
+        return Contentieux(
+            dossier_atmp=dossier, # Link to the DossierATMP instance
+            reference=reference,
+            subject={
+                "title": f"Contentieux pour dossier {dossier.reference}",
+                "description": f"Contentieux initié suite à l'audit du dossier AT/MP {dossier.reference}."
+            },
+            status=ContentieuxStatus.DRAFT.value, # Set initial status
+            # documents and actions are ManyToMany, add them after saving
+        )
+
     @staticmethod
     def create_from_audit(audit: Audit, dossier: DossierATMP):
         """
         Creates a new Contentieux dossier based on a finalized Audit.
         """
         try:
-            # Generate a simple reference for the contentieux
-            # The model's save method will also generate one if not provided,
-            # but providing a prefix here can be useful for human readability.
-            reference = f"CONT-{int(datetime.now().timestamp())}"
-
-            new_contentieux = Contentieux(
-                dossier_atmp=dossier, # Link to the DossierATMP instance
-                reference=reference,
-                subject={
-                    "title": f"Contentieux pour dossier {dossier.reference}",
-                    "description": f"Contentieux initié suite à l'audit du dossier AT/MP {dossier.reference}."
-                },
-                status=ContentieuxStatus.DRAFT.value, # Set initial status
-                juridiction_steps={}, # Default empty map
-                # documents and actions are ManyToMany, add them after saving
-            )
+            # The reference (CTX-YYYYMMDD-NNNNNN) is allocated by the model's save
+            # from the per-day counter, so two audits finalized in the same
+            # second no longer get the same one.
+            new_contentieux = ContentieuxService.build_from_audit(dossier)
             new_contentieux.save()
 
             # Update the parent DossierATMP with the new contentieux link
@@ -58,3 +71,205 @@ class ContentieuxService:
         except Exception as e:
             logger.error(f"Error creating contentieux from audit: {e}")
             raise
+
+
+class IdempotencyKeyMismatch(Exception):
+    """The Idempotency-Key was already used by this user for a different request."""
+
+
+class AuditFinalizationService:
+    """
+    Completes an audit and applies its decision to the dossier (closed, or
+    turned into a contentieux) as one transaction. The audit and dossier
+    rows are locked with SELECT ... FOR UPDATE first, so concurrent
+    submissions for the same audit run one after the other: the second
+    sees the audit completed instead of creating a second contentieux.
+
+    With an idempotency key the outcome is stored (IdempotencyKey) in the
+    same transaction and returned as is when the key comes back.
+    """
+
+    @staticmethod
+    def fingerprint(audit_id, decision, comments):
+        payload = json.dumps({'audit': audit_id, 'decision': decision, 'comments': comments}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def key_expiry(ttl=None):
+        """Keys stored before this time are no longer replayed."""
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600) if ttl is None else ttl
+        return timezone.now() - timedelta(seconds=ttl)
+
+    @staticmethod
+    def purge_expired_keys(ttl=None):
+        """Deletes the expired idempotency keys with one DELETE; returns how many."""
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=AuditFinalizationService.key_expiry(ttl)).delete()
+        return deleted
+
+    @staticmethod
+    def stored_response(user, key, fingerprint):
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            return None
+        if record.created_at < AuditFinalizationService.key_expiry():
+            record.delete()
+            return None
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyMismatch(key)
+        return record.status_code, record.response
+
+    @staticmethod
+    def finalize(audit_id, decision: AuditDecision, comments, user, idempotency_key=None):
+        """
+        `comments` None keeps the audit's comments. Returns (status code, response data, replayed). Raises
+        Audit.DoesNotExist and IdempotencyKeyMismatch.
+        """
+        fingerprint = AuditFinalizationService.fingerprint(audit_id, decision.value, comments)
+        with transaction.atomic():
+            # Lock order: audit, then dossier (the same for every caller)
+            audit = Audit.objects.select_related('auditor').select_for_update(of=('self',)).get(pk=audit_id)
+            if idempotency_key:
+                stored = AuditFinalizationService.stored_response(user, idempotency_key, fingerprint)
+                if stored is not None:
+                    logger.info(f"Audit {audit_id} finalization replayed for key {idempotency_key}")
+                    return (*stored, True)
+            dossier = DossierATMP.objects.select_for_update().get(pk=audit.dossier_atmp_id)
+
+            status_code, data = AuditFinalizationService.apply(audit, dossier, decision, comments)
+
+            if idempotency_key:
+                try:
+                    with transaction.atomic():
+                        IdempotencyKey.objects.create(
+                            user=user, key=idempotency_key, fingerprint=fingerprint,
+                            status_code=status_code, response=data,
+                        )
+                except IntegrityError:
+                    # Taken meanwhile by a request on another audit (same audit ones wait on the lock)
+                    raise IdempotencyKeyMismatch(idempotency_key)
+        return status_code, data, False
+
+    @staticmethod
+    def apply(audit, dossier, decision, comments):
+        if audit.status == AuditStatus.COMPLETED:
+            return 400, {"message": "Audit already completed"}
+        # Same check as finalize_batch: the dossier row is locked, so no contentieux can appear meanwhile
+        if decision == AuditDecision.CONTEST and Contentieux.objects.filter(dossier_atmp=dossier).exists():
+            return 409, {"message": "The dossier already has a contentieux"}
+
+        audit.status = AuditStatus.COMPLETED.value
+        audit.decision = decision.value
+        if comments is not None:
+            audit.comments = comments
+        audit.completed_at = timezone.now()
+        audit.save()
+
+        new_contentieux = None
+        if decision == AuditDecision.CONTEST:
+            dossier.status = DossierStatus.CONTESTATION_RECOMMANDEE.value
+            new_contentieux = ContentieuxService.create_from_audit(audit, dossier)
+            dossier.status = DossierStatus.TRANSFORME_EN_CONTENTIEUX.value
+        else:
+            dossier.status = DossierStatus.CLOTURE_SANS_SUITE.value
+        dossier.save()
+        logger.info(f"Audit {audit.id} finalized with decision {decision.value}")
+
+        data = {
+            "message": "Audit finalized successfully",
+            "audit": AuditSerializer(audit).data,
+        }
+        if new_contentieux is not None:
+            data["message"] = "Audit finalized and litigation created"
+            data["contentieux"] = ContentieuxSerializer(new_contentieux).data
+        return 200, data
+
+    @staticmethod
+    def finalize_batch(queryset, items):
+        """
+        Finalizes several audits in one transaction, with a fixed number of
+        queries: the audits of `queryset` and their dossiers are read and
+        locked by one SELECT ... FOR UPDATE, the contentieux of contested
+        audits are inserted with one bulk_create, audits and dossiers are
+        written with one bulk_update each.
+
+        `items` are validated {audit_id, decision, comments} dicts. Returns
+        one result per item, in the same order, whose `outcome` is
+        finalized, not_found, already_completed, contentieux_exists or
+        duplicate (the audit appears earlier in the batch).
+        """
+        results = [{'audit_id': item['audit_id']} for item in items]
+        now = timezone.now()
+
+        with transaction.atomic():
+            locked = queryset.select_related('dossier_atmp').select_for_update(of=('self', 'dossier_atmp'))
+            audits = {audit.pk: audit for audit in locked.filter(pk__in=[item['audit_id'] for item in items]).order_by('pk')}
+            contested_dossiers = set(Contentieux.objects.filter(
+                dossier_atmp__in=[audit.dossier_atmp_id for audit in audits.values()]
+            ).values_list('dossier_atmp_id', flat=True))
+
+            seen, finalized, contested = set(), [], []
+            audit_changes, dossier_changes = [], []
+            for item, result in zip(items, results):
+                audit = audits.get(item['audit_id'])
+                decision = AuditDecision(item['decision'])
+                if item['audit_id'] in seen:
+                    result.update(outcome='duplicate', message="Audit listed more than once")
+                    continue
+                seen.add(item['audit_id'])
+                if audit is None:
+                    result.update(outcome='not_found', message="Audit not found")
+                    continue
+                if audit.status == AuditStatus.COMPLETED:
+                    result.update(outcome='already_completed', message="Audit already completed")
+                    continue
+                dossier = audit.dossier_atmp
+                if decision == AuditDecision.CONTEST and dossier.pk in contested_dossiers:
+                    result.update(outcome='contentieux_exists', message="The dossier already has a contentieux")
+                    continue
+
+                audit_before = {'status': audit.status, 'decision': audit.decision}
+                dossier_before = {'status': dossier.status}
+                audit.status = AuditStatus.COMPLETED.value
+                audit.decision = decision.value
+                if item.get('comments') is not None:
+                    audit.comments = item['comments']
+                audit.completed_at = audit.updated_at = now
+                if decision == AuditDecision.CONTEST:
+                    dossier.status = DossierStatus.TRANSFORME_EN_CONTENTIEUX.value
+                    contested.append((result, dossier))
+                else:
+                    dossier.status = DossierStatus.CLOTURE_SANS_SUITE.value
+                dossier.updated_at = now
+                audit_changes.append((audit_before, {'status': audit.status, 'decision': audit.decision}))
+                dossier_changes.append((dossier_before, {'status': dossier.status}))
+                finalized.append(audit)
+                result.update(outcome='finalized', decision=decision.value, dossier_status=dossier.status, contentieux=None)
+
+            if not finalized:
+                return results
+
+            Audit.objects.bulk_update(finalized, ['status', 'decision', 'comments', 'completed_at', 'updated_at'])
+            DossierATMP.objects.bulk_update(
+                [audit.dossier_atmp for audit in finalized], ['status', 'updated_at']
+            )
+            move_in_snapshot(Audit, audit_changes)
+            move_in_snapshot(DossierATMP, dossier_changes)
+
+            if contested:
+                references = ReferenceCounter.objects.allocate(CONTENTIEUX_REFERENCE_PREFIX, len(contested))
+                new_contentieux = [
+                    ContentieuxService.build_from_audit(dossier, reference)
+                    for (_, dossier), reference in zip(contested, references)
+                ]
+                Contentieux.objects.bulk_create(new_contentieux)
+                if new_contentieux[0].pk is None:
+                    # Backends that cannot return the ids of bulk inserted rows
+                    ids = dict(Contentieux.objects.filter(reference__in=references).values_list('reference', 'id'))
+                    for contentieux in new_contentieux:
+                        contentieux.pk = ids[contentieux.reference]
+                add_to_snapshot(Contentieux, [contentieux.pk for contentieux in new_contentieux])
+                for (result, _), contentieux in zip(contested, new_contentieux):
+                    result['contentieux'] = {'id': contentieux.pk, 'reference': contentieux.reference}
+
+        logger.info(f"{len(finalized)} audit(s) finalized in batch, {len(contested)} contentieux created")
+        return results
@@ -1,64 +1,139 @@
 # /home/siisi/atmp/praevia_app/signals.py
 
-from django.db.models.signals import post_save
+from django.db import connections
+from django.db.models.signals import post_migrate, post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.core.mail import EmailMessage
-from django.conf import settings
-from .models import DossierATMP
-from .models import DossierATMP
-from django.urls import reverse
+from .models import DossierATMP, Audit, Contentieux, Document, JuridictionStep, StoredBlob, User
+from .notifications import clear_notification_caches, notify_new_dossiers
+from .search import ensure_search_index
+from .dashboard import (
+    apply_snapshot_delta, invalidate_dashboards, is_snapshot_maintenance_paused, move_user_in_snapshot,
+    snapshot_values, user_dimension_fields, user_snapshot_values
+)
 from django.contrib.sites.models import Site
+from django.core.signals import setting_changed
 
 
 @receiver(post_save, sender=DossierATMP)
 def notify_syndic(sender, instance, created, **kwargs):
     if created:
-        subject = f"New ATMP Incident: {instance.title}"
-        
-        # Get the current domain. This is generally preferred over hardcoding.
-        # Requires 'django.contrib.sites' app in INSTALLED_APPS
-        # and a Site object configured in Django Admin (e.g., example.com -> atmp.siisi.online)
-        current_site = Site.objects.get_current()
-        # Ensure your SITE_ID in settings.py points to the correct site object.
-        # In production, this should be your HTTPS domain.
-        base_url = f"https://{current_site.domain}"
-
-        # Using reverse for more robust URL generation, combine with base_url
-        admin_url = reverse('admin:praevia_app_dossieratmp_change', args=[instance.id])
-        html_url = reverse('praevia_app:incident-detail', args=[instance.id])
-        api_url = reverse('praevia_app:dossier-detail', args=[instance.id])  # Using DRF named URL
-
-        message = f"""
-        New incident reported by {instance.created_by.get_full_name()} ({instance.created_by.email})
-        
-        Details:
-        Title: {instance.title}
-        Date: {instance.date_of_incident}
-        Location: {instance.location}
-        Description: {instance.description}
-        ADMIN, Please review at: {base_url}{admin_url}
-        HTML, Please review at: {base_url}{html_url}
-        API, Please review at: {base_url}{api_url}
-        """
-
-        # Collect recipients
-        recipients = []
-
-        if instance.safety_manager and instance.safety_manager.email:
-            recipients.append(instance.safety_manager.email)
-
-        if instance.created_by and instance.created_by.email:
-            recipients.append(instance.created_by.email)
-
-        # Add any static emails if needed
-        recipients.extend(['medusadbt@gmail.com', 'charikajadida@gmail.com'])
-
-        # Send email using EmailMessage with BCC
-        email = EmailMessage(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,    # MUST match your EMAIL_HOST_USER
-            to=[settings.DEFAULT_FROM_EMAIL],  # Can be yourself, to satisfy Gmail
-            bcc=recipients,              # Actual recipients hidden
-        )
-        email.send(fail_silently=False)
+        # Queued with BCC; sent by the `send_outbox` worker once the dossier is committed.
+        # Site domain and URL patterns are cached per process (see notifications.py).
+        notify_new_dossiers([instance])
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def reset_notification_site(sender, **kwargs):
+    clear_notification_caches()
+
+
+@receiver(setting_changed)
+def reset_notification_settings(sender, setting, **kwargs):
+    if setting in ('SITE_ID', 'ROOT_URLCONF'):
+        clear_notification_caches()
+
+
+@receiver(post_migrate)
+def check_search_index(sender, using, **kwargs):
+    if sender.name == 'praevia_app':
+        ensure_search_index(connections[using])
+
+
+# ---------------- Dashboard snapshot & cache maintenance ----------------
+
+@receiver(pre_save, sender=DossierATMP)
+@receiver(pre_save, sender=Audit)
+@receiver(pre_save, sender=Contentieux)
+@receiver(pre_save, sender=JuridictionStep)
+@receiver(pre_delete, sender=DossierATMP)
+@receiver(pre_delete, sender=Audit)
+@receiver(pre_delete, sender=Contentieux)
+@receiver(pre_delete, sender=JuridictionStep)
+def capture_dashboard_buckets(sender, instance, raw=False, **kwargs):
+    # Remember which buckets the row sits in before the write
+    if raw or is_snapshot_maintenance_paused():
+        return
+    instance._dashboard_buckets = snapshot_values(instance)
+
+
+@receiver(post_save, sender=DossierATMP)
+@receiver(post_save, sender=Audit)
+@receiver(post_save, sender=Contentieux)
+@receiver(post_save, sender=JuridictionStep)
+def update_dashboard_snapshot(sender, instance, raw=False, **kwargs):
+    if raw or is_snapshot_maintenance_paused():
+        return
+    apply_snapshot_delta(sender, getattr(instance, '_dashboard_buckets', None), snapshot_values(instance))
+    instance._dashboard_buckets = None
+    invalidate_dashboards(sender)
+
+
+@receiver(post_delete, sender=DossierATMP)
+@receiver(post_delete, sender=Audit)
+@receiver(post_delete, sender=Contentieux)
+@receiver(post_delete, sender=JuridictionStep)
+def remove_from_dashboard_snapshot(sender, instance, **kwargs):
+    if is_snapshot_maintenance_paused():
+        return
+    apply_snapshot_delta(sender, getattr(instance, '_dashboard_buckets', None), None)
+    instance._dashboard_buckets = None
+    invalidate_dashboards(sender)
+
+
+# Buckets such as dossieratmp.created_by__role hold a field of the user:
+# changing that field moves every row of the user to another bucket.
+
+def saves_user_buckets(raw, update_fields):
+    # Logins save last_login only: no query for them
+    if raw or is_snapshot_maintenance_paused():
+        return False
+    return update_fields is None or not update_fields.isdisjoint(user_dimension_fields())
+
+
+@receiver(pre_save, sender=User)
+def capture_user_buckets(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not saves_user_buckets(raw, update_fields):
+        return
+    instance._dashboard_buckets = user_snapshot_values(instance)
+
+
+@receiver(post_save, sender=User)
+def move_user_rows_in_snapshot(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not saves_user_buckets(raw, update_fields):
+        return
+    move_user_in_snapshot(instance, getattr(instance, '_dashboard_buckets', None), user_snapshot_values(instance))
+    instance._dashboard_buckets = None
+
+
+# ---------------- Document blob reference counts ----------------
+
+@receiver(pre_save, sender=Document)
+def capture_document_blob(sender, instance, raw=False, **kwargs):
+    # The blob the row pointed at before the write: only an update can change it
+    if raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'blob' not in update_fields:
+        instance._previous_blob_id = instance.blob_id
+        return
+    instance._previous_blob_id = (
+        Document.objects.filter(pk=instance.pk).values_list('blob_id', flat=True).first()
+        if instance.pk and not instance._state.adding else None
+    )
+
+
+@receiver(post_save, sender=Document)
+def count_document_blob(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_blob_id', None)
+    if previous != instance.blob_id:
+        StoredBlob.objects.add_references([previous], sign=-1)
+        StoredBlob.objects.add_references([instance.blob_id])
+    instance._previous_blob_id = instance.blob_id
+
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    StoredBlob.objects.add_references([instance.blob_id], sign=-1)
@@ -0,0 +1,239 @@
+# /home/siisi/atmp/praevia_app/storage.py
+
+import hashlib
+import logging
+import os
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+
+# Blobs live under blobs/<2 hex>/<2 hex>/<sha256>: at most 256 entries per directory level
+BLOB_DIRECTORY = 'blobs'
+BLOB_TEMP_DIRECTORY = f'{BLOB_DIRECTORY}/tmp'
+
+
+def blob_name(digest):
+    return f"{BLOB_DIRECTORY}/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def blob_digest(name):
+    """The SHA-256 of a blob name, None for a file stored outside the blob store."""
+    if not name or not name.startswith(f'{BLOB_DIRECTORY}/') or name.startswith(f'{BLOB_TEMP_DIRECTORY}/'):
+        return None
+    digest = os.path.basename(name)
+    return digest if len(digest) == 64 else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct content once, named after its SHA-256. The upload
+    is hashed while it is copied, chunk by chunk, to a temporary file next
+    to the blobs, then renamed to its digest; when that blob already exists
+    the copy is dropped. The upload_to name is ignored: the same bytes
+    always get the same name, whoever uploads them.
+
+    Files are never deleted through the storage of a model field: blobs
+    are shared, see StoredBlob and the `gc_document_blobs` command.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name only depends on the content, chosen in _save()
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large multipart uploads, assembled resumable uploads): hashed, then moved
+            source, temp_name = content.temporary_file_path(), None
+            for chunk in content.chunks():
+                digest.update(chunk)
+        else:
+            temp_directory = self.path(BLOB_TEMP_DIRECTORY)
+            os.makedirs(temp_directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=temp_directory, delete=False) as temp:
+                try:
+                    for chunk in content.chunks():
+                        digest.update(chunk)
+                        temp.write(chunk)
+                except BaseException:
+                    os.remove(temp.name)
+                    raise
+            source = temp_name = temp.name
+
+        name = blob_name(digest.hexdigest())
+        path = self.path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                # A rename when the source is on the same filesystem
+                file_move_safe(source, path)
+            except FileExistsError:
+                # The same bytes were stored by a concurrent upload
+                pass
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+                return name
+
+        if temp_name:
+            os.remove(temp_name)
+        # A fresh mtime tells the garbage collector the blob is being reused (download
+        # validators of blobs come from the digest, not the mtime: see downloads.file_etag)
+        os.utime(path)
+        logger.info(f"Upload deduplicated into existing blob {name}")
+        return name
+
+    def delete(self, name):
+        if blob_digest(name):
+            # Shared with other documents: only the garbage collector removes it
+            logger.info(f"Not deleting shared blob {name}")
+            return
+        super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+    def blob_files(self):
+        """(name, mtime) of every file under blobs/, temporary files included."""
+        root = self.path(BLOB_DIRECTORY)
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                try:
+                    yield name, os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+
+
+document_storage = ContentAddressedStorage()
+
+
+class StoredBlobManager(models.Manager):
+
+    def for_file(self, name, size):
+        """The StoredBlob row of a blob just written by ContentAddressedStorage."""
+        digest = blob_digest(name)
+        blob, created = self.get_or_create(sha256=digest, defaults={'name': name, 'size': size})
+        if not created:
+            # Reused: pushes it out of the garbage collector's grace period
+            self.filter(pk=blob.pk).update(updated_at=timezone.now())
+        return blob
+
+    def for_files(self, files):
+        """
+        {name: StoredBlob} for (name, size) pairs of blobs just written, with
+        three queries whatever their number (see for_file for a single one).
+        """
+        sizes = {blob_digest(name): (name, size) for name, size in files}
+        self.bulk_create(
+            [self.model(sha256=digest, name=name, size=size) for digest, (name, size) in sizes.items()],
+            ignore_conflicts=True,
+        )
+        blobs = list(self.filter(sha256__in=sizes))
+        # New or reused: both leave the garbage collector's grace period
+        self.filter(pk__in=[blob.pk for blob in blobs]).update(updated_at=timezone.now())
+        return {blob.name: blob for blob in blobs}
+
+    def add_references(self, blob_ids, sign=1):
+        """
+        Counts new (sign=1) or removed (sign=-1) references to blobs, one per
+        item of `blob_ids`, with a single UPDATE. Used by the Document signal
+        handlers, and after a bulk_create() of documents, which sends none.
+        """
+        counts = Counter(blob_id for blob_id in blob_ids if blob_id is not None)
+        if not counts:
+            return
+        self.filter(pk__in=counts).update(
+            ref_count=models.F('ref_count') + models.Case(
+                *(models.When(pk=blob_id, then=models.Value(sign * count)) for blob_id, count in counts.items()),
+                default=models.Value(0),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    def collect_garbage(self, storage, grace, dry_run=False):
+        """
+        Deletes the blobs no document points at (ref_count 0) and unused
+        for `grace` seconds, row then file. Returns (blobs, bytes) freed.
+        """
+        cutoff = timezone.now() - timedelta(seconds=grace)
+        deleted = freed = 0
+        for blob in self.filter(ref_count=0, updated_at__lt=cutoff).iterator():
+            # A deduplicated upload touches the file before its row points at the blob
+            if storage.exists(blob.name) and storage.get_modified_time(blob.name) > cutoff:
+                continue
+            if not dry_run:
+                try:
+                    with transaction.atomic():
+                        # Re-checked in the DELETE: a document may have taken the blob since, or an
+                        # upload may be reusing it (for_file() bumped updated_at, its row not inserted yet)
+                        removed, _ = self.filter(pk=blob.pk, ref_count=0, updated_at__lt=cutoff).delete()
+                except models.ProtectedError:
+                    logger.warning(f"Blob {blob.sha256} has documents but a ref_count of 0: run with --recount")
+                    continue
+                if not removed:
+                    continue
+                storage.delete_blob(blob.name)
+            deleted += 1
+            freed += blob.size
+        return deleted, freed
+
+    def sweep_stray_files(self, storage, grace, dry_run=False):
+        """
+        Deletes the files under blobs/ older than `grace` seconds that no
+        StoredBlob row knows: leftovers of interrupted uploads and of blobs
+        written by a transaction that rolled back. Returns the files removed.
+        """
+        cutoff = (timezone.now() - timedelta(seconds=grace)).timestamp()
+        candidates = {
+            name: blob_digest(name) for name, mtime in storage.blob_files() if mtime < cutoff
+        }
+        known = set()
+        digests = [digest for digest in candidates.values() if digest]
+        for start in range(0, len(digests), 500):
+            known.update(self.filter(sha256__in=digests[start:start + 500]).values_list('sha256', flat=True))
+        stray = [name for name, digest in candidates.items() if digest not in known]
+        if not dry_run:
+            for name in stray:
+                storage.delete_blob(name)
+        return len(stray)
+
+    def adopt(self, document, storage):
+        """
+        Moves the file of a document uploaded before the blob store into it
+        (hashing it on the way); the old file is deleted once the row points
+        at the blob. Returns the blob.
+        """
+        legacy_name = document.file.name
+        with storage.open(legacy_name, 'rb') as legacy:
+            name = storage.save(legacy_name, File(legacy))
+        with transaction.atomic():
+            document.file.name = name
+            document.blob = self.for_file(name, storage.size(name))
+            document.save(update_fields=['file', 'blob'])
+        storage.delete(legacy_name)
+        return document.blob
+
+    def recount(self):
+        """Recomputes every ref_count from the documents; returns the number of rows corrected."""
+        counted = self.annotate(references=models.Count('documents')).exclude(ref_count=models.F('references'))
+        fixed = list(counted)
+        for blob in fixed:
+            logger.warning(f"Blob {blob.sha256}: ref_count {blob.ref_count}, {blob.references} documents")
+            blob.ref_count = blob.references
+        self.bulk_update(fixed, ['ref_count'])
+        return len(fixed)
@@ -1,3 +1,2071 @@
-from django.test import TestCase
+# /home/siisi/atmp/praevia_app/tests.py
 
-# Create your tests here.
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import tracemalloc
+import zipfile
+import zlib
+from datetime import date, datetime, timedelta
+from smtplib import SMTPException
+from unittest import skipUnless
+from unittest.mock import patch
+from django.contrib.sites.models import Site
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from PIL import Image
+
+from .forms import ContentieuxForm
+from .middleware import QueryRecorder
+from .pagination import KeysetPagination
+from .models import (
+    DashboardSnapshot, DossierATMP, DossierStatus, Contentieux, ContentieuxStatus, Audit, AuditStatus,
+    AuditDecision, Document, DocumentProcessingStatus, DocumentType, JuridictionStep, JuridictionType, Temoin, Tiers,
+    OutboundEmail, OutboundEmailStatus, ReferenceCounter, IdempotencyKey, StoredBlob, UploadSession
+)
+from .references import CONTENTIEUX_REFERENCE_PREFIX, DOSSIER_REFERENCE_PREFIX, format_reference
+from .search import SEARCH_CONFIG, search_documents, search_dossiers
+from .services import AuditFinalizationService, ContentieuxService
+from .notifications import clear_notification_caches, notify_new_dossiers, render_new_dossier_email
+from .outbox import drain_outbox
+from .analysis import analyze_file
+from .dashboard import DashboardStats, cached_dashboard, dashboard_generations, invalidate_dashboards, rebuild_dashboard_snapshot
+from .processing import drain_documents
+from .uploads import purge_expired
+from .views_api import DossierViewSet
+from users.models import CustomUser, UserRole
+
+
+def import_file(safety_manager, count, name='dossiers.ndjson'):
+    rows = [
+        {
+            'title': f'Import {i}', 'description': 'Chute', 'date_of_incident': '2024-03-01',
+            'location': 'Atelier', 'safety_manager': safety_manager.pk,
+            'entreprise': {'name': 'ACME', 'siret': '12345678900011', 'address': '1 rue'},
+            'salarie': {'first_name': 'Jean', 'last_name': f'Martin {i}', 'social_security_number': '1850575123456'},
+        }
+        for i in range(count)
+    ]
+    content = "\n".join(json.dumps(row) for row in rows)
+    return SimpleUploadedFile(name, content.encode(), content_type='application/x-ndjson')
+
+
+# Maximum number of SQL queries per route, session and user lookups included.
+# Every route name of praevia_app/urls.py must be listed here
+# (see QueryBudgetTests.test_every_route_has_a_budget). Lower a budget when
+# a view gets cheaper; raising one needs a reason in the commit message.
+QUERY_BUDGETS = {
+    'api-root': 2,
+    'root': 2,
+    'auth-list': 2,
+    'auth-register': 2,
+    'auth-login': 2,
+    'auth-profile': 3,
+    'auth-logout': 2,
+    'dossier-list': 4,
+    'dossier-list (search)': 4,
+    'dossier-list (filtered)': 4,
+    'dossier-list (expanded)': 7,
+    'dossier-detail': 8,
+    'dossier-bulk': 18,
+    'dossier-export': 3,
+    'contentieux-list': 7,
+    'contentieux-detail': 6,
+    'contentieux-steps': 4,
+    'contentieux-export': 3,
+    'audit-list': 4,
+    'audit-detail': 3,
+    'audit-by-dossier': 3,
+    'audit-finalize': 19,
+    'audit-finalize-batch': 20,
+    'audit-export': 3,
+    'document-list': 4,
+    'document-detail': 3,
+    'document-download': 3,
+    'document-upload-sessions': 4,
+    'document-upload-session': 3,
+    'document-batch': 13,
+    'jurist_dashboard_data': 4,
+    'rh_dashboard_data': 3,
+    'qse_dashboard_data': 3,
+    'direction_dashboard_data': 3,
+    'dashboard': 4,
+    'profile': 3,
+    'incident-list': 4,
+    'incident-list (search)': 4,
+    'incident-create': 3,
+    'incident-detail': 8,
+    'incident-update': 5,
+    'incident-delete': 3,
+    'contentieux-create': 4,
+    'document-upload': 5,
+    'document-upload-batch': 3,
+    'document_delete': 5,
+    'dashboard-juridique': 4,
+    'dashboard-rh': 3,
+    'dashboard-qse': 3,
+    'dashboard-direction': 4,
+}
+
+
+class TemporaryMediaMixin:
+    """Uploads write files: MEDIA_ROOT is an empty directory (self.media) removed after each test."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.media = media.name
+
+
+class QueryBudgetTestMixin:
+    """
+    Measures requests made with self.client:
+
+        recorder = self.measure('get', url)
+        self.assertQueryBudget('dossier-list', recorder)
+    """
+
+    def measure(self, method, url, data=None):
+        # Lists (batch endpoints) are sent as JSON, everything else as a form
+        extra = {'content_type': 'application/json'} if isinstance(data, list) else {}
+        with QueryRecorder() as recorder:
+            response = getattr(self.client, method)(url, data or {}, **extra)
+            if response.streaming:
+                # Streamed responses run their queries while being consumed
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, f"{method.upper()} {url} failed")
+        return recorder
+
+    def assertQueryBudget(self, name, recorder):
+        budget = QUERY_BUDGETS[name]
+        queries = "\n".join(sql for sql, _ in recorder.queries)
+        self.assertLessEqual(
+            recorder.count, budget,
+            f"{name}: {recorder.count} queries, budget is {budget}\n{queries}"
+        )
+
+
+class QueryRecorderTests(TestCase):
+
+    def test_records_count_and_duplicates(self):
+        with QueryRecorder() as recorder:
+            for _ in range(3):
+                list(CustomUser.objects.filter(pk=1))
+            list(DossierATMP.objects.all())
+
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(list(recorder.duplicates.values()), [3])
+        self.assertGreaterEqual(recorder.total_time, 0)
+
+    def test_stops_recording_on_exit(self):
+        with QueryRecorder() as recorder:
+            list(CustomUser.objects.all())
+        list(CustomUser.objects.all())
+        self.assertEqual(recorder.count, 1)
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD=1)
+class QueryInstrumentationMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass')
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('praevia_app:dossier-list'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicated", app;dur=[\d.]+$'
+        )
+
+    def test_log_line(self):
+        self.client.force_login(self.admin)
+        with self.assertLogs('praevia_app.queries', level=logging.INFO) as logs:
+            self.client.get(reverse('praevia_app:dossier-list'))
+        record = logs.records[0]
+        self.assertIn('path=/', record.getMessage())
+        self.assertIn('queries=', record.getMessage())
+        self.assertEqual(record.queries, int(record.getMessage().split('queries=')[1].split()[0]))
+
+    @override_settings(QUERY_INSTRUMENTATION=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('praevia_app:api-root'))
+        self.assertNotIn('Server-Timing', response)
+
+
+# The dashboard cache would hide the cost of recomputing, and its
+# invalidations only run on commit, which never happens inside a TestCase.
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTests(TemporaryMediaMixin, QueryBudgetTestMixin, TestCase):
+    """
+    Requests every route as a superuser (the widest querysets) against a
+    small and a larger dataset. The query count must stay within budget and
+    must not grow with the data: a count that changes between the two runs
+    is an N+1.
+    """
+    SMALL, LARGE = 2, 6
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.employee = CustomUser.objects.create_user(
+            email='employee@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+        cls.safety_manager = CustomUser.objects.create_user(
+            email='safety@test.local', password='pass', name='Safety', role=UserRole.SAFETY_MANAGER
+        )
+
+    def seed(self, count):
+        """
+        Adds `count` dossiers with audits, witnesses, third parties and
+        documents; every other one was contested and has a contentieux with
+        steps. The number of children per dossier grows with `count` too.
+        """
+        now = timezone.now()
+        for i in range(count):
+            contested = i % 2 == 0
+            dossier = DossierATMP.objects.create(
+                title=f'Incident {i}',
+                description='Chute',
+                date_of_incident=date(2025, 1, 1),
+                location='Atelier',
+                status=DossierStatus.TRANSFORME_EN_CONTENTIEUX if contested else DossierStatus.CLOTURE_SANS_SUITE,
+                created_by=self.employee,
+                safety_manager=self.safety_manager,
+                entreprise={'siret': '12345678900011'},
+                salarie={'last_name': 'Martin'},
+            )
+            Audit.objects.create(
+                dossier_atmp=dossier,
+                auditor=self.safety_manager,
+                status=AuditStatus.COMPLETED,
+                decision=AuditDecision.CONTEST if contested else AuditDecision.DO_NOT_CONTEST,
+            )
+            contentieux = None
+            if contested:
+                contentieux = Contentieux.objects.create(
+                    dossier_atmp=dossier, subject={'title': dossier.title}, status=ContentieuxStatus.EN_COURS
+                )
+            Tiers.objects.create(dossier_atmp=dossier, nom='Tiers')
+            for j in range(count):
+                Temoin.objects.create(dossier_atmp=dossier, nom=f'Temoin {j}')
+                document = Document.objects.create(
+                    contentieux=contentieux, uploaded_by=self.admin, original_name=f'doc-{j}.pdf'
+                )
+                dossier.documents.add(document)
+                if contentieux:
+                    contentieux.documents.add(document)
+                    JuridictionStep.objects.create(
+                        contentieux=contentieux, juridiction=JuridictionType.TRIBUNAL_JUDICIAIRE, submitted_at=now
+                    )
+
+        # Dossier whose audit can still be finalized, for audit-finalize
+        pending = DossierATMP.objects.create(
+            title='Pending', description='-', date_of_incident=date(2025, 1, 1), location='Atelier',
+            status=DossierStatus.ANALYSE_EN_COURS, created_by=self.employee, safety_manager=self.safety_manager,
+        )
+        Audit.objects.create(dossier_atmp=pending, auditor=self.safety_manager, status=AuditStatus.IN_PROGRESS)
+        return pending
+
+    def pending_audit(self):
+        dossier = DossierATMP.objects.create(
+            title='Committee', description='-', date_of_incident=date(2025, 1, 1), location='Atelier',
+            status=DossierStatus.ANALYSE_EN_COURS, created_by=self.employee, safety_manager=self.safety_manager,
+        )
+        return Audit.objects.create(dossier_atmp=dossier, auditor=self.safety_manager, status=AuditStatus.IN_PROGRESS)
+
+    def requests(self, pending):
+        """(route name, method, url, data) for every route of praevia_app."""
+        dossier = DossierATMP.objects.filter(contentieux__isnull=False).latest('created_at')
+        contentieux = dossier.contentieux
+        document = Document.objects.filter(contentieux=contentieux).latest('created_at')
+        upload_session = UploadSession.objects.create(user=self.admin, filename='scan.pdf', length=10)
+        url = lambda name, *args: reverse(f'praevia_app:{name}', args=args)
+        batch = [
+            {'audit_id': self.pending_audit().pk, 'decision': AuditDecision.CONTEST},
+            {'audit_id': self.pending_audit().pk, 'decision': AuditDecision.DO_NOT_CONTEST, 'comments': 'RAS'},
+            {'audit_id': dossier.audit.pk, 'decision': AuditDecision.CONTEST},
+            {'audit_id': 0, 'decision': AuditDecision.CONTEST},
+        ]
+        return [
+            ('api-root', 'get', url('api-root'), None),
+            ('root', 'get', url('root'), None),
+            ('auth-list', 'get', url('auth-list'), None),
+            ('auth-register', 'get', url('auth-register'), None),
+            ('auth-login', 'get', url('auth-login'), None),
+            ('auth-profile', 'get', url('auth-profile'), None),
+            ('auth-logout', 'get', url('auth-logout'), None),
+            ('dossier-list', 'get', url('dossier-list'), None),
+            ('dossier-list (search)', 'get', url('dossier-list'), {'q': 'Martin'}),
+            ('dossier-list (filtered)', 'get', url('dossier-list'), {'siret': '123 456 789 00011', 'last_name': 'martin'}),
+            ('dossier-list (expanded)', 'get', url('dossier-list'), {'expand': 'audit,contentieux,documents'}),
+            ('dossier-detail', 'get', url('dossier-detail', dossier.pk), None),
+            ('dossier-export', 'get', url('dossier-export'), {'format': 'csv'}),
+            ('dossier-bulk', 'post', url('dossier-bulk'), {'file': import_file(self.safety_manager, 3)}),
+            ('contentieux-list', 'get', url('contentieux-list'), None),
+            ('contentieux-detail', 'get', url('contentieux-detail', contentieux.pk), None),
+            ('contentieux-steps', 'get', url('contentieux-steps', contentieux.pk), None),
+            ('contentieux-export', 'get', url('contentieux-export'), {'format': 'ndjson'}),
+            ('audit-list', 'get', url('audit-list'), None),
+            ('audit-detail', 'get', url('audit-detail', dossier.audit.pk), None),
+            ('audit-by-dossier', 'get', url('audit-by-dossier', dossier.pk), None),
+            ('audit-finalize', 'post', url('audit-finalize', pending.audit.pk),
+             {'decision': AuditDecision.DO_NOT_CONTEST}),
+            ('audit-finalize-batch', 'post', url('audit-finalize-batch'), batch),
+            ('audit-export', 'get', url('audit-export'), None),
+            ('document-list', 'get', url('document-list'), None),
+            ('document-detail', 'get', url('document-detail', document.pk), None),
+            ('document-download', 'get', url('document-download', document.pk), None),
+            ('document-upload-sessions', 'post', url('document-upload-sessions'), {'filename': 'scan.pdf', 'length': 10}),
+            ('document-upload-session', 'get', reverse(
+                'praevia_app:document-upload-session', kwargs={'upload_id': upload_session.pk}
+            ), None),
+            ('document-batch', 'post', url('document-batch'), {'dossier': dossier.pk, 'files': [
+                SimpleUploadedFile(f'scan-{i}.pdf', b'%PDF-1.4 scan', content_type='application/pdf') for i in range(3)
+            ]}),
+            ('jurist_dashboard_data', 'get', url('jurist_dashboard_data'), None),
+            ('rh_dashboard_data', 'get', url('rh_dashboard_data'), None),
+            ('qse_dashboard_data', 'get', url('qse_dashboard_data'), None),
+            ('direction_dashboard_data', 'get', url('direction_dashboard_data'), None),
+            ('dashboard', 'get', url('dashboard'), None),
+            ('profile', 'get', url('profile'), None),
+            ('incident-list', 'get', url('incident-list'), None),
+            ('incident-list (search)', 'get', url('incident-list'), {'q': 'Martin'}),
+            ('incident-create', 'get', url('incident-create'), None),
+            ('incident-detail', 'get', url('incident-detail', dossier.pk), None),
+            ('incident-update', 'get', url('incident-update', dossier.pk), None),
+            ('incident-delete', 'get', url('incident-delete', dossier.pk), None),
+            ('contentieux-create', 'get', url('contentieux-create', pending.pk), None),
+            ('document-upload', 'get', url('document-upload', dossier.pk), None),
+            ('document-upload-batch', 'get', url('document-upload-batch', dossier.pk), None),
+            ('document_delete', 'get', url('document_delete', document.pk), None),
+            ('dashboard-juridique', 'get', url('dashboard-juridique'), None),
+            ('dashboard-rh', 'get', url('dashboard-rh'), None),
+            ('dashboard-qse', 'get', url('dashboard-qse'), None),
+            ('dashboard-direction', 'get', url('dashboard-direction'), None),
+        ]
+
+    def measure_all(self, size):
+        pending = self.seed(size)
+        self.client.force_login(self.admin)
+        counts = []
+        for name, method, url, data in self.requests(pending):
+            with self.subTest(route=name, size=size, data=data):
+                recorder = self.measure(method, url, data)
+                counts.append((name, recorder.count))
+                self.assertQueryBudget(name, recorder)
+        return counts
+
+    def test_every_route_has_a_budget(self):
+        resolver = get_resolver().namespace_dict['praevia_app'][1]
+        names = {name for name in resolver.reverse_dict if isinstance(name, str)}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small = self.measure_all(self.SMALL)
+        large = self.measure_all(self.LARGE)
+        for (name, before), (_, after) in zip(small, large):
+            with self.subTest(route=name):
+                self.assertEqual(before, after, f"{name}: {before} queries with small data, {after} with large data")
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Email backend whose server rejects every message."""
+
+    def send_messages(self, email_messages):
+        raise SMTPException("550 rejected")
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', OUTBOX_RETRY_BACKOFF=60)
+class OutboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = CustomUser.objects.create_user(
+            email='employee@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+
+    def create_dossier(self):
+        return DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2025, 1, 1), location='Atelier',
+            status=DossierStatus.A_ANALYSER, created_by=self.employee,
+        )
+
+    def test_dossier_creation_queues_email_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.create_dossier()
+        self.assertFalse(OutboundEmail.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmailStatus.PENDING)
+        self.assertIn('employee@test.local', email.bcc)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_drain_sends_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                self.create_dossier()
+
+        self.assertEqual(drain_outbox(batch_size=2), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmailStatus.SENT).exists())
+        # Nothing left to send
+        self.assertEqual(drain_outbox(batch_size=2), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='praevia_app.tests.FailingEmailBackend')
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_dossier()
+        email = OutboundEmail.objects.get()
+
+        self.assertEqual(drain_outbox(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmailStatus.PENDING, 1))
+        self.assertIn('550 rejected', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # Not due yet
+        self.assertEqual(drain_outbox(max_attempts=2), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmailStatus.FAILED, 2))
+
+
+class NotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = CustomUser.objects.create_user(
+            email='notified@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+        cls.manager = CustomUser.objects.create_user(
+            email='manager@test.local', password='pass', name='Manager', role=UserRole.SAFETY_MANAGER
+        )
+
+    def clear_caches(self):
+        clear_notification_caches()
+        Site.objects.clear_cache()
+
+    def create_dossiers(self, count):
+        return [
+            DossierATMP.objects.create(
+                title=f'Chute {i}', description='-', date_of_incident=date(2025, 1, 1), location='Atelier',
+                status=DossierStatus.A_ANALYSER, created_by=self.employee, safety_manager=self.manager,
+            )
+            for i in range(count)
+        ]
+
+    def test_site_and_urls_are_resolved_once(self):
+        first, second = self.create_dossiers(2)
+        self.clear_caches()
+        with self.assertNumQueries(1):
+            render_new_dossier_email(first)
+        with self.assertNumQueries(0):
+            email = render_new_dossier_email(second)
+        self.assertIn(f"/incidents/{second.pk}/", email.body)
+        self.assertIn(f"/praevia_app/dossieratmp/{second.pk}/change/", email.body)
+        self.assertEqual(email.bcc[:2], ['manager@test.local', 'notified@test.local'])
+
+    def test_site_change_invalidates_cached_domain(self):
+        dossier, = self.create_dossiers(1)
+        render_new_dossier_email(dossier)
+        site = Site.objects.get(pk=1)
+        site.domain = 'atmp.example.com'
+        site.save()
+        self.assertIn('https://atmp.example.com/', render_new_dossier_email(dossier).body)
+
+    def test_bulk_notification_loads_users_in_one_query(self):
+        # Creating them already warmed the site and URL caches
+        pks = [dossier.pk for dossier in self.create_dossiers(5)]
+
+        dossiers = list(DossierATMP.objects.filter(pk__in=pks))
+        with self.captureOnCommitCallbacks(execute=False), self.assertNumQueries(1):
+            emails = notify_new_dossiers(dossiers)
+        self.assertEqual(len(emails), 5)
+        self.assertTrue(all('manager@test.local' in email.bcc for email in emails))
+
+        # Users are loaded by now: the only query left is the single INSERT on commit
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            notify_new_dossiers(dossiers)
+        self.assertEqual(OutboundEmail.objects.count(), 5)
+
+
+class DossierImportTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.safety_manager = CustomUser.objects.create_user(
+            email='safety@test.local', password='pass', name='Safety', role=UserRole.SAFETY_MANAGER
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_api_imports_valid_rows_and_reports_the_others(self):
+        body = "\n".join([
+            json.dumps({'title': 'A', 'description': '-', 'date_of_incident': '2024-01-02', 'location': 'Quai',
+                        'safety_manager': self.safety_manager.pk, 'reference': 'HIST-0001'}),
+            '{not json',
+            json.dumps({'title': 'B', 'description': '-', 'date_of_incident': '2024-01-03', 'location': 'Quai',
+                        'salarie': {'first_name': 'Jean'}}),
+            json.dumps({'title': 'C', 'description': '-', 'date_of_incident': '2024-01-04', 'location': 'Quai',
+                        'safety_manager': self.admin.pk}),
+            json.dumps({'title': 'D', 'description': '-', 'date_of_incident': '2024-01-05', 'location': 'Quai'}),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('praevia_app:dossier-bulk'), body, content_type='application/x-ndjson'
+            )
+
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['received'], report['created'], report['failed']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 4])
+        self.assertIn('salarie', report['errors'][1]['errors'])
+        self.assertIn('safety_manager', report['errors'][2]['errors'])
+
+        imported = DossierATMP.objects.get(reference='HIST-0001')
+        self.assertEqual((imported.created_by, imported.safety_manager), (self.admin, self.safety_manager))
+        self.assertEqual(imported.status, DossierStatus.A_ANALYSER)
+        self.assertTrue(DossierATMP.objects.get(title='D').reference.startswith('ATMP-'))
+        self.assertEqual(
+            DashboardSnapshot.objects.get(dimension='dossieratmp.location', value='Quai').count, 2
+        )
+        # One summary email for the batch, not one per dossier
+        email = OutboundEmail.objects.get()
+        self.assertIn('2 incidents imported', email.body)
+        self.assertIn('safety@test.local', email.bcc)
+
+    def test_duplicate_references_are_rejected(self):
+        DossierATMP.objects.create(
+            reference='HIST-0001', title='A', description='-', date_of_incident=date(2024, 1, 1),
+            location='Quai', status=DossierStatus.A_ANALYSER, created_by=self.admin,
+        )
+        body = "\n".join(
+            json.dumps({'title': 'A', 'description': '-', 'date_of_incident': '2024-01-02',
+                        'location': 'Quai', 'reference': reference})
+            for reference in ('HIST-0001', 'HIST-0002', 'HIST-0002')
+        )
+        response = self.client.post(reverse('praevia_app:dossier-bulk'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [3, 1])
+
+    def test_reference_taken_by_a_concurrent_import_is_rejected(self):
+        prepare_for_save = DossierATMP.prepare_for_save
+
+        def concurrent_import(dossier):
+            # Another import commits HIST-0002 after the batch checked the references
+            prepare_for_save(dossier)
+            if dossier.reference == 'HIST-0002':
+                DossierATMP.objects.bulk_create([DossierATMP(
+                    reference='HIST-0002', title='Other', description='-', date_of_incident=date(2024, 1, 1),
+                    location='Quai', status=DossierStatus.A_ANALYSER, created_by=self.admin,
+                )])
+
+        body = "\n".join(
+            json.dumps({'title': reference, 'description': '-', 'date_of_incident': '2024-01-02',
+                        'location': 'Quai', 'reference': reference})
+            for reference in ('HIST-0001', 'HIST-0002', 'HIST-0003')
+        )
+        with patch.object(DossierATMP, 'prepare_for_save', autospec=True, side_effect=concurrent_import), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('praevia_app:dossier-bulk'), body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['received'], report['created'], report['failed']), (3, 2, 1))
+        self.assertEqual(report['errors'], [
+            {'line': 2, 'errors': {'reference': ['A dossier with reference HIST-0002 already exists.']}},
+        ])
+        self.assertEqual(
+            dict(DossierATMP.objects.values_list('reference', 'title')),
+            {'HIST-0001': 'HIST-0001', 'HIST-0002': 'Other', 'HIST-0003': 'HIST-0003'},
+        )
+        # Only the rows of this import are counted and announced
+        self.assertEqual(DashboardSnapshot.objects.get(dimension='dossieratmp.location', value='Quai').count, 2)
+        self.assertIn('2 incidents imported', OutboundEmail.objects.get().body)
+
+    def test_queries_do_not_grow_with_rows(self):
+        url = reverse('praevia_app:dossier-bulk')
+        # The first reference of the day also creates the counter row
+        ReferenceCounter.objects.next_reference(DOSSIER_REFERENCE_PREFIX)
+        few = self.measure('post', url, {'file': import_file(self.safety_manager, 3)})
+        # Small enough for one INSERT: SQLite caps bulk_create batches at 999 parameters
+        many = self.measure('post', url, {'file': import_file(self.safety_manager, 30)})
+        self.assertEqual(few.count, many.count)
+        self.assertEqual(DossierATMP.objects.count(), 33)
+
+    def test_command_imports_csv_with_dotted_columns(self):
+        content = (
+            "title,description,date_of_incident,location,salarie.first_name,salarie.last_name,salarie.social_security_number\n"
+            "Chute,Escalier,2024-02-01,Atelier,Jean,Martin,1850575123456\n"
+            "Coupure,Cutter,2024-02-02,Atelier,Anne,,\n"
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write(content)
+        self.addCleanup(os.remove, source.name)
+        out = io.StringIO()
+        call_command('import_dossiers', source.name, user=self.admin.email, batch_size=1, stdout=out)
+
+        dossier = DossierATMP.objects.get()
+        self.assertEqual(dossier.salarie, {'first_name': 'Jean', 'last_name': 'Martin', 'social_security_number': '1850575123456'})
+        self.assertIn('line 3', out.getvalue())
+        self.assertIn('1/2 rows imported, 1 rejected', out.getvalue())
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rh = CustomUser.objects.create_user(email='rh@test.local', password='pass', name='RH', role=UserRole.RH)
+        cls.employee = CustomUser.objects.create_user(
+            email='employee@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute, escalier', description='Ligne 1\nLigne 2', date_of_incident=date(2024, 5, 2),
+            location='Atelier', status=DossierStatus.A_ANALYSER, created_by=cls.employee,
+            entreprise={'name': 'ACME', 'siret': '12345678900011', 'address': '1 rue', 'naf': '2511Z'},
+            salarie={'first_name': 'Jean', 'last_name': 'Martin', 'social_security_number': '1850575123456'},
+        )
+        Audit.objects.create(dossier_atmp=cls.dossier, status=AuditStatus.COMPLETED, decision=AuditDecision.CONTEST)
+
+    def export(self, name, export_format):
+        response = self.client.get(reverse(f'praevia_app:{name}'), {'format': export_format})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_flattens_json_columns(self):
+        self.client.force_login(self.rh)
+        response, content = self.export('dossier-export', 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="dossiers-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['reference'], self.dossier.reference)
+        self.assertEqual(rows[0]['description'], 'Ligne 1\nLigne 2')
+        self.assertEqual(rows[0]['entreprise.siret'], '12345678900011')
+        self.assertEqual(rows[0]['salarie.last_name'], 'Martin')
+        self.assertEqual(rows[0]['accident.date'], '')
+        self.assertEqual(rows[0]['audit__decision'], AuditDecision.CONTEST)
+        # Keys outside the known form fields only go to NDJSON
+        self.assertNotIn('entreprise.naf', rows[0])
+
+    def test_ndjson_keeps_every_json_key(self):
+        self.client.force_login(self.rh)
+        response, content = self.export('dossier-export', 'ndjson')
+        row, = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(row['entreprise.naf'], '2511Z')
+        self.assertEqual(row['date_of_incident'], '2024-05-02')
+        self.assertEqual(row['created_by__email'], 'employee@test.local')
+
+    def test_csv_neutralizes_formulas_but_ndjson_keeps_them(self):
+        DossierATMP.objects.filter(pk=self.dossier.pk).update(
+            title='=HYPERLINK("http://evil.test")', description='+1', location='@SUM(A1)',
+            salarie={'first_name': '-2', 'last_name': 'Martin'},
+        )
+        self.client.force_login(self.rh)
+        response, content = self.export('dossier-export', 'csv')
+        row, = csv.DictReader(io.StringIO(content.lstrip('\ufeff')))
+        self.assertEqual(
+            (row['title'], row['description'], row['location'], row['salarie.first_name'], row['salarie.last_name']),
+            ('\'=HYPERLINK("http://evil.test")', "'+1", "'@SUM(A1)", "'-2", 'Martin'),
+        )
+        response, content = self.export('dossier-export', 'ndjson')
+        row = json.loads(content)
+        self.assertEqual(
+            (row['title'], row['description'], row['location'], row['salarie.first_name']),
+            ('=HYPERLINK("http://evil.test")', '+1', '@SUM(A1)', '-2'),
+        )
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_rows_are_fetched_in_chunks(self):
+        for i in range(4):
+            Audit.objects.create(dossier_atmp=DossierATMP.objects.create(
+                title=f'Incident {i}', description='-', date_of_incident=date(2024, 5, 2),
+                location='Atelier', status=DossierStatus.A_ANALYSER, created_by=self.employee,
+            ))
+        self.client.force_login(CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin'))
+        response, content = self.export('audit-export', 'ndjson')
+        self.assertEqual(len(content.splitlines()), 5)
+
+    def test_export_requires_an_export_role(self):
+        self.client.force_login(self.employee)
+        response = self.client.get(reverse('praevia_app:dossier-export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 403)
+        # Roles without access to the list cannot export it either
+        for role, name in [(UserRole.RH, 'audit-export'), (UserRole.QSE, 'audit-export'), (UserRole.DIRECTION, 'audit-export'),
+                           (UserRole.DIRECTION, 'contentieux-export')]:
+            with self.subTest(role=role, name=name):
+                self.client.force_login(CustomUser.objects.create_user(
+                    email=f'{role.lower()}-{name}@test.local', password='pass', name=role, role=role
+                ))
+                response = self.client.get(reverse(f'praevia_app:{name}'))
+                self.assertEqual(response.status_code, 403)
+
+    def test_export_is_scoped_like_the_list(self):
+        # Employees only see the dossiers they created
+        other = CustomUser.objects.create_user(email='other@test.local', password='pass', name='Other', role=UserRole.EMPLOYEE)
+        with patch.object(DossierViewSet, 'export_roles', (UserRole.EMPLOYEE,)):
+            self.client.force_login(other)
+            self.assertEqual(self.export('dossier-export', 'ndjson')[1], '')
+            self.client.force_login(self.employee)
+            self.assertEqual(len(self.export('dossier-export', 'ndjson')[1].splitlines()), 1)
+
+
+class DossierSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.martin = cls.create_dossier(
+            'Chute dans l\'escalier', 'Entrepôt Nord',
+            salarie={'first_name': 'Jean', 'last_name': 'Martin', 'social_security_number': '185057512345678'},
+            entreprise={'name': 'Établissements Dupont', 'siret': '12345678900011', 'address': '1 rue'},
+        )
+        cls.durand = cls.create_dossier(
+            'Coupure', 'Atelier',
+            salarie={'first_name': 'Anne', 'last_name': 'Durand', 'social_security_number': '285057512345678'},
+            accident={'date': '2024-01-01', 'time': '10:00', 'description': 'Cutter glissé'},
+        )
+
+    @classmethod
+    def create_dossier(cls, title, location, **json_fields):
+        return DossierATMP.objects.create(
+            title=title, description='-', date_of_incident=date(2024, 1, 1), location=location,
+            status=DossierStatus.A_ANALYSER, created_by=cls.admin, **json_fields,
+        )
+
+    def search(self, query):
+        return set(search_dossiers(DossierATMP.objects.all(), query))
+
+    def test_matches_json_contents_by_prefix_and_without_accents(self):
+        self.assertEqual(self.search('mart'), {self.martin})
+        self.assertEqual(self.search('12345678900011'), {self.martin})
+        self.assertEqual(self.search('185057512345678'), {self.martin})
+        self.assertEqual(self.search('etablissements'), {self.martin})
+        self.assertEqual(self.search('entrepot nord'), {self.martin})
+        self.assertEqual(self.search('cutter'), {self.durand})
+        self.assertEqual(self.search('jean durand'), set())
+        self.assertEqual(self.search('  '), {self.martin, self.durand})
+        self.assertEqual(self.search('"*) OR ('), set())
+
+    def test_accents_are_ignored_both_ways(self):
+        helene = self.create_dossier('Chute', 'Quai', salarie={'first_name': 'Hélène', 'last_name': 'Lefèvre'})
+        for query in ('helene', 'HÉLÈNE', 'hélè lefev'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), {helene})
+
+    @skipUnless(connection.vendor == 'postgresql', 'The unaccented text search configuration is PostgreSQL specific')
+    def test_postgresql_columns_use_the_unaccented_configuration(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT to_tsvector(%s::regconfig, 'Hélène Évreux') = to_tsvector(%s::regconfig, 'helene evreux')",
+                [SEARCH_CONFIG, SEARCH_CONFIG],
+            )
+            self.assertTrue(cursor.fetchone()[0])
+            for table in ('praevia_app_dossieratmp', 'praevia_app_document'):
+                cursor.execute(
+                    "SELECT pg_get_expr(d.adbin, d.adrelid) FROM pg_attrdef d JOIN pg_attribute a "
+                    "ON a.attrelid = d.adrelid AND a.attnum = d.adnum WHERE d.adrelid = %s::regclass AND a.attname = 'search_vector'",
+                    [table],
+                )
+                self.assertIn(SEARCH_CONFIG, cursor.fetchone()[0])
+        document = Document.objects.create(uploaded_by=self.admin, description='Expertise de Mme Hélène')
+        self.assertEqual(list(search_documents(Document.objects.all(), 'helene')), [document])
+
+    def test_index_follows_updates_deletes_and_bulk_inserts(self):
+        self.durand.salarie = {**self.durand.salarie, 'last_name': 'Lefebvre'}
+        self.durand.save()
+        self.assertEqual(self.search('durand'), set())
+        self.assertEqual(self.search('lefebvre'), {self.durand})
+
+        bulk = DossierATMP(
+            title='Brûlure', description='-', date_of_incident=date(2024, 1, 1), location='Cuisine',
+            status=DossierStatus.A_ANALYSER, created_by=self.admin, salarie={'last_name': 'Petit'},
+        )
+        bulk.prepare_for_save()
+        DossierATMP.objects.bulk_create([bulk])
+        self.assertEqual({dossier.title for dossier in self.search('petit')}, {'Brûlure'})
+
+        self.martin.delete()
+        self.assertEqual(self.search('martin'), set())
+
+    def test_q_parameter_on_api_and_html_list(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('praevia_app:dossier-list'), {'q': 'Martin'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.martin.pk])
+
+        response = self.client.get(reverse('praevia_app:incident-list'), {'q': 'durand'})
+        self.assertEqual(list(response.context['incidents']), [self.durand])
+        self.assertContains(response, 'value="durand"')
+
+
+class DossierFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.lefevre = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.A_ANALYSER, created_by=cls.admin,
+            entreprise={'name': 'ACME', 'siret': '123 456 789 00011', 'address': '1 rue'},
+            salarie={'first_name': 'Paul', 'last_name': 'Lefèvre', 'social_security_number': '1 85 05 75 123 456 78'},
+            accident={'date': '2024-03-01', 'time': '08:00', 'description': '-'},
+        )
+        cls.other = DossierATMP.objects.create(
+            title='Coupure', description='-', date_of_incident=date(2024, 6, 1), location='Atelier',
+            status=DossierStatus.A_ANALYSER, created_by=cls.admin,
+            entreprise={'siret': '98765432100022'}, salarie={'last_name': 'Lefort'},
+            accident={'date': 'not a date'},
+        )
+
+    def test_columns_are_populated_on_save(self):
+        self.assertEqual(self.lefevre.siret, '12345678900011')
+        self.assertEqual(self.lefevre.salarie_last_name, 'lefevre')
+        self.assertEqual(len(self.lefevre.salarie_nss_hash), 64)
+        self.assertEqual(self.lefevre.accident_date, date(2024, 3, 1))
+        self.assertIsNone(self.other.accident_date)
+        self.assertEqual(self.other.salarie_nss_hash, '')
+
+    def filtered(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('praevia_app:dossier-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.json()['results']}
+
+    def test_api_filters(self):
+        self.assertEqual(self.filtered(siret='12345678900011'), {self.lefevre.pk})
+        self.assertEqual(self.filtered(last_name='LEFEVRE'), {self.lefevre.pk})
+        self.assertEqual(self.filtered(last_name_prefix='lef'), {self.lefevre.pk, self.other.pk})
+        self.assertEqual(self.filtered(nss='185057512345678'), {self.lefevre.pk})
+        self.assertEqual(self.filtered(nss='285057512345678'), set())
+        self.assertEqual(self.filtered(accident_date_after='2024-01-01', accident_date_before='2024-03-31'), {self.lefevre.pk})
+        self.assertEqual(self.filtered(siret='98765432100022', q='coupure'), {self.other.pk})
+
+    def test_status_filters(self):
+        self.other.status = DossierStatus.CLOTURE_SANS_SUITE
+        self.other.save(update_fields=['status'])
+        self.assertEqual(self.filtered(open='true'), {self.lefevre.pk})
+        self.assertEqual(self.filtered(open='false'), {self.other.pk})
+        self.assertEqual(self.filtered(status='CLOTURE_SANS_SUITE,A_ANALYSER'), {self.lefevre.pk, self.other.pk})
+
+
+class DossierListShapeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.TRANSFORME_EN_CONTENTIEUX, created_by=cls.admin, safety_manager=cls.admin,
+        )
+        Audit.objects.create(dossier_atmp=cls.dossier, auditor=cls.admin, status=AuditStatus.COMPLETED, decision=AuditDecision.CONTEST)
+        Contentieux.objects.create(dossier_atmp=cls.dossier, subject={}, status=ContentieuxStatus.EN_COURS)
+        cls.dossier.documents.add(Document.objects.create(uploaded_by=cls.admin, description='Scan'))
+
+    def row(self, **params):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('praevia_app:dossier-list'), params)
+        self.assertEqual(response.status_code, 200)
+        row, = response.json()['results']
+        return row
+
+    def test_default_rows_are_flat(self):
+        row = self.row()
+        self.assertEqual(list(row), [
+            'id', 'reference', 'title', 'date_of_incident', 'location', 'status', 'status_display',
+            'safety_manager', 'safety_manager_email', 'created_by', 'service_sante', 'documents_count',
+            'temoins_count', 'created_at',
+        ])
+        self.assertEqual((row['safety_manager_email'], row['documents_count'], row['temoins_count']), ('admin@test.local', 1, 0))
+
+    def test_expanded_sections(self):
+        row = self.row(expand='audit,contentieux,documents')
+        self.assertEqual(list(row)[-4:], ['audit', 'contentieux', 'documents', 'created_at'])
+        self.assertEqual(list(row['audit']), [
+            'id', 'dossier_atmp', 'auditor', 'status', 'status_display', 'decision', 'decision_display',
+            'comments', 'started_at', 'completed_at', 'created_at',
+        ])
+        self.assertEqual(row['audit']['decision'], AuditDecision.CONTEST)
+        self.assertEqual(list(row['contentieux']), ['id', 'reference', 'status', 'status_display', 'created_at'])
+        document, = row['documents']
+        self.assertEqual(list(document), [
+            'id', 'contentieux', 'uploaded_by', 'document_type', 'document_type_display', 'original_name',
+            'mime_type', 'size', 'created_at', 'processing_status', 'detected_mime_type', 'page_count', 'thumbnail',
+        ])
+
+    def test_unknown_expand_names_are_ignored(self):
+        row = self.row(expand='audit, salarie,nope')
+        self.assertIn('audit', row)
+        self.assertFalse({'contentieux', 'documents', 'salarie', 'nope'} & set(row))
+        self.assertEqual(set(self.row(expand='')), set(self.row()))
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.ANALYSE_EN_COURS, created_by=cls.admin, safety_manager=cls.admin,
+            entreprise={'name': 'ACME'}, salarie={'last_name': 'Martin'},
+        )
+        Audit.objects.create(dossier_atmp=cls.dossier, auditor=cls.admin, status=AuditStatus.IN_PROGRESS)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, name, args=(), **params):
+        with QueryRecorder() as recorder:
+            response = self.client.get(reverse(f'praevia_app:{name}', args=args), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), [sql for sql, _ in recorder.queries]
+
+    def test_fields_narrow_the_payload_and_the_sql(self):
+        full, full_queries = self.get('dossier-detail', [self.dossier.pk])
+        payload, queries = self.get('dossier-detail', [self.dossier.pk], fields='id,reference,status')
+        self.assertEqual(list(payload), ['id', 'reference', 'status'])
+        self.assertLess(len(queries), len(full_queries))
+        dossier_select, = [sql for sql in queries if 'FROM "praevia_app_dossieratmp"' in sql]
+        for column in ('entreprise', 'salarie', 'accident', 'description'):
+            self.assertNotIn(f'"praevia_app_dossieratmp"."{column}"', dossier_select)
+        self.assertNotIn('JOIN "users_customuser"', dossier_select)
+        self.assertFalse([sql for sql in queries if 'praevia_app_audit' in sql or 'praevia_app_document' in sql])
+
+    def test_omit_drops_json_columns(self):
+        payload, queries = self.get('dossier-detail', [self.dossier.pk], omit='entreprise,salarie,accident')
+        self.assertFalse({'entreprise', 'salarie', 'accident'} & set(payload))
+        self.assertEqual((payload['title'], payload['audit']['status']), ('Chute', AuditStatus.IN_PROGRESS))
+        dossier_select, = [sql for sql in queries if 'FROM "praevia_app_dossieratmp"' in sql]
+        self.assertNotIn('"praevia_app_dossieratmp"."entreprise"', dossier_select)
+        self.assertIn('"praevia_app_dossieratmp"."title"', dossier_select)
+
+    def test_relations_are_kept_for_the_fields_reading_them(self):
+        payload, queries = self.get('audit-list', fields='id,auditor')
+        row, = payload['results']
+        # Nested serializers render in full
+        self.assertEqual((list(row), row['auditor']['email']), (['id', 'auditor'], 'admin@test.local'))
+        self.assertTrue([sql for sql in queries if 'FROM "praevia_app_audit"' in sql and 'JOIN "users_customuser"' in sql])
+
+        payload, queries = self.get('audit-list', fields='id,status')
+        self.assertEqual(list(payload['results'][0]), ['id', 'status'])
+        self.assertFalse([sql for sql in queries if 'FROM "praevia_app_audit"' in sql and 'JOIN "users_customuser"' in sql])
+
+    def test_unknown_field_names_are_rejected(self):
+        response = self.client.get(reverse('praevia_app:dossier-list'), {'fields': 'id,nope', 'omit': 'zzz'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown field(s): nope.'], 'omit': ['Unknown field(s): zzz.']})
+
+
+@patch.object(KeysetPagination, 'page_size', 3)
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+        cls.dossiers = [
+            DossierATMP.objects.create(
+                title=f'Chute {i}', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+                status=DossierStatus.A_ANALYSER, created_by=cls.admin,
+            )
+            for i in range(8)
+        ]
+        # Ties on created_at: the pages are split inside a group of equal timestamps
+        now = timezone.now()
+        DossierATMP.objects.filter(pk__in=[dossier.pk for dossier in cls.dossiers[:5]]).update(created_at=now)
+        DossierATMP.objects.filter(pk__in=[dossier.pk for dossier in cls.dossiers[5:]]).update(created_at=now - timedelta(days=1))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, url=None, **params):
+        return self.client.get(url or reverse('praevia_app:dossier-list'), params)
+
+    def test_cursor_walks_every_row_once(self):
+        expected = list(DossierATMP.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        seen, response = [], self.get(pagination='cursor')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            payload = response.json()
+            self.assertEqual(payload['count'], 8)
+            seen.extend(row['id'] for row in payload['results'])
+            if payload['next'] is None:
+                break
+            response = self.get(payload['next'])
+        self.assertEqual(seen, expected)
+
+    def test_malformed_or_edited_cursor_is_a_bad_request(self):
+        encode = KeysetPagination().encode_cursor
+        cursors = [
+            'not base64 !', 'bm90IGEgY3Vyc29y',  # "not a cursor"
+            encode(timezone.now(), 'abc'), encode(timezone.now(), 10 ** 30), encode(timezone.now(), -1),
+            encode(datetime(2024, 1, 1), 1),  # naive datetime
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.get(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'cursor': ['Invalid cursor']})
+
+    def test_count_false_skips_the_count_query(self):
+        with QueryRecorder() as recorder:
+            self.assertEqual(self.get(pagination='cursor').json()['count'], 8)
+        self.assertTrue([sql for sql, _ in recorder.queries if sql.startswith('SELECT COUNT(*)')])
+        for params in ({'pagination': 'cursor'}, {}):
+            with self.subTest(**params), QueryRecorder() as recorder:
+                payload = self.get(count='false', **params).json()
+            self.assertNotIn('count', payload)
+            self.assertEqual(len(payload['results']), 3)
+            self.assertIsNotNone(payload['next'])
+            self.assertFalse([sql for sql, _ in recorder.queries if sql.startswith('SELECT COUNT(*)')])
+
+        last = self.get(count='false', page=3).json()
+        self.assertEqual((len(last['results']), last['next']), (2, None))
+        self.assertIn('page=2', last['previous'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is backend specific')
+class IndexPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+
+    def plan(self, queryset):
+        return queryset.explain()
+
+    def test_role_scoped_lists_use_composite_indexes(self):
+        recent = ('-created_at', '-id')
+        plans = {
+            'dossier_creator_recent_idx': DossierATMP.objects.filter(created_by=self.admin).order_by(*recent)[:20],
+            'dossier_manager_recent_idx': DossierATMP.objects.filter(safety_manager=self.admin).order_by(*recent)[:20],
+            'audit_auditor_recent_idx': Audit.objects.filter(auditor=self.admin).order_by(*recent)[:20],
+            'document_uploader_recent_idx': Document.objects.filter(uploaded_by=self.admin).order_by(*recent)[:20],
+        }
+        for index, queryset in plans.items():
+            with self.subTest(index=index):
+                plan = self.plan(queryset)
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_dashboard_group_by_uses_covering_index(self):
+        plan = self.plan(DossierATMP.objects.values('status').annotate(count=Count('id')).order_by())
+        self.assertIn('COVERING INDEX dossier_status_idx', plan)
+
+
+class DashboardSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = CustomUser.objects.create_user(
+            email='employee@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+        cls.safety_manager = CustomUser.objects.create_user(
+            email='safety@test.local', password='pass', name='Safety', role=UserRole.SAFETY_MANAGER
+        )
+        for i in range(2):
+            DossierATMP.objects.create(
+                title=f'Chute {i}', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+                status=DossierStatus.A_ANALYSER, created_by=cls.employee, safety_manager=cls.safety_manager,
+            )
+
+    def snapshot(self):
+        return set(DashboardSnapshot.objects.filter(count__gt=0).values_list('dimension', 'value', 'count'))
+
+    def test_user_changes_move_their_rows(self):
+        self.employee.role = UserRole.RH
+        self.employee.save()
+        self.safety_manager.email = 'qse@test.local'
+        self.safety_manager.save(update_fields=['email'])
+        self.assertIn(('dossieratmp.created_by__role', UserRole.RH, 2), self.snapshot())
+        self.assertIn(('dossieratmp.safety_manager__email', 'qse@test.local', 2), self.snapshot())
+
+        moved = self.snapshot()
+        rebuild_dashboard_snapshot()
+        self.assertEqual(moved, self.snapshot())
+
+    def assertSnapshotIsFresh(self):
+        # The buckets kept by the signals are the ones a rebuild computes from the tables
+        kept = self.snapshot()
+        rebuild_dashboard_snapshot()
+        self.assertEqual(kept, self.snapshot())
+
+    def test_every_kind_of_write_moves_the_buckets(self):
+        dossier = DossierATMP.objects.create(
+            title='Coupure', description='-', date_of_incident=date(2024, 6, 1), location='Quai',
+            status=DossierStatus.A_ANALYSER, created_by=self.employee,
+        )
+        audit = Audit.objects.create(dossier_atmp=dossier, auditor=self.safety_manager, status=AuditStatus.IN_PROGRESS)
+        contentieux = Contentieux.objects.create(dossier_atmp=dossier, subject={}, status=ContentieuxStatus.DRAFT)
+        step = JuridictionStep.objects.create(
+            contentieux=contentieux, juridiction=JuridictionType.TRIBUNAL_JUDICIAIRE, submitted_at=timezone.now(),
+        )
+        self.assertIn(('dossieratmp.status', DossierStatus.A_ANALYSER, 3), self.snapshot())
+        self.assertSnapshotIsFresh()
+
+        dossier.status = DossierStatus.TRANSFORME_EN_CONTENTIEUX
+        dossier.safety_manager = self.safety_manager
+        dossier.location = 'Atelier'
+        dossier.save()
+        audit.status, audit.decision = AuditStatus.COMPLETED, AuditDecision.CONTEST
+        audit.save()
+        contentieux.status = ContentieuxStatus.EN_COURS
+        contentieux.save()
+        step.juridiction, step.decision = JuridictionType.COUR_APPEL, 'FAVORABLE'
+        step.save()
+        self.assertIn(('dossieratmp.location', 'Atelier', 3), self.snapshot())
+        self.assertIn(('audit.decision', AuditDecision.CONTEST, 1), self.snapshot())
+        self.assertSnapshotIsFresh()
+
+        step.delete()
+        audit.delete()
+        self.assertSnapshotIsFresh()
+        # The contentieux goes with its dossier (cascade)
+        dossier.delete()
+        self.assertNotIn('contentieux.status', {dimension for dimension, _, _ in self.snapshot()})
+        self.assertSnapshotIsFresh()
+
+    def test_rebuild_command(self):
+        DashboardSnapshot.objects.all().delete()
+        DashboardSnapshot.objects.create(dimension='dossieratmp.status', value=DossierStatus.CLOTURE_SANS_SUITE, count=7)
+        out = io.StringIO()
+        call_command('rebuild_dashboard_stats', stdout=out)
+        self.assertIn('Dashboard statistics rebuilt (4 buckets)', out.getvalue())
+        self.assertEqual(self.snapshot(), {
+            ('dossieratmp.status', DossierStatus.A_ANALYSER, 2),
+            ('dossieratmp.location', 'Atelier', 2),
+            ('dossieratmp.created_by__role', UserRole.EMPLOYEE, 2),
+            ('dossieratmp.safety_manager__email', 'safety@test.local', 2),
+        })
+
+    def test_login_does_not_touch_the_snapshot(self):
+        self.employee.last_login = timezone.now()
+        with self.assertNumQueries(1):
+            self.employee.save(update_fields=['last_login'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class DashboardStatsTests(TestCase):
+    """The conditional aggregates and snapshot buckets give the per-status count() of each role's cards."""
+
+    @classmethod
+    def setUpTestData(cls):
+        def user(role):
+            return CustomUser.objects.create_user(email=f'{role.lower()}@test.local', password='pass', name=role, role=role)
+
+        cls.users = {role: user(role) for role in (
+            UserRole.EMPLOYEE, UserRole.SAFETY_MANAGER, UserRole.JURISTE, UserRole.RH, UserRole.QSE, UserRole.DIRECTION,
+        )}
+        employee, manager = cls.users[UserRole.EMPLOYEE], cls.users[UserRole.SAFETY_MANAGER]
+
+        def dossier(status, created_by=employee, safety_manager=manager):
+            return DossierATMP.objects.create(
+                title=status, description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+                status=status, created_by=created_by, safety_manager=safety_manager,
+            )
+
+        dossier(DossierStatus.A_ANALYSER)
+        in_analysis = dossier(DossierStatus.ANALYSE_EN_COURS)
+        dossier(DossierStatus.CLOTURE_SANS_SUITE, safety_manager=None)
+        contested = dossier(DossierStatus.TRANSFORME_EN_CONTENTIEUX, created_by=cls.users[UserRole.RH])
+        not_contested = dossier(DossierStatus.CONTESTATION_RECOMMANDEE)
+        Audit.objects.create(dossier_atmp=in_analysis, auditor=manager, status=AuditStatus.IN_PROGRESS)
+        Audit.objects.create(dossier_atmp=contested, auditor=manager, status=AuditStatus.COMPLETED, decision=AuditDecision.CONTEST)
+        Audit.objects.create(
+            dossier_atmp=not_contested, auditor=manager, status=AuditStatus.COMPLETED, decision=AuditDecision.DO_NOT_CONTEST,
+        )
+        contentieux = Contentieux.objects.create(dossier_atmp=contested, subject={}, status=ContentieuxStatus.EN_COURS)
+        Contentieux.objects.create(dossier_atmp=not_contested, subject={}, status=ContentieuxStatus.DRAFT)
+        JuridictionStep.objects.create(
+            contentieux=contentieux, juridiction=JuridictionType.TRIBUNAL_JUDICIAIRE, submitted_at=timezone.now(),
+        )
+
+    def baseline(self, user):
+        """The counters as the dashboards computed them before DashboardStats: one count() each."""
+        dossiers, audits, contentieux = DossierATMP.objects, Audit.objects, Contentieux.objects
+        return {
+            'dossiers': {
+                'total': dossiers.count(),
+                'a_analyser': dossiers.filter(status=DossierStatus.A_ANALYSER).count(),
+                'analyse_en_cours': dossiers.filter(status=DossierStatus.ANALYSE_EN_COURS).count(),
+                'open': dossiers.exclude(status=DossierStatus.CLOTURE_SANS_SUITE).count(),
+                'created_by_employee': dossiers.filter(created_by__role=UserRole.EMPLOYEE).count(),
+                'mine': dossiers.filter(created_by=user).count(),
+                'managed': dossiers.filter(safety_manager=user).count(),
+            },
+            'contentieux': {'total': contentieux.count(), 'en_cours': contentieux.filter(status=ContentieuxStatus.EN_COURS).count()},
+            'contentieux_origin': {
+                'from_contested': contentieux.filter(dossier_atmp__audit__decision=AuditDecision.CONTEST).count(),
+                'from_not_contested': contentieux.filter(dossier_atmp__audit__decision=AuditDecision.DO_NOT_CONTEST).count(),
+            },
+            'audits': {
+                'total': audits.count(),
+                'in_progress': audits.filter(status=AuditStatus.IN_PROGRESS).count(),
+                'completed': audits.filter(status=AuditStatus.COMPLETED).count(),
+                'contest': audits.filter(decision=AuditDecision.CONTEST).count(),
+            },
+            'juridiction_steps': {'total': JuridictionStep.objects.count()},
+        }
+
+    def test_counters_of_every_role(self):
+        shared = {
+            'contentieux': {'total': 2, 'en_cours': 1},
+            'contentieux_origin': {'from_contested': 1, 'from_not_contested': 1},
+            'audits': {'total': 3, 'in_progress': 1, 'completed': 2, 'contest': 1},
+            'juridiction_steps': {'total': 1},
+        }
+        own = {UserRole.EMPLOYEE: (4, 0), UserRole.SAFETY_MANAGER: (0, 4), UserRole.RH: (1, 0)}
+        for role, user in self.users.items():
+            with self.subTest(role=role):
+                stats = DashboardStats(user)
+                mine, managed = own.get(role, (0, 0))
+                expected = {
+                    'dossiers': {
+                        'total': 5, 'a_analyser': 1, 'analyse_en_cours': 1, 'open': 4,
+                        'created_by_employee': 4, 'mine': mine, 'managed': managed,
+                    },
+                    **shared,
+                }
+                actual = {counter: getattr(stats, counter) for counter in expected}
+                self.assertEqual(actual, expected)
+                self.assertEqual(actual, self.baseline(user))
+
+    def test_breakdowns(self):
+        stats = DashboardStats()
+        self.assertEqual(stats.breakdown(Contentieux, 'status'), [
+            {'status': ContentieuxStatus.DRAFT, 'count': 1}, {'status': ContentieuxStatus.EN_COURS, 'count': 1},
+        ])
+        self.assertEqual(
+            stats.breakdown(DossierATMP, 'status', order_by='-count'),
+            list(DossierATMP.objects.values('status').annotate(count=Count('id')).order_by('-count', 'status')),
+        )
+
+    def test_role_api_dashboards(self):
+        payloads = {
+            'rh_dashboard_data': (UserRole.RH, {
+                'totalDossiers': 5, 'incidentsAAnalyser': 1, 'incidentsCreatedByEmployee': 4,
+            }),
+            'qse_dashboard_data': (UserRole.QSE, {
+                'totalDossiers': 5, 'auditsCompleted': 2, 'auditsInProgress': 1, 'dossiersContestedRecommended': 1,
+            }),
+            'jurist_dashboard_data': (UserRole.JURISTE, {'totalContentieux': 2, 'pendingContentieux': 1}),
+        }
+        for name, (role, expected) in payloads.items():
+            with self.subTest(name=name):
+                self.client.force_login(self.users[role])
+                payload = self.client.get(reverse(f'praevia_app:{name}')).json()
+                self.assertEqual({key: payload[key] for key in expected}, expected)
+        self.client.force_login(self.users[UserRole.DIRECTION])
+        stats = self.client.get(reverse('praevia_app:direction_dashboard_data')).json()['stats']
+        self.assertEqual((stats['openDossiers'], stats['totalDossiers'], stats['totalRiskValue']), (4, 5, 4 * 5000))
+
+
+class DashboardCacheTestMixin:
+    """
+    Versioned dashboard cache (dashboard.cached_dashboard) against the
+    backend of `cache_settings()`: subclasses run it on each backend that
+    works without a cache server.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rh = CustomUser.objects.create_user(email='rh@test.local', password='pass', name='RH', role=UserRole.RH)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(CACHES={'default': self.cache_settings()}))
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'total': DossierATMP.objects.count()}
+
+    def read(self):
+        return cached_dashboard('test', (DossierATMP,), self.build)
+
+    def create_dossier(self):
+        return DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier', created_by=self.rh,
+        )
+
+    def test_hit_then_miss_after_a_committed_write(self):
+        self.assertEqual(self.read(), {'total': 0})
+        self.assertEqual(self.read(), {'total': 0})
+        self.assertEqual(self.builds, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_dossier()
+            # Not bumped before the commit: a reader would cache pre-commit data under the new generation
+            self.assertEqual(self.read(), {'total': 0})
+            self.assertEqual(self.builds, 1)
+        self.assertEqual(self.read(), {'total': 1})
+        self.assertEqual(self.read(), {'total': 1})
+        self.assertEqual(self.builds, 2)
+
+    def test_rolled_back_write_keeps_the_generation(self):
+        before = dashboard_generations([DossierATMP])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.create_dossier()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(dashboard_generations([DossierATMP]), before)
+
+    def test_other_models_keep_their_entries(self):
+        self.read()
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_dashboards(Contentieux)
+        self.read()
+        self.assertEqual(self.builds, 1)
+
+    def test_evicted_generation_is_never_reused(self):
+        self.read()
+        caches['default'].delete(f"dashboard:generation:{DossierATMP._meta.label_lower}")
+        self.read()
+        self.assertEqual(self.builds, 2)
+
+    def test_api_dashboard_follows_writes(self):
+        self.client.force_login(self.rh)
+        url = reverse('praevia_app:rh_dashboard_data')
+        self.assertEqual(self.client.get(url).json()['totalDossiers'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_dossier()
+        self.assertEqual(self.client.get(url).json()['totalDossiers'], 1)
+
+
+class LocMemDashboardCacheTests(DashboardCacheTestMixin, TestCase):
+
+    def cache_settings(self):
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'dashboard-{self.id()}'}
+
+
+class FileBasedDashboardCacheTests(DashboardCacheTestMixin, TestCase):
+
+    def cache_settings(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location.name}
+
+
+class ReferenceCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(email='admin@test.local', password='pass', name='Admin')
+
+    def create_dossier(self, **fields):
+        return DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.A_ANALYSER, created_by=self.admin, **fields,
+        )
+
+    def test_references_are_sequential_per_prefix_and_day(self):
+        today = timezone.localdate()
+        first, second = self.create_dossier(), self.create_dossier()
+        self.assertEqual(first.reference, format_reference(DOSSIER_REFERENCE_PREFIX, today, 1))
+        self.assertEqual(second.reference, format_reference(DOSSIER_REFERENCE_PREFIX, today, 2))
+        self.assertEqual(second.reference, f"ATMP-{today:%Y%m%d}-000002")
+        self.assertEqual(
+            ReferenceCounter.objects.next_reference(CONTENTIEUX_REFERENCE_PREFIX),
+            format_reference(CONTENTIEUX_REFERENCE_PREFIX, today, 1),
+        )
+        yesterday = today - timedelta(days=1)
+        self.assertEqual(
+            ReferenceCounter.objects.next_reference(DOSSIER_REFERENCE_PREFIX, day=yesterday),
+            format_reference(DOSSIER_REFERENCE_PREFIX, yesterday, 1),
+        )
+
+    def test_block_allocation_is_one_update(self):
+        ReferenceCounter.objects.next_reference(DOSSIER_REFERENCE_PREFIX)
+        with self.assertNumQueries(4):  # savepoint, UPDATE, SELECT, release
+            block = ReferenceCounter.objects.allocate(DOSSIER_REFERENCE_PREFIX, 500)
+        self.assertEqual(len(set(block)), 500)
+        self.assertEqual(block, sorted(block))
+        self.assertEqual(ReferenceCounter.objects.next_reference(DOSSIER_REFERENCE_PREFIX), block[-1][:-6] + '000502')
+
+    def test_contentieux_from_audits_finalized_in_the_same_second(self):
+        first, second = self.create_dossier(), self.create_dossier()
+        contentieux = [
+            ContentieuxService.create_from_audit(Audit.objects.create(dossier_atmp=dossier), dossier)
+            for dossier in (first, second)
+        ]
+        self.assertEqual(
+            [item.reference for item in contentieux],
+            [format_reference(CONTENTIEUX_REFERENCE_PREFIX, timezone.localdate(), number) for number in (1, 2)],
+        )
+
+
+class AuditFinalizationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user(
+            email='manager@test.local', password='pass', name='Manager', role=UserRole.SAFETY_MANAGER
+        )
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.ANALYSE_EN_COURS, created_by=cls.manager, safety_manager=cls.manager,
+        )
+        cls.audit = Audit.objects.create(dossier_atmp=cls.dossier, auditor=cls.manager, status=AuditStatus.IN_PROGRESS)
+
+    def finalize(self, decision=AuditDecision.CONTEST, key=None, audit=None):
+        self.client.force_login(self.manager)
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('praevia_app:audit-finalize', args=[(audit or self.audit).pk]),
+            {'decision': decision, 'comments': 'OK'}, content_type='application/json', **headers,
+        )
+
+    def test_contest_creates_one_contentieux(self):
+        response = self.finalize()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('contentieux', response.json())
+        self.dossier.refresh_from_db()
+        self.assertEqual(self.dossier.status, DossierStatus.TRANSFORME_EN_CONTENTIEUX)
+
+        again = self.finalize()
+        self.assertEqual(again.status_code, 400)
+        self.assertEqual(again.json(), {'message': 'Audit already completed'})
+        self.assertEqual(Contentieux.objects.filter(dossier_atmp=self.dossier).count(), 1)
+
+    def test_contest_of_a_dossier_with_a_contentieux_is_a_conflict(self):
+        existing = Contentieux.objects.create(dossier_atmp=self.dossier, subject={'title': 'Earlier'})
+        response = self.finalize()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'message': 'The dossier already has a contentieux'})
+        self.audit.refresh_from_db()
+        self.dossier.refresh_from_db()
+        self.assertEqual(self.audit.status, AuditStatus.IN_PROGRESS)
+        self.assertEqual(self.dossier.status, DossierStatus.ANALYSE_EN_COURS)
+        self.assertEqual(list(Contentieux.objects.filter(dossier_atmp=self.dossier)), [existing])
+
+        # Closing it without contesting is still possible
+        self.assertEqual(self.finalize(decision=AuditDecision.DO_NOT_CONTEST).status_code, 200)
+
+    def test_repeated_key_replays_the_first_response(self):
+        first = self.finalize(key='retry-1')
+        replay = self.finalize(key='retry-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Idempotent-Replayed'], 'false')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(Contentieux.objects.filter(dossier_atmp=self.dossier).count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.finalize(key='committee-1')
+        IdempotencyKey.objects.create(
+            user=self.manager, key='committee-0', fingerprint='-', status_code=200, response={},
+        )
+        IdempotencyKey.objects.filter(key='committee-0').update(created_at=timezone.now() - timedelta(days=2))
+        out = io.StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('1 expired idempotency key(s) deleted', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['committee-1'])
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.finalize(key='retry-1')
+        response = self.finalize(AuditDecision.DO_NOT_CONTEST, key='retry-1')
+        self.assertEqual(response.status_code, 422)
+
+    def test_failed_finalization_stores_nothing(self):
+        with patch.object(ContentieuxService, 'create_from_audit', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                AuditFinalizationService.finalize(self.audit.pk, AuditDecision.CONTEST, 'OK', self.manager, 'retry-1')
+        self.audit.refresh_from_db()
+        self.assertEqual(self.audit.status, AuditStatus.IN_PROGRESS)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.finalize(key='retry-1').status_code, 200)
+
+    def test_batch_reports_one_outcome_per_item(self):
+        contested = self.audit
+        other_dossier = DossierATMP.objects.create(
+            title='Coupure', description='-', date_of_incident=date(2024, 3, 2), location='Atelier',
+            status=DossierStatus.ANALYSE_EN_COURS, created_by=self.manager, safety_manager=self.manager,
+        )
+        closed = Audit.objects.create(dossier_atmp=other_dossier, auditor=self.manager, status=AuditStatus.IN_PROGRESS)
+        self.client.force_login(self.manager)
+        response = self.client.post(reverse('praevia_app:audit-finalize-batch'), [
+            {'audit_id': contested.pk, 'decision': AuditDecision.CONTEST, 'comments': 'Comité'},
+            {'audit_id': closed.pk, 'decision': AuditDecision.DO_NOT_CONTEST},
+            {'audit_id': contested.pk, 'decision': AuditDecision.CONTEST},
+            {'audit_id': 0, 'decision': AuditDecision.CONTEST},
+            {'audit_id': closed.pk, 'decision': 'MAYBE'},
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            [result['outcome'] for result in body['results']],
+            ['finalized', 'finalized', 'duplicate', 'not_found', 'invalid'],
+        )
+        self.assertEqual((body['finalized'], body['failed']), (2, 3))
+
+        contentieux = Contentieux.objects.get(dossier_atmp=self.dossier)
+        self.assertEqual(body['results'][0]['contentieux'], {'id': contentieux.pk, 'reference': contentieux.reference})
+        self.dossier.refresh_from_db()
+        other_dossier.refresh_from_db()
+        contested.refresh_from_db()
+        self.assertEqual(self.dossier.status, DossierStatus.TRANSFORME_EN_CONTENTIEUX)
+        self.assertEqual(other_dossier.status, DossierStatus.CLOTURE_SANS_SUITE)
+        self.assertEqual((contested.status, contested.comments), (AuditStatus.COMPLETED, 'Comité'))
+        self.assertIsNotNone(contested.completed_at)
+
+        # Bulk writes skip the signals: the snapshot is moved explicitly
+        snapshot = dict(DashboardSnapshot.objects.filter(dimension='dossieratmp.status').values_list('value', 'count'))
+        self.assertEqual(snapshot.get(DossierStatus.ANALYSE_EN_COURS), 0)
+        self.assertEqual(snapshot.get(DossierStatus.TRANSFORME_EN_CONTENTIEUX), 1)
+        self.assertEqual(snapshot.get(DossierStatus.CLOTURE_SANS_SUITE), 1)
+        self.assertEqual(DashboardSnapshot.objects.get(dimension='contentieux.status', value=ContentieuxStatus.DRAFT).count, 1)
+
+        again = self.client.post(reverse('praevia_app:audit-finalize-batch'), [
+            {'audit_id': closed.pk, 'decision': AuditDecision.CONTEST},
+        ], content_type='application/json')
+        self.assertEqual(again.json()['results'][0]['outcome'], 'already_completed')
+
+
+class JuridictionStepTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jurist = CustomUser.objects.create_user(
+            email='jurist@test.local', password='pass', name='Jurist', role=UserRole.JURISTE
+        )
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2024, 3, 1), location='Atelier',
+            status=DossierStatus.TRANSFORME_EN_CONTENTIEUX, created_by=cls.jurist,
+        )
+        cls.contentieux = Contentieux.objects.create(dossier_atmp=cls.dossier, subject={'title': 'Contentieux'})
+
+    def add_step(self, juridiction, day, **fields):
+        return JuridictionStep.objects.create(
+            contentieux=self.contentieux, juridiction=juridiction,
+            submitted_at=timezone.make_aware(datetime(2024, *day)), **fields,
+        )
+
+    def form(self, steps, initial=0):
+        data = {
+            'dossier_atmp': self.dossier.pk, 'status': ContentieuxStatus.EN_COURS,
+            'subject_title': 'Contentieux', 'subject_description': '',
+            'juridiction_steps-TOTAL_FORMS': len(steps), 'juridiction_steps-INITIAL_FORMS': initial,
+        }
+        for i, step in enumerate(steps):
+            data.update({f'juridiction_steps-{i}-{field}': value for field, value in step.items()})
+        return ContentieuxForm(data, instance=self.contentieux)
+
+    def test_steps_endpoint_returns_the_timeline_in_order(self):
+        later = self.add_step(JuridictionType.TRIBUNAL_JUDICIAIRE, (6, 1))
+        first = self.add_step(JuridictionType.COUR_APPEL, (4, 1))
+        self.client.force_login(self.jurist)
+        with self.assertNumQueries(4):  # session, user, contentieux, steps
+            response = self.client.get(reverse('praevia_app:contentieux-steps', args=[self.contentieux.pk]))
+        self.assertEqual([step['id'] for step in response.json()], [first.pk, later.pk])
+
+        detail = self.client.get(reverse('praevia_app:contentieux-detail', args=[self.contentieux.pk])).json()
+        self.assertEqual([step['id'] for step in detail['juridiction_steps']], [first.pk, later.pk])
+
+    def test_form_writes_steps_in_bulk(self):
+        kept = self.add_step(JuridictionType.TRIBUNAL_JUDICIAIRE, (4, 1), notes='Saisine')
+        edited = self.add_step(JuridictionType.TRIBUNAL_JUDICIAIRE, (5, 1))
+        removed = self.add_step(JuridictionType.TRIBUNAL_JUDICIAIRE, (6, 1))
+        form = self.form([
+            {'step_id': kept.pk, 'step_type': JuridictionType.TRIBUNAL_JUDICIAIRE, 'step_date': '2024-04-01', 'step_notes': 'Saisine'},
+            {'step_id': edited.pk, 'step_type': JuridictionType.COUR_APPEL, 'step_date': '2024-05-02', 'step_notes': ''},
+            {'step_id': removed.pk, 'step_type': JuridictionType.TRIBUNAL_JUDICIAIRE, 'step_date': '2024-06-01', 'DELETE': 'on'},
+            {'step_type': JuridictionType.COUR_CASSATION, 'step_date': '2024-07-01', 'step_notes': 'Appel'},
+            {'step_type': '', 'step_date': '', 'step_notes': ''},
+        ], initial=3)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        steps = list(self.contentieux.juridiction_steps_set.all())
+        self.assertEqual(
+            [(step.juridiction, timezone.localtime(step.submitted_at).date(), step.notes) for step in steps],
+            [
+                (JuridictionType.TRIBUNAL_JUDICIAIRE, date(2024, 4, 1), 'Saisine'),
+                (JuridictionType.COUR_APPEL, date(2024, 5, 2), None),
+                (JuridictionType.COUR_CASSATION, date(2024, 7, 1), 'Appel'),
+            ],
+        )
+        self.assertEqual(steps[0].submitted_at, kept.submitted_at)
+        self.assertFalse(JuridictionStep.objects.filter(pk=removed.pk).exists())
+        buckets = dict(
+            DashboardSnapshot.objects.filter(dimension='juridictionstep.juridiction', count__gt=0)
+            .values_list('value', 'count')
+        )
+        self.assertEqual(buckets, {
+            JuridictionType.TRIBUNAL_JUDICIAIRE: 1, JuridictionType.COUR_APPEL: 1, JuridictionType.COUR_CASSATION: 1,
+        })
+
+
+class DocumentDownloadTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(email='owner@test.local', password='pass', name='Owner')
+        cls.other = CustomUser.objects.create_user(email='other@test.local', password='pass', name='Other')
+
+    def setUp(self):
+        super().setUp()
+        self.document = Document.objects.create(
+            uploaded_by=self.owner, original_name='expertise.pdf',
+            file=SimpleUploadedFile('expertise.pdf', b'0123456789', content_type='application/pdf'),
+        )
+        self.client.force_login(self.owner)
+
+    def download(self, **headers):
+        return self.client.get(reverse('praevia_app:document-download', args=[self.document.pk]), headers=headers)
+
+    def test_full_download_and_conditional_get(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual((response['Content-Length'], response['Accept-Ranges']), ('10', 'bytes'))
+        self.assertIn('expertise.pdf', response['Content-Disposition'])
+
+        not_modified = self.download(if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_etag_is_the_content_digest(self):
+        etag = self.download()['ETag']
+        self.assertEqual(etag, f'"{self.document.blob.sha256}"')
+        # Another upload of the same bytes touches the shared blob: resumes still match
+        Document.objects.create(
+            uploaded_by=self.other, file=SimpleUploadedFile('copy.pdf', b'0123456789', content_type='application/pdf'),
+        )
+        response = self.download(range='bytes=2-5', if_range=etag)
+        self.assertEqual((response.status_code, response['ETag']), (206, etag))
+
+    def test_ranges(self):
+        etag = self.download()['ETag']
+        for header, body, content_range in (
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        ):
+            with self.subTest(header):
+                response = self.download(range=header, if_range=etag)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+
+        unsatisfiable = self.download(range='bytes=10-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */10'))
+        # A stale If-Range or several ranges: the whole file
+        self.assertEqual(self.download(range='bytes=2-5', if_range='"stale"').status_code, 200)
+        self.assertEqual(self.download(range='bytes=0-1,4-5').status_code, 200)
+
+    def test_offload_to_front_proxy(self):
+        with override_settings(DOWNLOAD_OFFLOAD_HEADER='X-Accel-Redirect', DOWNLOAD_ACCEL_PREFIX='/protected-media/'):
+            response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual((response.content, response['Content-Type']), (b'', 'application/pdf'))
+
+        with override_settings(DOWNLOAD_OFFLOAD_HEADER='X-Sendfile'):
+            self.assertEqual(self.download()['X-Sendfile'], self.document.file.path)
+
+    def test_permission_and_missing_file(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.download().status_code, 404)
+        self.client.force_login(self.owner)
+        os.remove(self.document.file.path)
+        self.assertEqual(self.download().status_code, 404)
+
+
+class DocumentBlobTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='owner@test.local', password='pass', name='Owner')
+
+    def upload(self, content, name='decision.pdf'):
+        return Document.objects.create(
+            uploaded_by=self.user, file=SimpleUploadedFile(name, content, content_type='application/pdf'),
+        )
+
+    def blob_files(self):
+        return sorted(name for name, _ in Document._meta.get_field('file').storage.blob_files())
+
+    def gc(self, *args):
+        out = io.StringIO()
+        call_command('gc_document_blobs', '--grace', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_same_content_is_stored_once(self):
+        first, second = self.upload(b'CPAM decision'), self.upload(b'CPAM decision', 'copy.pdf')
+        other = self.upload(b'DAT')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.endswith(first.blob.sha256))
+        self.assertEqual((second.original_name, second.blob_id), ('copy.pdf', first.blob_id))
+        self.assertEqual(self.blob_files(), sorted([first.file.name, other.file.name]))
+        self.assertEqual(
+            dict(StoredBlob.objects.values_list('pk', 'ref_count')), {first.blob_id: 2, other.blob_id: 1},
+        )
+
+    def test_unreferenced_blobs_are_collected(self):
+        first, second = self.upload(b'CPAM decision'), self.upload(b'CPAM decision')
+        blob = first.blob
+        first.file.delete(save=False)  # shared: kept on disk
+        first.delete()
+        self.assertIn(blob.name, self.blob_files())
+        self.assertIn('0 unreferenced blob(s) deleted', self.gc())
+
+        second.delete()
+        self.assertEqual(StoredBlob.objects.get(pk=blob.pk).ref_count, 0)
+        stray = os.path.join(self.media, 'blobs', 'tmp', 'interrupted')
+        with open(stray, 'wb') as f:
+            f.write(b'partial')
+        os.utime(stray, (0, 0))
+        self.assertIn('1 unreferenced blob(s) deleted (0.0 MB), 1 stray file(s) deleted', self.gc())
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(self.blob_files(), [])
+
+    def test_blob_reused_during_collection_is_kept(self):
+        document = self.upload(b'CPAM decision')
+        blob = document.blob
+        document.delete()
+        StoredBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        storage = Document._meta.get_field('file').storage
+        modified_time = storage.get_modified_time
+
+        def reused_meanwhile(name):
+            # An upload of the same bytes calls for_file() after the collector listed the blob
+            StoredBlob.objects.for_file(blob.name, blob.size)
+            return modified_time(name) - timedelta(days=2)
+
+        with patch.object(storage, 'get_modified_time', side_effect=reused_meanwhile):
+            self.assertEqual(StoredBlob.objects.collect_garbage(storage, grace=3600), (0, 0))
+        self.assertTrue(StoredBlob.objects.filter(pk=blob.pk).exists())
+        self.assertIn(blob.name, self.blob_files())
+
+    def test_recount_and_legacy_files(self):
+        legacy_name = 'documents/2024/03/01/dat.pdf'
+        os.makedirs(os.path.join(self.media, 'documents/2024/03/01'))
+        with open(os.path.join(self.media, legacy_name), 'wb') as f:
+            f.write(b'DAT')
+        legacy = Document.objects.create(uploaded_by=self.user, file=legacy_name, mime_type='application/pdf', size=3)
+        current = self.upload(b'DAT')
+        StoredBlob.objects.filter(pk=current.blob_id).update(ref_count=5)
+
+        output = self.gc('--adopt', '--recount')
+        self.assertIn('1 legacy file(s) moved', output)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.file.name, legacy.blob_id), (current.file.name, current.blob_id))
+        self.assertFalse(os.path.exists(os.path.join(self.media, legacy_name)))
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+
+class ResumableUploadTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='owner@test.local', password='pass', name='Owner')
+        cls.other = CustomUser.objects.create_user(email='other@test.local', password='pass', name='Other')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def start(self, length, **data):
+        response = self.client.post(
+            reverse('praevia_app:document-upload-sessions'),
+            {'filename': 'expertise.pdf', 'length': length, **data}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response
+
+    def patch(self, location, offset, chunk):
+        return self.client.patch(
+            location, chunk, content_type='application/offset+octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def test_chunks_are_assembled_into_a_document(self):
+        content = b'%PDF-' + bytes(range(256)) * 40
+        created = self.start(len(content), document_type=DocumentType.EXPERTISE_MEDICALE)
+        location = created['Location']
+        self.assertEqual((created['Upload-Offset'], created['Tus-Resumable']), ('0', '1.0.0'))
+
+        self.assertEqual(self.patch(location, 0, content[:4000]).status_code, 204)
+        # A retried chunk at an old offset is refused; HEAD tells where to resume
+        stale = self.patch(location, 0, content[:4000])
+        self.assertEqual((stale.status_code, stale['Upload-Offset']), (409, '4000'))
+        self.assertEqual(self.client.head(location)['Upload-Offset'], '4000')
+        self.assertEqual(self.patch(location, 4000, content[4000:] + b'extra').status_code, 413)
+
+        done = self.patch(location, 4000, content[4000:])
+        self.assertEqual(done.status_code, 201)
+        document = Document.objects.get(pk=done.json()['id'])
+        self.assertEqual(
+            (document.original_name, document.size, document.mime_type, document.document_type),
+            ('expertise.pdf', len(content), 'application/pdf', DocumentType.EXPERTISE_MEDICALE),
+        )
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(document.blob.ref_count, 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'uploads')), [])
+        self.assertEqual(self.client.head(location).status_code, 404)
+
+    def test_upload_of_the_largest_allowed_size(self):
+        # Document.size holds the cap (2 GiB by default) on every backend, not only on SQLite
+        low, high = BaseDatabaseOperations.integer_field_ranges[Document._meta.get_field('size').get_internal_type()]
+        self.assertGreaterEqual(high, settings.RESUMABLE_UPLOAD_MAX_SIZE)
+        self.start(settings.RESUMABLE_UPLOAD_MAX_SIZE)
+
+        content = b'%PDF-' + b'0' * 4091
+        with override_settings(RESUMABLE_UPLOAD_MAX_SIZE=len(content)):
+            location = self.start(len(content))['Location']
+            done = self.patch(location, 0, content)
+        self.assertEqual(done.status_code, 201, done.content)
+        self.assertEqual(Document.objects.get(pk=done.json()['id']).size, len(content))
+
+    def test_tus_creation_headers_and_termination(self):
+        response = self.client.post(reverse('praevia_app:document-upload-sessions'), headers={
+            'Upload-Length': '3', 'Upload-Metadata': 'filename c2Nhbi5wZGY=,filetype YXBwbGljYXRpb24vcGRm',
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.json()['filename'], response.json()['mime_type']), ('scan.pdf', 'application/pdf'))
+
+        location = response['Location']
+        self.client.force_login(self.other)
+        self.assertEqual(self.patch(location, 0, b'abc').status_code, 404)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.delete(location).status_code, 204)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_limits_and_expiry(self):
+        with override_settings(RESUMABLE_UPLOAD_MAX_SIZE=10):
+            response = self.client.post(
+                reverse('praevia_app:document-upload-sessions'),
+                {'filename': 'scan.pdf', 'length': 11}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 400)
+
+        location = self.start(10)['Location']
+        self.assertEqual(self.client.patch(location, b'abc', content_type='application/pdf').status_code, 415)
+        self.assertEqual(purge_expired(expiry=3600), 0)
+        self.assertEqual(purge_expired(expiry=0), 1)
+        self.assertEqual(self.client.head(location).status_code, 404)
+
+
+def make_pdf(text, pages=2):
+    """A small PDF: `pages` page objects and one Flate-compressed content stream showing `text`."""
+    content = zlib.compress(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1'))
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', f'<< /Type /Pages /Count {pages} >>'.encode()]
+    objects += [b'<< /Type /Page /Parent 2 0 R /Contents 9 0 R >>'] * pages
+    body = b''.join(f'{number} 0 obj\n'.encode() + obj + b'\nendobj\n' for number, obj in enumerate(objects, 1))
+    stream = f'9 0 obj\n<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode() + content + b'\nendstream\nendobj\n'
+    return b'%PDF-1.4\n' + body + stream + b'trailer\n<< /Root 1 0 R >>\n%%EOF\n'
+
+
+def make_gif(frames=2):
+    output = io.BytesIO()
+    images = [Image.new('RGB', (800, 400), color) for color in ('red', 'blue', 'green')[:frames]]
+    images[0].save(output, 'GIF', save_all=True, append_images=images[1:])
+    return output.getvalue()
+
+
+class DocumentProcessingTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email='owner@test.local', password='pass', name='Owner')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def upload(self, name, content, content_type='application/octet-stream'):
+        return Document.objects.create(
+            uploaded_by=self.user, original_name=name,
+            file=SimpleUploadedFile(name, content, content_type=content_type),
+        )
+
+    def analyze(self, content):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(content)
+            f.flush()
+            return analyze_file(f.name, thumbnail_size=64)
+
+    def test_analyze_formats(self):
+        pdf = self.analyze(make_pdf('Rapport (expertise) du genou'))
+        self.assertEqual((pdf['mime_type'], pdf['page_count']), ('application/pdf', 2))
+        self.assertEqual(pdf['text'], 'Rapport (expertise) du genou')
+
+        gif = self.analyze(make_gif())
+        self.assertEqual((gif['mime_type'], gif['page_count']), ('image/gif', 2))
+        self.assertEqual(Image.open(io.BytesIO(gif['thumbnail'])).size, (64, 32))
+
+        docx = io.BytesIO()
+        with zipfile.ZipFile(docx, 'w') as archive:
+            archive.writestr('word/document.xml', '<w:body><w:p><w:t>Arr&#234;t de travail</w:t></w:p></w:body>')
+            archive.writestr('docProps/app.xml', '<Properties><Pages>3</Pages></Properties>')
+        word = self.analyze(docx.getvalue())
+        self.assertTrue(word['mime_type'].endswith('wordprocessingml.document'))
+        self.assertEqual((word['page_count'], word['text']), (3, 'Arrêt de travail'))
+
+        self.assertEqual(self.analyze('Témoignage\n  signé'.encode())['text'], 'Témoignage\nsigné')
+        self.assertEqual(self.analyze(b'\x00\x01binary')['mime_type'], 'application/octet-stream')
+
+    def test_decompression_bombs_stay_bounded(self):
+        # 256 MB of zeros in a ~250 KB Flate stream, then in a docx member
+        compressor, chunk = zlib.compressobj(9), bytes(1024 * 1024)
+        bomb = b''.join(compressor.compress(chunk) for _ in range(256)) + compressor.flush()
+        pdf = (
+            b'%PDF-1.4\n1 0 obj\n<< /Type /Page >>\nendobj\n'
+            + f'2 0 obj\n<< /Length {len(bomb)} /Filter /FlateDecode >>\nstream\n'.encode() + bomb
+            + b'\nendstream\nendobj\n%%EOF\n'
+        )
+        docx = io.BytesIO()
+        with zipfile.ZipFile(docx, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('word/document.xml', 'w') as member:
+                for _ in range(256):
+                    member.write(chunk)
+
+        tracemalloc.start()
+        try:
+            self.assertEqual(self.analyze(pdf)['page_count'], 1)
+            self.assertEqual(self.analyze(docx.getvalue())['text'], '')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 100 * 1024 * 1024)
+
+    def test_pipeline_fills_the_document(self):
+        # Declared as a PDF by the client: the content says otherwise
+        image = self.upload('photo.pdf', make_gif(), content_type='application/pdf')
+        report = self.upload('rapport.pdf', make_pdf('Contusion du genou'), content_type='application/pdf')
+        copy = self.upload('copie.pdf', make_pdf('Contusion du genou'))
+        self.assertEqual(image.processing_status, DocumentProcessingStatus.PENDING)
+
+        self.assertEqual(drain_documents(workers=0), (3, 0))
+        image.refresh_from_db()
+        self.assertEqual((image.detected_mime_type, image.page_count), ('image/gif', 2))
+        self.assertTrue(image.thumbnail and os.path.exists(image.thumbnail.path))
+        report.refresh_from_db()
+        copy.refresh_from_db()
+        self.assertEqual((report.processing_status, report.page_count), (DocumentProcessingStatus.DONE, 2))
+        self.assertEqual(report.text_content, 'Contusion du genou')
+        self.assertEqual(copy.text_content, report.text_content)
+        self.assertEqual(drain_documents(workers=0), (0, 0))
+
+        download = self.client.get(reverse('praevia_app:document-download', args=[image.pk]))
+        self.assertEqual(download['Content-Type'], 'image/gif')
+        listed = self.client.get(reverse('praevia_app:document-list'), {'q': 'genou contusion'}).json()['results']
+        self.assertEqual({row['id'] for row in listed}, {report.pk, copy.pk})
+        self.assertNotIn('text_content', listed[0])
+        # Prefixes, accents ignored, file names included (full-text index, see search.py)
+        listed = self.client.get(reverse('praevia_app:document-list'), {'q': 'contus GÉNOU rapp'}).json()['results']
+        self.assertEqual([row['id'] for row in listed], [report.pk])
+
+    def test_process_pool(self):
+        document = self.upload('rapport.pdf', make_pdf('Décision CPAM'))
+        self.assertEqual(drain_documents(workers=1), (1, 0))
+        document.refresh_from_db()
+        self.assertEqual(document.text_content, 'Décision CPAM')
+
+    def test_failures_are_retried_then_given_up(self):
+        document = self.upload('scan.pdf', make_pdf('Perdu'))
+        os.remove(document.file.path)
+        self.assertEqual(drain_documents(workers=0, max_attempts=2), (0, 1))
+        document.refresh_from_db()
+        self.assertEqual((document.processing_status, document.processing_attempts), (DocumentProcessingStatus.PENDING, 1))
+        self.assertIn('FileNotFoundError', document.processing_error)
+
+        Document.objects.filter(pk=document.pk).update(processing_due_at=timezone.now())
+        self.assertEqual(drain_documents(workers=0, max_attempts=2), (0, 1))
+        document.refresh_from_db()
+        self.assertEqual(document.processing_status, DocumentProcessingStatus.FAILED)
+        self.assertEqual(drain_documents(workers=0, max_attempts=2), (0, 0))
+
+
+class DocumentBatchUploadTests(TemporaryMediaMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = CustomUser.objects.create_user(
+            email='employee@test.local', password='pass', name='Employee', role=UserRole.EMPLOYEE
+        )
+        cls.safety_manager = CustomUser.objects.create_user(
+            email='safety@test.local', password='pass', name='Safety', role=UserRole.SAFETY_MANAGER
+        )
+        cls.dossier = DossierATMP.objects.create(
+            title='Chute', description='-', date_of_incident=date(2025, 1, 1), location='Atelier',
+            status=DossierStatus.TRANSFORME_EN_CONTENTIEUX, created_by=cls.employee, safety_manager=cls.safety_manager,
+        )
+        cls.contentieux = Contentieux.objects.create(dossier_atmp=cls.dossier, subject={}, status=ContentieuxStatus.EN_COURS)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.safety_manager)
+
+    def scans(self, count, content=None):
+        return [
+            SimpleUploadedFile(f'scan-{i}.pdf', content or f'%PDF-1.4 scan {i}'.encode(), content_type='application/pdf')
+            for i in range(count)
+        ]
+
+    def post_batch(self, files, **data):
+        return self.client.post(reverse('praevia_app:document-batch'), {'dossier': self.dossier.pk, 'files': files, **data})
+
+    def test_form_attaches_every_file(self):
+        url = reverse('praevia_app:document-upload-batch', args=[self.dossier.pk])
+        response = self.client.post(url, {
+            'files': self.scans(2) + self.scans(1, b'%PDF-1.4 scan 0'), 'document_type': DocumentType.DAT,
+        })
+        self.assertRedirects(response, reverse('praevia_app:incident-detail', args=[self.dossier.pk]))
+
+        documents = self.dossier.documents.order_by('original_name', 'id')
+        self.assertEqual([document.original_name for document in documents], ['scan-0.pdf', 'scan-0.pdf', 'scan-1.pdf'])
+        self.assertEqual(set(self.contentieux.documents.all()), set(documents))
+        for document in documents:
+            self.assertEqual((document.contentieux_id, document.document_type), (self.contentieux.pk, DocumentType.DAT))
+            self.assertEqual(document.processing_status, DocumentProcessingStatus.PENDING)
+        # The same bytes twice: one blob, two references
+        self.assertEqual(sorted(StoredBlob.objects.values_list('ref_count', flat=True)), [1, 2])
+
+    def test_queries_do_not_grow_with_files(self):
+        counts = []
+        for count in (2, 8):
+            with QueryRecorder() as recorder:
+                self.assertEqual(self.post_batch(self.scans(count)).status_code, 201)
+            counts.append(recorder.count)
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.dossier.documents.count(), 10)
+
+    def test_permission_and_limits(self):
+        self.client.force_login(CustomUser.objects.create_user(email='x@test.local', password='pass', name='X'))
+        self.assertEqual(self.post_batch(self.scans(1)).status_code, 403)
+        self.client.force_login(self.employee)
+        with override_settings(DOCUMENT_BATCH_UPLOAD_MAX_FILES=2):
+            response = self.post_batch(self.scans(3))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('files', response.json())
+        self.assertEqual(self.post_batch([]).status_code, 400)
+        self.assertFalse(Document.objects.exists())
@@ -0,0 +1,222 @@
+# /home/siisi/atmp/praevia_app/uploads.py
+
+import base64
+import fcntl
+import logging
+import mimetypes
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Contentieux, DossierATMP, Document, StoredBlob, UploadSession
+from .storage import document_storage
+
+logger = logging.getLogger(__name__)
+
+
+# Version of the tus protocol (https://tus.io) whose core and creation/termination extensions are followed
+TUS_VERSION = '1.0.0'
+UPLOAD_DIRECTORY = 'uploads'
+# Bytes read from the request per write: bounds the worker memory whatever the chunk size
+UPLOAD_READ_SIZE = 64 * 1024
+# Upload-Metadata keys accepted at creation, and the UploadSession field each one fills
+TUS_METADATA_FIELDS = {
+    'filename': 'filename',
+    'filetype': 'mime_type',
+    'document_type': 'document_type',
+    'description': 'description',
+    'contentieux': 'contentieux',
+}
+
+
+class UploadConflict(Exception):
+    """The chunk does not start at the stored offset, or another request is writing the upload."""
+
+
+class UploadTooLarge(Exception):
+    """The chunk goes past the declared length."""
+
+
+class AssembledUpload(File):
+    """The complete temporary file, moved (not copied) into the blob store."""
+
+    def __init__(self, file, name, path):
+        super().__init__(file, name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def upload_path(session):
+    # In MEDIA_ROOT, so that moving the finished file into blobs/ is a rename
+    return document_storage.path(f"{UPLOAD_DIRECTORY}/{session.pk}")
+
+
+def tus_creation_data(headers):
+    """Upload-Length and Upload-Metadata ('key base64,key base64') of a tus creation request, as serializer data."""
+    data = {}
+    if 'Upload-Length' in headers:
+        data['length'] = headers['Upload-Length']
+    for pair in headers.get('Upload-Metadata', '').split(','):
+        key, _, value = pair.strip().partition(' ')
+        if key in TUS_METADATA_FIELDS:
+            try:
+                data[TUS_METADATA_FIELDS[key]] = base64.b64decode(value).decode()
+            except (ValueError, UnicodeDecodeError):
+                continue
+    return data
+
+
+def create_session(user, **fields):
+    session = UploadSession.objects.create(user=user, **fields)
+    os.makedirs(os.path.dirname(upload_path(session)), exist_ok=True)
+    open(upload_path(session), 'wb').close()
+    logger.info(f"Upload {session.pk} started by {user.pk}: {session.filename}, {session.length} bytes")
+    return session
+
+
+def append_chunk(session, offset, stream, size):
+    """
+    Appends `size` bytes of `stream` at `offset`, which must be the stored
+    offset, reading UPLOAD_READ_SIZE bytes at a time. No transaction is held
+    during the transfer: an exclusive lock on the temporary file keeps
+    concurrent PATCHes out, and the new offset is saved with a compare and
+    set. When the client disconnects mid-chunk the bytes received are kept
+    and counted, so that it resumes from there. Returns the new offset.
+    """
+    if offset != session.offset:
+        raise UploadConflict(f"Upload-Offset {offset} does not match the stored offset {session.offset}")
+    if offset + size > session.length:
+        raise UploadTooLarge(f"The chunk ends at {offset + size}, past Upload-Length {session.length}")
+
+    with open(upload_path(session), 'r+b') as target:
+        try:
+            fcntl.flock(target, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict("Another request is writing this upload")
+        # Bytes past the stored offset come from a write whose offset was never saved
+        target.truncate(offset)
+        target.seek(offset)
+        written = 0
+        try:
+            while written < size:
+                data = stream.read(min(UPLOAD_READ_SIZE, size - written))
+                if not data:
+                    break
+                target.write(data)
+                written += len(data)
+        finally:
+            target.flush()
+            os.fsync(target.fileno())
+            updated = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+                offset=offset + written, updated_at=timezone.now(),
+            )
+            if not updated:
+                raise UploadConflict("The upload was modified concurrently")
+            session.offset = offset + written
+    return session.offset
+
+
+def complete(session):
+    """
+    Turns a complete upload into a Document. The file is hashed and moved
+    into the blob store first; the Document row and the removal of the
+    session are then committed in one transaction. Returns the document.
+    """
+    path = upload_path(session)
+    with open(path, 'rb') as assembled:
+        name = document_storage.save(session.filename, AssembledUpload(assembled, session.filename, path))
+    with transaction.atomic():
+        # Locked: a second request completing the same upload finds it gone
+        UploadSession.objects.select_for_update().get(pk=session.pk)
+        document = Document.objects.create(
+            uploaded_by_id=session.user_id,
+            contentieux_id=session.contentieux_id,
+            document_type=session.document_type,
+            description=session.description,
+            original_name=session.filename,
+            file=name,
+            blob=StoredBlob.objects.for_file(name, session.length),
+            mime_type=session.mime_type or mimetypes.guess_type(session.filename)[0] or 'application/octet-stream',
+            size=session.length,
+        )
+        upload_id = session.pk
+        session.delete()
+    # Still there when the content was already in the blob store
+    discard_file(path)
+    logger.info(f"Upload {upload_id} completed as Document {document.pk}")
+    return document
+
+
+def discard_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def abort(session):
+    path = upload_path(session)
+    session.delete()
+    discard_file(path)
+
+
+def purge_expired(expiry=None):
+    """Deletes the sessions without a chunk for `expiry` seconds and their files; returns how many."""
+    expiry = settings.RESUMABLE_UPLOAD_EXPIRY if expiry is None else expiry
+    expired = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=expiry))
+    count = 0
+    for session in expired.iterator():
+        abort(session)
+        count += 1
+    return count
+
+
+def attach_documents(dossier, user, files, document_type=None, description=None):
+    """
+    Stores `files` (uploaded files) as new Documents of `dossier`, and of its
+    contentieux if it has one. Each file is streamed into the blob store
+    first; then, in one transaction, the blob rows, the documents and the
+    links to the `documents` many-to-many fields are written with a
+    bulk_create each: the queries do not grow with the number of files.
+    Returns the documents.
+    """
+    stored = [(upload, document_storage.save(upload.name, upload)) for upload in files]
+    with transaction.atomic():
+        blobs = StoredBlob.objects.for_files((name, upload.size) for upload, name in stored)
+        contentieux_id = Contentieux.objects.filter(dossier_atmp_id=dossier.pk).values_list('pk', flat=True).first()
+        documents = []
+        for upload, name in stored:
+            document = Document(
+                uploaded_by=user,
+                contentieux_id=contentieux_id,
+                document_type=document_type,
+                description=description,
+                original_name=os.path.basename(upload.name),
+                file=name,
+                blob=blobs[name],
+                mime_type=upload.content_type or mimetypes.guess_type(upload.name)[0] or 'application/octet-stream',
+                size=upload.size,
+            )
+            document.queue_processing()
+            documents.append(document)
+        # bulk_create() sends no signal: the blob references are counted here
+        Document.objects.bulk_create(documents)
+        StoredBlob.objects.add_references(document.blob_id for document in documents)
+
+        DossierDocument = DossierATMP.documents.through
+        DossierDocument.objects.bulk_create(
+            [DossierDocument(dossieratmp_id=dossier.pk, document_id=document.pk) for document in documents]
+        )
+        if contentieux_id:
+            ContentieuxDocument = Contentieux.documents.through
+            ContentieuxDocument.objects.bulk_create(
+                [ContentieuxDocument(contentieux_id=contentieux_id, document_id=document.pk) for document in documents]
+            )
+    logger.info(f"{len(documents)} document(s) attached to dossier {dossier.pk} by {user.pk}")
+    return documents
@@ -29,6 +29,7 @@ from .views import (
     IncidentDeleteView,
     ContentieuxCreateView,
     DocumentUploadView,
+    DocumentBatchUploadView,
     DocumentDeleteView,
     JuridiqueDashboardHTMLView,
     RHDashboardHTMLView,
@@ -71,6 +72,7 @@ urlpatterns = [
     
     # Document routes (HTML view for document upload)
     path('incidents/<int:incident_pk>/documents/upload/', DocumentUploadView.as_view(), name='document-upload'),
+    path('incidents/<int:incident_pk>/documents/upload-batch/', DocumentBatchUploadView.as_view(), name='document-upload-batch'),
     path('documents/<int:pk>/delete/', DocumentDeleteView.as_view(), name='document_delete'),
 
     # HTML Dashboard Actions Routes
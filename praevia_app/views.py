@@ -4,15 +4,20 @@ import logging
 import json 
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.generic import TemplateView, CreateView, ListView, DetailView, UpdateView, DeleteView
+from django.views.generic import TemplateView, CreateView, FormView, ListView, DetailView, UpdateView, DeleteView
 from django.shortcuts import get_object_or_404, redirect
 from django.http import Http404 
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.db.models import Prefetch, Q
 from django.forms import inlineformset_factory
 
 
+from .dashboard import DashboardStats, cached_dashboard
+from .search import search_dossiers
 from .mixins import ProviderOrSuperuserMixin, EmployeeRequiredMixin, SafetyManagerMixin
 from .models import (
     DossierATMP, DossierStatus, Contentieux, Document, Audit, AuditStatus,
@@ -20,8 +25,9 @@ from .models import (
 )
 from .forms import (
     DossierATMPForm, TemoinForm,
-    ContentieuxForm, DocumentForm, ProfileEditForm
+    ContentieuxForm, DocumentBatchUploadForm, DocumentForm, ProfileEditForm
 )
+from .uploads import attach_documents
 from users.models import CustomUser, UserRole
 from django_otp.plugins.otp_totp.models import TOTPDevice
 
@@ -48,13 +54,12 @@ class DashboardView(TemplateView):
         ctx  = super().get_context_data(**kwargs)
         # Add the page title to the context
         ctx["page_title"] = "Praevia Dashboard"
-        user = self.request.user
-        uid  = user.id if user.is_authenticated else None
+        stats = DashboardStats(self.request.user)
 
-        total_incidents   = DossierATMP.objects.count()
-        pending_incidents = DossierATMP.objects.filter(status=DossierStatus.A_ANALYSER).count()
-        total_contentieux = Contentieux.objects.count()
-        total_audits      = Audit.objects.count()
+        total_incidents   = stats.dossiers['total']
+        pending_incidents = stats.dossiers['a_analyser']
+        total_contentieux = stats.contentieux['total']
+        total_audits      = stats.audits['total']
 
         # Build all cards—always
         all_cards = [
@@ -62,7 +67,7 @@ class DashboardView(TemplateView):
                 "icon":     "E",
                 "label":    "Mes incidents",
                 "url":      reverse("praevia_app:incident-list"),
-                "count":    DossierATMP.objects.filter(created_by_id=uid).count(),
+                "count":    stats.dossiers['mine'],
                 "bg_class": "primary",
                 "icon_fs":  "fs-3",
                 "size_cls": "role-icon-md",   # use your .role-icon-md (5rem)
@@ -71,7 +76,7 @@ class DashboardView(TemplateView):
                 "icon":     "S",
                 "label":    "Sous ma responsabilité",
                 "url":      reverse("praevia_app:incident-list"),
-                "count":    DossierATMP.objects.filter(safety_manager_id=uid).count(),
+                "count":    stats.dossiers['managed'],
                 "bg_class": "info",
                 "icon_fs":  "fs-3",
                 "size_cls": "role-icon-md",
@@ -254,7 +259,7 @@ class IncidentListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = DossierATMP.objects.all().order_by('-created_at')
+        queryset = search_dossiers(DossierATMP.objects.all(), self.request.GET.get('q')).order_by('-created_at')
         if user.is_superuser:
             return queryset
         if user.role == UserRole.EMPLOYEE:
@@ -267,6 +272,7 @@ class IncidentListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context["page_title"] = "Incidents"
         context['status_choices'] = DossierStatus.choices
+        context['q'] = self.request.GET.get('q', '')
         return context
 
 
@@ -276,11 +282,13 @@ class IncidentDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'incident'
 
     def get_queryset(self):
+        documents = Document.objects.select_related('uploaded_by')
         qs = super().get_queryset().select_related(
-            'safety_manager', 'created_by', 'contentieux', 'audit'
+            'safety_manager', 'created_by', 'contentieux', 'audit__auditor', 'tiers'
         ).prefetch_related(
-            'documents', 'temoin_set', 'contentieux__documents', 'contentieux__juridiction_steps_set',
-            'audit__checklist_items' 
+            Prefetch('documents', queryset=documents), 'temoin_set',
+            Prefetch('contentieux__documents', queryset=documents), 'contentieux__juridiction_steps_set',
+            'audit__checklist_items'
         )
         user = self.request.user
         if not user.is_superuser:
@@ -290,7 +298,7 @@ class IncidentDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["page_title"] = "Detail"
-        incident = self.get_object()
+        incident = self.object
         
         # Safely get the 'contentieux' object
         try:
@@ -428,8 +436,8 @@ class IncidentDeleteView(ProviderOrSuperuserMixin, DeleteView):
 
         context["page_title"] = "Delete"
 
-        context['incident_pk'] = self.incident.pk 
-        context['documents'] = self.incident.documents.all() 
+        context['incident_pk'] = self.object.pk
+        context['documents'] = self.object.documents.all()
         return context
     
     def get_queryset(self):
@@ -474,7 +482,6 @@ class ContentieuxCreateView(SafetyManagerMixin, CreateView):
         # Pre-populate JSONFields as strings for the Textarea widgets
         initial['subject'] = json.dumps({"title": f"Contentieux for {self.dossier.reference}", "description": f"Contentieux initiated for incident {self.dossier.reference}."}, indent=2)
         initial['status'] = ContentieuxStatus.DRAFT.value
-        initial['juridiction_steps'] = json.dumps({}) 
         return initial
     
     def get_context_data(self, **kwargs):
@@ -512,21 +519,25 @@ class JuridiqueDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, Templa
         context = super().get_context_data(**kwargs)
         
         context["page_title"] = "Juridique"
+        context.update(cached_dashboard('html:juridique', (Contentieux, JuridictionStep), self.get_dashboard_data))
+        return context
+
+    def get_dashboard_data(self):
+        stats = DashboardStats()
+        data = {}
+
+        data['total_contentieux'] = stats.contentieux['total']
+        data['contentieux_by_status'] = stats.breakdown(Contentieux, 'status')
         
-        context['total_contentieux'] = Contentieux.objects.count()
-        context['contentieux_by_status'] = Contentieux.objects.values('status').annotate(count=Count('id')).order_by('status')
-        
-        context['total_juridiction_steps'] = JuridictionStep.objects.count()
-        context['steps_by_juridiction'] = JuridictionStep.objects.values('juridiction').annotate(count=Count('id')).order_by('juridiction')
-        context['steps_by_decision'] = JuridictionStep.objects.values('decision').annotate(count=Count('id')).order_by('decision')
+        data['total_juridiction_steps'] = stats.juridiction_steps['total']
+        data['steps_by_juridiction'] = stats.breakdown(JuridictionStep, 'juridiction')
+        data['steps_by_decision'] = stats.breakdown(JuridictionStep, 'decision')
 
-        context['pending_contentieux'] = Contentieux.objects.filter(
-            status=ContentieuxStatus.EN_COURS
-        ).count()
+        data['pending_contentieux'] = stats.contentieux['en_cours']
         
-        context['recent_contentieux'] = Contentieux.objects.order_by('-created_at')[:5]
+        data['recent_contentieux'] = list(Contentieux.objects.order_by('-created_at')[:5])
         
-        return context
+        return data
 
 
 class RHDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
@@ -539,22 +550,24 @@ class RHDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, TemplateView)
         context = super().get_context_data(**kwargs)
         
         context["page_title"] = "Ressources Humaines"
+        context.update(cached_dashboard('html:rh', (DossierATMP,), self.get_dashboard_data))
+        return context
+
+    def get_dashboard_data(self):
+        stats = DashboardStats()
+        data = {}
 
-        context['total_incidents'] = DossierATMP.objects.count()
-        context['incidents_by_status'] = DossierATMP.objects.values('status').annotate(count=Count('id')).order_by('status')
+        data['total_incidents'] = stats.dossiers['total']
+        data['incidents_by_status'] = stats.breakdown(DossierATMP, 'status')
         
-        context['incidents_by_creator_role'] = DossierATMP.objects.values('created_by__role').annotate(count=Count('id')).order_by('created_by__role')
+        data['incidents_by_creator_role'] = stats.breakdown(DossierATMP, 'created_by__role')
 
-        context['incidents_a_analyser_count'] = DossierATMP.objects.filter(
-            status=DossierStatus.A_ANALYSER
-        ).count()
-        context['incidents_en_analyse_count'] = DossierATMP.objects.filter(
-            status=DossierStatus.ANALYSE_EN_COURS
-        ).count()
+        data['incidents_a_analyser_count'] = stats.dossiers['a_analyser']
+        data['incidents_en_analyse_count'] = stats.dossiers['analyse_en_cours']
 
-        context['incidents_by_safety_manager'] = DossierATMP.objects.values('safety_manager__email').annotate(count=Count('id')).order_by('-count')
+        data['incidents_by_safety_manager'] = stats.breakdown(DossierATMP, 'safety_manager__email', order_by='-count')
 
-        return context
+        return data
 
 
 class QSEDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
@@ -567,23 +580,27 @@ class QSEDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, TemplateView
         context = super().get_context_data(**kwargs)
         
         context["page_title"] = "QSE"
+        context.update(cached_dashboard('html:qse', (DossierATMP, Audit), self.get_dashboard_data))
+        return context
 
-        context['total_incidents'] = DossierATMP.objects.count()
-        context['incidents_by_status'] = DossierATMP.objects.values('status').annotate(count=Count('id')).order_by('status')
+    def get_dashboard_data(self):
+        stats = DashboardStats()
+        data = {}
+
+        data['total_incidents'] = stats.dossiers['total']
+        data['incidents_by_status'] = stats.breakdown(DossierATMP, 'status')
         
-        context['incidents_by_location'] = DossierATMP.objects.values('location').annotate(count=Count('id')).order_by('-count')
+        data['incidents_by_location'] = stats.breakdown(DossierATMP, 'location', order_by='-count')
         
-        context['total_audits'] = Audit.objects.count()
-        context['audits_by_status'] = Audit.objects.values('status').annotate(count=Count('id')).order_by('status')
-        context['audits_by_decision'] = Audit.objects.values('decision').annotate(count=Count('id')).order_by('decision')
+        data['total_audits'] = stats.audits['total']
+        data['audits_by_status'] = stats.breakdown(Audit, 'status')
+        data['audits_by_decision'] = stats.breakdown(Audit, 'decision')
         
-        context['contestation_recommended_incidents'] = DossierATMP.objects.filter(
-            audit__decision=AuditDecision.CONTEST
-        ).count()
+        data['contestation_recommended_incidents'] = stats.audits['contest']
         
-        context['audits_in_progress'] = Audit.objects.filter(status=AuditStatus.IN_PROGRESS).count()
+        data['audits_in_progress'] = stats.audits['in_progress']
 
-        return context
+        return data
 
 
 class DirectionDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
@@ -596,31 +613,31 @@ class DirectionDashboardHTMLView(LoginRequiredMixin, UserPassesTestMixin, Templa
         context = super().get_context_data(**kwargs)
         
         context["page_title"] = "Direction"
+        context.update(cached_dashboard('html:direction', (DossierATMP, Contentieux, Audit), self.get_dashboard_data))
+        return context
 
-        context['total_dossiers'] = DossierATMP.objects.count()
-        context['total_contentieux'] = Contentieux.objects.count()
-        context['total_audits'] = Audit.objects.count()
+    def get_dashboard_data(self):
+        stats = DashboardStats()
+        data = {}
+
+        data['total_dossiers'] = stats.dossiers['total']
+        data['total_contentieux'] = stats.contentieux['total']
+        data['total_audits'] = stats.audits['total']
         
-        context['dossiers_status_summary'] = DossierATMP.objects.values('status').annotate(count=Count('id')).order_by('status')
-        context['contentieux_status_summary'] = Contentieux.objects.values('status').annotate(count=Count('id')).order_by('status')
-        context['audits_status_summary'] = Audit.objects.values('status').annotate(count=Count('id')).order_by('status')
+        data['dossiers_status_summary'] = stats.breakdown(DossierATMP, 'status')
+        data['contentieux_status_summary'] = stats.breakdown(Contentieux, 'status')
+        data['audits_status_summary'] = stats.breakdown(Audit, 'status')
         
-        context['contentieux_from_contested_dossiers'] = Contentieux.objects.filter(
-            dossier_atmp__audit__decision=AuditDecision.CONTEST
-        ).count()
-        context['contentieux_from_not_contested_dossiers'] = Contentieux.objects.filter(
-            dossier_atmp__audit__decision=AuditDecision.DO_NOT_CONTEST
-        ).count()
+        data['contentieux_from_contested_dossiers'] = stats.contentieux_origin['from_contested']
+        data['contentieux_from_not_contested_dossiers'] = stats.contentieux_origin['from_not_contested']
         
-        context['dossiers_by_safety_manager'] = DossierATMP.objects.values('safety_manager__email').annotate(count=Count('id')).order_by('-count')
+        data['dossiers_by_safety_manager'] = stats.breakdown(DossierATMP, 'safety_manager__email', order_by='-count')
 
-        return context
+        return data
 
 
-class DocumentUploadView(LoginRequiredMixin, CreateView):
-    model = Document
-    form_class = DocumentForm
-    template_name = 'praevia_app/document_upload.html' 
+class IncidentDocumentsMixin:
+    """Upload views of an incident: its creator, its safety manager and superusers only."""
 
     def dispatch(self, request, *args, **kwargs):
         self.incident = get_object_or_404(DossierATMP, pk=kwargs['incident_pk'])
@@ -631,6 +648,15 @@ class DocumentUploadView(LoginRequiredMixin, CreateView):
             return redirect(reverse('praevia_app:incident-detail', kwargs={'pk': self.incident.pk}))
         return super().dispatch(request, *args, **kwargs)
 
+    def get_success_url(self):
+        return reverse('praevia_app:incident-detail', kwargs={'pk': self.incident.pk})
+
+
+class DocumentUploadView(LoginRequiredMixin, IncidentDocumentsMixin, CreateView):
+    model = Document
+    form_class = DocumentForm
+    template_name = 'praevia_app/document_upload.html' 
+
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['initial'] = {'contentieux': None}
@@ -642,7 +668,7 @@ class DocumentUploadView(LoginRequiredMixin, CreateView):
         context["page_title"] = "Upload"
 
         context['incident_pk'] = self.incident.pk 
-        context['documents'] = self.incident.documents.all() 
+        context['documents'] = self.incident.documents.select_related('uploaded_by')
         return context
 
     def form_valid(self, form):
@@ -673,8 +699,40 @@ class DocumentUploadView(LoginRequiredMixin, CreateView):
         messages.success(self.request, "Document uploaded successfully!")
         return response
 
-    def get_success_url(self):
-        return reverse('praevia_app:incident-detail', kwargs={'pk': self.incident.pk})
+
+class DocumentBatchUploadView(LoginRequiredMixin, IncidentDocumentsMixin, FormView):
+    """
+    Several files at once (safety managers attach whole batches of scans).
+    Every part is written to a temporary file as it arrives, never held in
+    memory, then moved into the blob store by uploads.attach_documents.
+    """
+    form_class = DocumentBatchUploadForm
+    template_name = 'praevia_app/document_upload_batch.html'
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        # Must be set before the body is parsed, which the CSRF check does: the check runs after
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return self.protected_dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def protected_dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page_title"] = "Upload"
+        context['incident_pk'] = self.incident.pk
+        return context
+
+    def form_valid(self, form):
+        documents = attach_documents(
+            self.incident, self.request.user, form.cleaned_data['files'],
+            document_type=form.cleaned_data['document_type'],
+            description=form.cleaned_data['description'],
+        )
+        messages.success(self.request, f"{len(documents)} document(s) uploaded successfully!")
+        return super().form_valid(form)
 
 
 class DocumentDeleteView(LoginRequiredMixin, DeleteView):
@@ -739,7 +797,8 @@ class DocumentDeleteView(LoginRequiredMixin, DeleteView):
         redirect_incident_pk = self._get_incident_pk_for_redirect()
 
         try:
-            # Delete the actual file from storage first
+            # Delete the actual file from storage first. Blob-backed files are shared between
+            # documents: the storage keeps them, gc_document_blobs removes them once unreferenced.
             if self.object.file:
                 self.object.file.delete(save=False) # save=False prevents saving the model after file deletion
 
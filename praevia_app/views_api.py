@@ -1,8 +1,7 @@
 # /home/siisi/atmp/praevia_app/views_api.py
 
+import codecs
 import logging
-import os
-import mimetypes
 from rest_framework import generics, status, viewsets, mixins
 from rest_framework.views import APIView
 from rest_framework.decorators import action
@@ -11,26 +10,40 @@ from rest_framework.response import Response
 from rest_framework.reverse import reverse # Import reverse
 from rest_framework.routers import DefaultRouter, APIRootView # Import APIRootView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse, Http404
-from django.utils import timezone
+from django.http import Http404, UnreadablePostError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db.models import Count
 
 
 from .models import (
-    Audit, Contentieux, ContentieuxStatus, Document, DossierATMP,
-    AuditDecision, AuditStatus, DossierStatus
+    Audit, Contentieux, ContentieuxStatus, Document, DossierATMP, UploadSession,
+    AuditDecision
 )
 from .serializers import (
     DossierCreateSerializer,
-    AuditSerializer, AuditUpdateSerializer,
+    AuditSerializer, AuditUpdateSerializer, AuditFinalizeItemSerializer,
     ContentieuxCreateSerializer, ContentieuxSerializer,
-    DocumentSerializer, DossierATMPSerializer
+    DocumentBatchUploadSerializer, DocumentSerializer, DossierATMPSerializer, DossierListSerializer,
+    JuridictionStepSerializer, UploadSessionSerializer
 )
-from .services import ContentieuxService
-from .permissions import IsSafetyManager, IsJurist, IsSuperuserOrEmployee, IsRH, IsQSE, IsDirection
+from .services import AuditFinalizationService, IdempotencyKeyMismatch
+from .importers import guess_format, import_dossiers, read_rows
+from .parsers import CSVParser, NDJSONParser
+from .filters import AuditFilter, ContentieuxFilter, DocumentSearchFilter, DossierFilter, DossierSearchFilter
+from .exports import AUDIT_EXPORT, CONTENTIEUX_EXPORT, DOSSIER_EXPORT, EXPORT_RENDERERS, streaming_export
+from .pagination import KeysetPagination
+from .dashboard import DashboardStats, cached_dashboard
+from .downloads import serve_document
+from .uploads import (
+    TUS_VERSION, UploadConflict, UploadTooLarge,
+    abort, append_chunk, attach_documents, complete, create_session, tus_creation_data
+)
+from .permissions import CanExport, IsSafetyManager, IsJurist, IsSuperuserOrEmployee, IsRH, IsQSE, IsDirection
 from users.models import UserRole
 
 logger = logging.getLogger(__name__)
@@ -119,61 +132,156 @@ class CustomDefaultRouter(DefaultRouter):
     APIRootView = AllEndpointsView
 
 
+class SparseFieldsetViewSetMixin:
+    """
+    Narrows the SQL of list/retrieve to the fields requested with
+    ?fields= / ?omit= (see serializers.SparseFieldsetMixin).
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        if hasattr(serializer, 'prune_queryset'):
+            queryset = serializer.prune_queryset(queryset)
+        return queryset
+
+
+class ExportViewSetMixin:
+    """
+    Adds GET <resource>/export/?format=ndjson|csv, streaming the rows of
+    `export_definition` (see exports.py) to the users allowed by CanExport.
+    The rows are those of get_queryset(): an export never shows more than
+    the list would, so `export_roles` only lists roles the viewset scopes.
+    """
+    export_definition = None
+    export_roles = ()
+
+    def get_export_queryset(self):
+        # Flat values: the joins and prefetches of the list are not needed
+        return self.get_queryset().select_related(None).prefetch_related(None).order_by('pk')
+
+    @action(
+        detail=False, methods=['get'], url_path='export',
+        renderer_classes=EXPORT_RENDERERS, permission_classes=[IsAuthenticated, CanExport],
+    )
+    def export(self, request):
+        return streaming_export(self.export_definition, self.get_export_queryset(), request.accepted_renderer.format)
+
+
 # --- Dossier Views ---
-class DossierViewSet(viewsets.ModelViewSet):
+class DossierViewSet(ExportViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = DossierATMP.objects.select_related(
-        'safety_manager', 'created_by', 'contentieux', 'audit'
+        'safety_manager', 'created_by', 'contentieux', 'audit__auditor', 'tiers'
     ).prefetch_related(
-        'documents', 'temoin_set', 'contentieux__documents', 'contentieux__juridiction_steps_set'
+        Prefetch('documents', queryset=Document.objects.select_related('uploaded_by')),
+        'temoin_set',
+        Prefetch('contentieux__documents', queryset=Document.objects.select_related('uploaded_by')),
+        'contentieux__juridiction_steps_set',
+        'contentieux__actions',
     ).order_by('-created_at')
 
     serializer_class = DossierATMPSerializer
     permission_classes = [IsAuthenticated, IsSuperuserOrEmployee]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, DossierSearchFilter]
+    filterset_class = DossierFilter
+    export_definition = DOSSIER_EXPORT
+    export_roles = (UserRole.RH, UserRole.DIRECTION)
 
     def get_serializer_class(self):
         if self.action == 'create':
             return DossierCreateSerializer
+        if self.action == 'list':
+            return DossierListSerializer
         return DossierATMPSerializer
 
+    def get_base_queryset(self):
+        if self.action == 'list':
+            # Flat rows + counts; nested sections only when asked for with ?expand=
+            return self.get_serializer().setup_queryset(DossierATMP.objects.order_by('-created_at'))
+        return super().get_queryset()
+
     def get_queryset(self):
         user = self.request.user
+        queryset = self.get_base_queryset()
         if user.is_superuser:
-            return super().get_queryset()
+            return queryset
         elif user.role == UserRole.EMPLOYEE:
-            return super().get_queryset().filter(created_by=user)
+            return queryset.filter(created_by=user)
         elif user.role == UserRole.SAFETY_MANAGER:
-            return super().get_queryset().filter(safety_manager=user)
+            return queryset.filter(safety_manager=user)
         # Add other roles here if they should see specific subsets
         elif user.role == UserRole.JURISTE:
             # Jurists might see dossiers linked to contentieux they manage or all
-            # Example: return super().get_queryset().filter(contentieux__jurist=user)
+            # Example: return queryset.filter(contentieux__jurist=user)
             # For now, let's assume they see all relevant for their role context
-            return super().get_queryset() # Or a more specific filter if needed
+            return queryset # Or a more specific filter if needed
         elif user.role == UserRole.RH:
             # RH might see all dossiers, or only those related to employees they manage
-            return super().get_queryset()
+            return queryset
         elif user.role == UserRole.QSE:
             # QSE might see all dossiers related to audits
-            return super().get_queryset()
+            return queryset
         elif user.role == UserRole.DIRECTION:
             # Direction might see all dossiers
-            return super().get_queryset()
+            return queryset
         return DossierATMP.objects.none()
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[NDJSONParser, CSVParser, MultiPartParser])
+    def bulk(self, request):
+        """
+        Bulk import. The body is NDJSON (application/x-ndjson) or CSV
+        (text/csv), or a multipart `file` upload of either. ?dry_run=true
+        only validates. Responds with the per-row report of importers.import_dossiers.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            import_format = guess_format(upload.name, upload.content_type or '')
+            lines = codecs.getreader('utf-8-sig')(upload)
+        else:
+            import_format = request.data.get('format')
+            lines = request.data.get('lines')
+        if import_format is None or lines is None:
+            return Response(
+                {'detail': "Send NDJSON (application/x-ndjson) or CSV (text/csv), as the body or as a 'file' upload."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        report = import_dossiers(read_rows(lines, import_format), request.user, dry_run=dry_run)
+        if report['created'] and not dry_run:
+            response_status = status.HTTP_201_CREATED
+        elif report['failed']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({'dry_run': dry_run, **report}, status=response_status)
+
 
 # --- Contentieux Views ---
-class ContentieuxViewSet(viewsets.ModelViewSet):
-    queryset = Contentieux.objects.all().order_by('-created_at')
+class ContentieuxViewSet(ExportViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = Contentieux.objects.prefetch_related(
+        Prefetch('documents', queryset=Document.objects.select_related('uploaded_by')),
+        'juridiction_steps_set',
+        'actions',
+    ).order_by('-created_at')
     serializer_class = ContentieuxSerializer
     permission_classes = [IsAuthenticated, IsJurist] # Ensure appropriate permissions
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ContentieuxFilter
+    export_definition = CONTENTIEUX_EXPORT
+    export_roles = (UserRole.JURISTE,)
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser or user.role == UserRole.JURISTE:
             # Jurists can see all contentieux or contentieux they are assigned to (if such a field exists)
+            if self.action == 'steps':
+                # Only the timeline: one query for the contentieux, one for its steps
+                return Contentieux.objects.only('id').prefetch_related('juridiction_steps_set')
             return super().get_queryset()
         return Contentieux.objects.none()
 
@@ -187,12 +295,26 @@ class ContentieuxViewSet(viewsets.ModelViewSet):
         # and its status could be set here.
         serializer.save(status=ContentieuxStatus.DRAFT)
 
+    @action(detail=True, methods=['get'], url_path='steps')
+    def steps(self, request, pk=None):
+        """The juridiction timeline of the contentieux, oldest step first."""
+        contentieux = self.get_object()
+        serializer = JuridictionStepSerializer(
+            contentieux.juridiction_steps_set.all(), many=True, context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
 
 # --- Audit Views ---
-class AuditViewSet(viewsets.ModelViewSet):
-    queryset = Audit.objects.all().order_by('-created_at')
+class AuditViewSet(ExportViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = Audit.objects.select_related('auditor').order_by('-created_at')
     serializer_class = AuditSerializer
     permission_classes = [IsAuthenticated, IsSafetyManager] # Ensure appropriate permissions
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AuditFilter
+    export_definition = AUDIT_EXPORT
+    export_roles = (UserRole.SAFETY_MANAGER,)
 
     def get_queryset(self):
         user = self.request.user
@@ -203,19 +325,67 @@ class AuditViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='by-dossier/(?P<dossier_id>[^/.]+)')
     def by_dossier(self, request, dossier_id=None):
-        audit = get_object_or_404(Audit, dossier_atmp_id=dossier_id)
+        audit = get_object_or_404(self.get_queryset(), dossier_atmp_id=dossier_id)
         serializer = self.get_serializer(audit)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='finalize-batch')
+    def finalize_batch(self, request):
+        """
+        Finalizes several audits at once (e.g. after a committee meeting).
+        The body is a list of {audit_id, decision, comments}; the response
+        gives one outcome per entry, in order. Valid entries are applied in
+        a single transaction (see AuditFinalizationService.finalize_batch).
+        """
+        items = request.data
+        max_items = getattr(settings, 'AUDIT_FINALIZE_BATCH_MAX', 500)
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"message": "Expected a non-empty list of {audit_id, decision, comments}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > max_items:
+            return Response(
+                {"message": f"At most {max_items} audits per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results, valid = [], []
+        for item in items:
+            serializer = AuditFinalizeItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                results.append(None)
+            else:
+                results.append({
+                    'audit_id': item.get('audit_id') if isinstance(item, dict) else None,
+                    'outcome': 'invalid',
+                    'errors': serializer.errors,
+                })
+
+        applied = iter(AuditFinalizationService.finalize_batch(self.get_queryset(), valid) if valid else [])
+        results = [result or next(applied) for result in results]
+        finalized = sum(result['outcome'] == 'finalized' for result in results)
+        return Response(
+            {'finalized': finalized, 'failed': len(results) - finalized, 'results': results},
+            status=status.HTTP_200_OK
+        )
+
     @action(detail=True, methods=['post'])
     def finalize(self, request, pk=None):
+        """
+        Completes the audit and closes the dossier or opens its contentieux,
+        atomically (see AuditFinalizationService). Send an Idempotency-Key
+        header to make retries safe: a repeated key returns the first
+        response, with Idempotent-Replayed: true.
+        """
         audit = self.get_object()
 
         serializer = AuditUpdateSerializer(audit, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
 
         decision_value = serializer.validated_data.get('decision')
-        comments = serializer.validated_data.get('comments', audit.comments)
+        comments = serializer.validated_data.get('comments')
 
         if not decision_value:
             return Response(
@@ -231,47 +401,37 @@ class AuditViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if audit.status == AuditStatus.COMPLETED:
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
             return Response(
-                {"message": "Audit already completed"},
+                {"message": "Idempotency-Key must be 1 to 255 characters"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        audit.status = AuditStatus.COMPLETED.value
-        audit.decision = decision.value
-        audit.comments = comments
-        audit.completed_at = timezone.now()
-        audit.save()
-
-        dossier = audit.dossier_atmp
-
-        new_contentieux_data = None
-        if decision == AuditDecision.CONTEST:
-            dossier.status = DossierStatus.CONTESTATION_RECOMMANDEE.value
-            new_contentieux = ContentieuxService.create_from_audit(audit, dossier)
-            dossier.status = DossierStatus.TRANSFORME_EN_CONTENTIEUX.value
-            new_contentieux_data = ContentieuxSerializer(new_contentieux).data
-        else:
-            dossier.status = DossierStatus.CLOTURE_SANS_SUITE.value
-
-        dossier.save()
-
-        response_data = {
-            "message": "Audit finalized successfully",
-            "audit": AuditSerializer(audit).data
-        }
-        if new_contentieux_data:
-            response_data["message"] = "Audit finalized and litigation created"
-            response_data["contentieux"] = new_contentieux_data
+        try:
+            status_code, response_data, replayed = AuditFinalizationService.finalize(
+                audit.pk, decision, comments, request.user, idempotency_key=idempotency_key,
+            )
+        except IdempotencyKeyMismatch:
+            return Response(
+                {"message": "Idempotency-Key already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        response = Response(response_data, status=status_code)
+        if idempotency_key is not None:
+            response['Idempotent-Replayed'] = 'true' if replayed else 'false'
+        return response
 
 
 # --- Document Views ---
-class DocumentViewSet(viewsets.ModelViewSet):
-    queryset = Document.objects.all().order_by('-created_at')
+class DocumentViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    # The extracted text is only searched, never sent: not loaded
+    queryset = Document.objects.select_related('uploaded_by').defer('text_content').order_by('-created_at')
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated] # Ensure appropriate permissions
+    pagination_class = KeysetPagination
+    filter_backends = [DocumentSearchFilter]
     parser_classes = [MultiPartParser, FormParser]
 
     def get_queryset(self):
@@ -287,35 +447,48 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # uploaded_by is set in the serializer's create method
         serializer.save()
 
+    def initialize_request(self, request, *args, **kwargs):
+        drf_request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'batch':
+            # Every part of a batch goes to a temporary file as it arrives, none is held in memory
+            request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return drf_request
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Several files attached to a dossier (and its contentieux) in one
+        request: multipart `dossier`, `files` (repeated), `document_type`,
+        `description`. Allowed to the dossier's creator and safety manager.
+        """
+        serializer = DocumentBatchUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dossier = serializer.validated_data['dossier']
+        user = request.user
+        if not (user.is_superuser or user.id in (dossier.created_by_id, dossier.safety_manager_id)):
+            return Response(
+                {"detail": "You do not have permission to upload documents for this incident."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        documents = attach_documents(
+            dossier, user, serializer.validated_data['files'],
+            document_type=serializer.validated_data.get('document_type'),
+            description=serializer.validated_data.get('description'),
+        )
+        return Response(self.get_serializer(documents, many=True).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
+        """
+        The file of the document. The permission check stays here; the
+        bytes are sent by the front proxy when DOWNLOAD_OFFLOAD_HEADER is
+        set, else streamed with Range and conditional GET support.
+        """
         document = self.get_object()
         try:
-            if not document.file or not document.file.name:
-                return Response({"message": "File not found for this document."}, status=status.HTTP_404_NOT_FOUND)
-
-            file_path = document.file.path
-            if not os.path.exists(file_path):
-                logger.error(f"File not found on disk for Document ID {document.pk} at path {file_path}")
-                return Response({"message": "File not found on server storage."}, status=status.HTTP_404_NOT_FOUND)
-
-            mime_type, _ = mimetypes.guess_type(file_path)
-            if not mime_type:
-                mime_type = document.mime_type or 'application/octet-stream'
-
-            response = FileResponse(
-                document.file.open('rb'),
-                as_attachment=True,
-                filename=document.original_name
-            )
-            response['Content-Type'] = mime_type
-            return response
-        except FileNotFoundError:
-            logger.error(f"FileNotFoundError for Document ID {document.pk} at path {document.file.path}")
-            return Response(
-                {"message": "File not found on server"},
-                status=status.HTTP_404_NOT_FOUND
-            )
+            return serve_document(request, document)
+        except Http404 as e:
+            return Response({"message": str(e)}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"Error downloading document {document.pk}: {e}", exc_info=True)
             return Response(
@@ -324,7 +497,94 @@ class DocumentViewSet(viewsets.ModelViewSet):
             )
 
 
+    # --- Resumable uploads: POST to start, GET/HEAD for the offset, PATCH chunks, DELETE to abort ---
+
+    def upload_headers(self, response, session):
+        response['Tus-Resumable'] = TUS_VERSION
+        response['Upload-Offset'] = session.offset
+        response['Upload-Length'] = session.length
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    @action(
+        detail=False, methods=['post'], url_path='uploads', url_name='upload-sessions',
+        parser_classes=[JSONParser, FormParser, MultiPartParser],
+    )
+    def uploads(self, request):
+        """
+        Starts a resumable upload, declared by a JSON body (filename, length,
+        document_type, ...) or by the tus Upload-Length and Upload-Metadata
+        headers. The Location header is where the chunks go.
+        """
+        data = tus_creation_data(request.headers)
+        data.update(request.data.items())
+        serializer = UploadSessionSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        session = create_session(request.user, **serializer.validated_data)
+        response = Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        response['Location'] = reverse(
+            'praevia_app:document-upload-session', kwargs={'upload_id': session.pk}, request=request
+        )
+        return self.upload_headers(response, session)
+
+    @action(
+        detail=False, methods=['get', 'patch', 'delete'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})',
+        url_name='upload-session',
+    )
+    def upload_session(self, request, upload_id=None):
+        """
+        PATCH (Content-Type: application/offset+octet-stream) appends the body
+        at Upload-Offset, which must be the current offset. The chunk that
+        completes the file creates the Document (201, its representation);
+        the others get a 204 with the new Upload-Offset.
+        """
+        session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+        if request.method == 'DELETE':
+            abort(session)
+            return self.upload_headers(Response(status=status.HTTP_204_NO_CONTENT), session)
+        if request.method != 'PATCH':
+            return self.upload_headers(Response(UploadSessionSerializer(session).data), session)
+
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {"message": "Chunks are sent as application/offset+octet-stream"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            size = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response({"message": "Upload-Offset and Content-Length are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            append_chunk(session, offset, request.stream, size)
+        except UploadConflict as e:
+            return self.upload_headers(Response({"message": str(e)}, status=status.HTTP_409_CONFLICT), session)
+        except UploadTooLarge as e:
+            return self.upload_headers(
+                Response({"message": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE), session
+            )
+        except UnreadablePostError:
+            # The client went away: what arrived is kept, it resumes from the stored offset
+            logger.info(f"Upload {session.pk} interrupted at {session.offset}")
+            return self.upload_headers(Response(status=status.HTTP_400_BAD_REQUEST), session)
+
+        if session.offset < session.length:
+            return self.upload_headers(Response(status=status.HTTP_204_NO_CONTENT), session)
+        try:
+            document = complete(session)
+        except (UploadSession.DoesNotExist, FileNotFoundError):
+            return Response({"message": "This upload was already completed"}, status=status.HTTP_409_CONFLICT)
+        response = Response(
+            DocumentSerializer(document, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED
+        )
+        response['Location'] = reverse('praevia_app:document-detail', args=[document.pk], request=request)
+        return self.upload_headers(response, session)
+
+
 # --- Dashboard API Views (function-based for specific dashboard data) ---
+# Payloads are identical for every user of a role, so they are served from
+# the versioned dashboard cache (see dashboard.cached_dashboard).
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsJurist])
@@ -332,18 +592,22 @@ def get_jurist_dashboard_data(request):
     """
     GET /atmp/api/dashboard/juridique/
     """
-    total_contentieux = Contentieux.objects.count()
-    pending_contentieux = Contentieux.objects.filter(status=ContentieuxStatus.EN_COURS).count()
-    contentieux_by_status = Contentieux.objects.values('status').annotate(count=Count('id')).order_by('status')
-    recent_contentieux = Contentieux.objects.order_by('-created_at')[:5].values('id', 'reference', 'status', 'created_at')
-
-    return Response(
-        {
+    def build():
+        stats = DashboardStats()
+        total_contentieux = stats.contentieux['total']
+        pending_contentieux = stats.contentieux['en_cours']
+        contentieux_by_status = stats.breakdown(Contentieux, 'status')
+        recent_contentieux = Contentieux.objects.order_by('-created_at')[:5].values('id', 'reference', 'status', 'created_at')
+
+        return {
             "totalContentieux": total_contentieux,
             "pendingContentieux": pending_contentieux,
             "contentieuxByStatus": list(contentieux_by_status),
             "recentContentieux": list(recent_contentieux),
-        },
+        }
+
+    return Response(
+        cached_dashboard('api:juridique', (Contentieux,), build),
         status=status.HTTP_200_OK
     )
 
@@ -354,19 +618,23 @@ def get_rh_dashboard_data(request):
     """
     GET /atmp/api/dashboard/rh/
     """
-    total_dossiers = DossierATMP.objects.count()
-    incidents_a_analyser = DossierATMP.objects.filter(status=DossierStatus.A_ANALYSER).count()
-    incidents_by_status = DossierATMP.objects.values('status').annotate(count=Count('id')).order_by('status')
+    def build():
+        stats = DashboardStats()
+        total_dossiers = stats.dossiers['total']
+        incidents_a_analyser = stats.dossiers['a_analyser']
+        incidents_by_status = stats.breakdown(DossierATMP, 'status')
 
-    incidents_created_by_employee = DossierATMP.objects.filter(created_by__role=UserRole.EMPLOYEE).count()
+        incidents_created_by_employee = stats.dossiers['created_by_employee']
 
-    return Response(
-        {
+        return {
             "totalDossiers": total_dossiers,
             "incidentsAAnalyser": incidents_a_analyser,
             "incidentsByStatus": list(incidents_by_status),
             "incidentsCreatedByEmployee": incidents_created_by_employee,
-        },
+        }
+
+    return Response(
+        cached_dashboard('api:rh', (DossierATMP,), build),
         status=status.HTTP_200_OK
     )
 
@@ -377,18 +645,22 @@ def get_qse_dashboard_data(request):
     """
     GET /atmp/api/dashboard/qse/
     """
-    total_dossiers = DossierATMP.objects.count()
-    audits_completed = Audit.objects.filter(status=AuditStatus.COMPLETED).count()
-    audits_in_progress = Audit.objects.filter(status=AuditStatus.IN_PROGRESS).count()
-    dossiers_contested_recommended = DossierATMP.objects.filter(audit__decision=AuditDecision.CONTEST).count()
-
-    return Response(
-        {
+    def build():
+        stats = DashboardStats()
+        total_dossiers = stats.dossiers['total']
+        audits_completed = stats.audits['completed']
+        audits_in_progress = stats.audits['in_progress']
+        dossiers_contested_recommended = stats.audits['contest']
+
+        return {
             "totalDossiers": total_dossiers,
             "auditsCompleted": audits_completed,
             "auditsInProgress": audits_in_progress,
             "dossiersContestedRecommended": dossiers_contested_recommended,
-        },
+        }
+
+    return Response(
+        cached_dashboard('api:qse', (DossierATMP, Audit), build),
         status=status.HTTP_200_OK
     )
 
@@ -399,22 +671,21 @@ def get_direction_dashboard_data(request):
     """
     GET /atmp/api/dashboard/direction/
     """
-    try:
-        open_dossiers = DossierATMP.objects.exclude(
-            status=DossierStatus.CLOTURE_SANS_SUITE.value
-        ).count()
-        total_dossiers = DossierATMP.objects.count()
+    def build():
+        stats = DashboardStats()
+        open_dossiers = stats.dossiers['open']
+        total_dossiers = stats.dossiers['total']
         estimated_risk_per_case = 5000
         total_risk_value = open_dossiers * estimated_risk_per_case
 
-        contentieux_counts = Contentieux.objects.values('status').annotate(count=Count('id'))
-        audit_decisions = Audit.objects.values('decision').annotate(count=Count('id'))
+        contentieux_counts = stats.breakdown(Contentieux, 'status')
+        audit_decisions = stats.breakdown(Audit, 'decision')
 
         # Example of how you might calculate case type distribution, needs actual data points in DossierATMP
         # case_type_distribution = DossierATMP.objects.values('accident__type_of_accident').annotate(count=Count('id'))
         case_type_distribution = [] # Placeholder if not implemented yet
 
-        return Response({
+        return {
             "stats": {
                 "openDossiers": open_dossiers,
                 "totalDossiers": total_dossiers,
@@ -423,7 +694,13 @@ def get_direction_dashboard_data(request):
                 "auditDecisions": list(audit_decisions),
             },
             "caseTypeDistribution": case_type_distribution,
-        }, status=status.HTTP_200_OK)
+        }
+
+    try:
+        return Response(
+            cached_dashboard('api:direction', (DossierATMP, Contentieux, Audit), build),
+            status=status.HTTP_200_OK
+        )
 
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des données du tableau de bord Direction: {e}", exc_info=True)
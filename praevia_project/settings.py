@@ -93,6 +93,7 @@ INSTALLED_APPS = [
 
     # 2) third-party
     'rest_framework',
+    'django_filters',
     'widget_tweaks',
 
     # 3) Two‑factor
@@ -112,6 +113,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    # First, so that session/auth queries are measured too
+    'praevia_app.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -124,6 +127,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL metrics (Server-Timing header + 'praevia_app.queries' log line)
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', str(DEBUG)).lower() == 'true'
+QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD = int(os.getenv('QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD', '5'))
+
 ROOT_URLCONF = 'praevia_project.urls'
 
 TEMPLATES = [
@@ -158,6 +165,11 @@ DATABASES = {
         ssl_require=os.getenv('DB_SSL_REQUIRE', 'False').lower() == 'true'
     )
 }
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    # SQLite ignores SELECT ... FOR UPDATE: take the write lock when the
+    # transaction starts, so concurrent atomic() blocks (e.g. two audit
+    # finalizations) wait for each other instead of failing with "database is locked"
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
 
 ## Database
 ## https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -170,6 +182,26 @@ DATABASES = {
 #}
 
 
+# -----------------------------------------------------------------------------
+# Cache
+# -----------------------------------------------------------------------------
+# Local memory is per process: with several gunicorn workers, use a shared
+# backend (e.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with CACHE_LOCATION=/var/tmp/praevia_cache, or the db backend after
+# `createcachetable`) so dashboard invalidations reach every worker.
+# docker-compose.prod.yml sets the db backend for every container.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'praevia'),
+    }
+}
+
+# Role dashboards (praevia_app.dashboard.cached_dashboard)
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))  # seconds
+
+
 # -----------------------------------------------------------------------------
 # Django REST framework
 # -----------------------------------------------------------------------------
@@ -218,7 +250,7 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media/'
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media/')
 
 # -----------------------------------------------------------------------------
 # Logging
@@ -274,6 +306,43 @@ if not DEBUG:
 
 else:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Outgoing emails are queued in OutboundEmail and sent by `manage.py send_outbox`
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))          # emails per SMTP connection
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BACKOFF = int(os.getenv('OUTBOX_RETRY_BACKOFF', '60'))    # seconds, doubled on each retry
+OUTBOX_RETRY_MAX_DELAY = int(os.getenv('OUTBOX_RETRY_MAX_DELAY', '3600'))
+OUTBOX_LEASE_SECONDS = 600  # a claimed batch not sent within this delay is picked up again
+
+# Dossier imports (/api/dossiers/bulk/, import_dossiers): rows per transaction and summary email
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+# Streaming exports (/api/<resource>/export/): rows fetched per database round trip
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+# Idempotency-Key header (audit finalization): seconds a stored response is replayed
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))
+# /api/audits/finalize-batch/: most audits accepted in one request (one transaction)
+AUDIT_FINALIZE_BATCH_MAX = int(os.getenv('AUDIT_FINALIZE_BATCH_MAX', '500'))
+# Document downloads: header handing the transfer to the front proxy ('X-Accel-Redirect' for nginx,
+# 'X-Sendfile' for Apache/lighttpd); empty to stream from Django (Range, ETag, sendfile)
+DOWNLOAD_OFFLOAD_HEADER = os.getenv('DOWNLOAD_OFFLOAD_HEADER', '')
+# Internal nginx location aliasing MEDIA_ROOT, used with X-Accel-Redirect
+DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+# Content-addressed document blobs (gc_document_blobs): seconds an unreferenced blob is kept
+DOCUMENT_BLOB_GC_GRACE = int(os.getenv('DOCUMENT_BLOB_GC_GRACE', str(24 * 3600)))
+# Resumable uploads (/api/documents/uploads/): largest file, and seconds an upload may go without a chunk
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.getenv('RESUMABLE_UPLOAD_MAX_SIZE', str(2 * 1024 ** 3)))
+RESUMABLE_UPLOAD_EXPIRY = int(os.getenv('RESUMABLE_UPLOAD_EXPIRY', str(24 * 3600)))
+# Multi-file uploads to a dossier (form and /api/documents/batch/): files per request, bytes per file
+DOCUMENT_BATCH_UPLOAD_MAX_FILES = int(os.getenv('DOCUMENT_BATCH_UPLOAD_MAX_FILES', '50'))
+DOCUMENT_BATCH_UPLOAD_MAX_FILE_SIZE = int(os.getenv('DOCUMENT_BATCH_UPLOAD_MAX_FILE_SIZE', str(10 * 1024 * 1024)))
+# Document analysis (MIME type, pages, thumbnail, text) by `manage.py process_documents`
+DOCUMENT_PROCESSING_WORKERS = int(os.getenv('DOCUMENT_PROCESSING_WORKERS', '2'))        # processes, 0 = in the command
+DOCUMENT_PROCESSING_BATCH_SIZE = int(os.getenv('DOCUMENT_PROCESSING_BATCH_SIZE', '20'))
+DOCUMENT_PROCESSING_MAX_ATTEMPTS = int(os.getenv('DOCUMENT_PROCESSING_MAX_ATTEMPTS', '3'))
+DOCUMENT_PROCESSING_RETRY_BACKOFF = int(os.getenv('DOCUMENT_PROCESSING_RETRY_BACKOFF', '60'))  # seconds, doubled on each retry
+DOCUMENT_PROCESSING_LEASE_SECONDS = 900  # a claimed batch not saved within this delay is picked up again
+DOCUMENT_THUMBNAIL_SIZE = int(os.getenv('DOCUMENT_THUMBNAIL_SIZE', '256'))              # pixels, longest side
+DOCUMENT_TEXT_MAX_CHARS = int(os.getenv('DOCUMENT_TEXT_MAX_CHARS', '200000'))            # extracted text kept for search
     
 
 #LOGIN_URL = '/accounts/login/'